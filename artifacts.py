@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+import numpy as np
+from typing import Dict
+
+# Bump whenever a change alters what an output looks like, so every output is redone.
+CODE_VERSION = 3
+INDEX_NAME = "artifacts.json"
+
+
+def _update(digest, part):
+    """Feed one part to the digest: numeric arrays and lists as float64 bytes, the rest as JSON."""
+    if isinstance(part, (np.ndarray, list, tuple)):
+        array = np.asarray(part) if not isinstance(part, np.ndarray) else part
+        if array.dtype.kind in "biuf":
+            digest.update(f"a{array.shape}".encode())
+            digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+            return
+    digest.update(b"j" + json.dumps(part, sort_keys=True, default=str).encode())
+
+
+def artifact_key(*parts) -> str:
+    """sha256 of CODE_VERSION and every part (series, limits entries, settings...)."""
+    digest = hashlib.sha256(f"v{CODE_VERSION}".encode())
+    for part in parts:
+        _update(digest, part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ArtifactIndex:
+    """Key of every output in a directory, as last written.
+
+    An output is current when its file exists and was written from inputs with the same
+    artifact_key; everything else has to be redone. The index is artifacts.json in the
+    directory, keyed by file name.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, INDEX_NAME)
+        self.keys: Dict[str, str] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.keys = json.load(f)
+
+    def is_current(self, file_path: str, key: str) -> bool:
+        return os.path.exists(file_path) and self.keys.get(os.path.basename(file_path)) == key
+
+    def update(self, file_path: str, key: str):
+        self.keys[os.path.basename(file_path)] = key
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.keys, f, indent=4, sort_keys=True)
@@ -2,13 +2,17 @@ import json
 import os
 import matplotlib.pyplot as plt
 import numpy as np
-import datetime
 import matplotlib.dates as mdates
 import util
+import cache
+import schema
+import diagnostics
+import artifacts
+import spc
+import timeseries
 
-def read_json_file(file_paths, impedance):
-    #impedance = "25"
-	# Define per-channel parameters (excluding uniformity)
+def _baseline_collections(measurements, rows, impedance):
+    # Define per-channel parameters (excluding uniformity)
     channel_params = [
         "baseline", "noise_rms_mv", "gain", "eni", 
         "peaking_time", "max_non_linearity", "i2c_margin_list"
@@ -21,29 +25,16 @@ def read_json_file(file_paths, impedance):
         "SUM x3", "SUM x1",
     ]
 
-    channel_values = {channel: {param: [] for param in channel_params} for channel in channels}
-    power_ldo_values = {}
-    gain_ratio_values = {0: [], 1: [], 2: [], 3: []}
-    uniformity_hg = {"gain_uniformity": [], "peaking_time_uniformity": [], "baseline_uniformity": []}
-    uniformity_lg = {"gain_uniformity": [], "peaking_time_uniformity": [], "baseline_uniformity": []}
+    all_channel_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values, _ = cache.collections_from_cache(measurements, rows, impedance, drop_missing=False)
+    channel_values = {channel: {param: all_channel_values[channel][param] for param in channel_params} for channel in channels}
+    return channel_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values
+
+def read_json_file(file_paths, impedance):
+    extractor = schema.get_extractor()
+    rows = []
     hour_values = []
     temp_values = []
 
-    def process_results(data, key_suffix, params):
-        if key_suffix in data:
-            results = data[key_suffix]
-            channel_list = results.get("channel_list", results.get("i2c_frequency_list", None))
-            if not channel_list:
-                print(f"Warning: Neither 'channel_list' nor 'i2c_frequency_list' found in {key_suffix}")
-                return
-            for idx, channel in enumerate(channel_list):
-                for param in params:
-                    if param in results:
-                        value = results[param]
-                        val = value[idx] if isinstance(value, list) else value
-                        if channel in channel_values and param in channel_values[channel]:
-                            channel_values[channel][param].append(val)
-
     i = 0
     for file_path in file_paths:
         with open(file_path, 'r') as f:
@@ -51,71 +42,98 @@ def read_json_file(file_paths, impedance):
             if "test_time" in data:
                 raw_time = data["test_time"]
             else:
-                print("Key 'test_time' not found in data")
+                diagnostics.record("missing_test_time", "", file_path)
                 continue
             if "board_temp" in data:
                 temps = data["board_temp"].values()  # dict_values([24.10938, 23.50781])
                 temp = sum(temps) / len(temps)
             else:
-                print("Key 'board_temp' not found in data")
+                diagnostics.record("missing_board_temp", "", file_path)
                 continue
-            process_results(data, f"results_noise_{impedance}_all_ch_HG", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-            process_results(data, f"results_noise_{impedance}_all_ch_LG", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-            process_results(data, f"results_noise_{impedance}_sum_x3", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-            process_results(data, f"results_noise_{impedance}_sum_x1", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-            process_results(data, f"results_linearity_{impedance}_sum_x3", ["max_non_linearity"])
-            process_results(data, f"results_linearity_{impedance}_sum_x1", ["max_non_linearity"])
-            process_results(data, f"results_linearity_{impedance}_all_ch_HG", ["max_non_linearity"])
-            process_results(data, f"results_linearity_{impedance}_all_ch_LG", ["max_non_linearity"])
-            results = data[f"results_noise_{impedance}_all_ch_HG"]
-            for key in uniformity_hg:
-                uniformity_hg[key].append(results.get(key))
-            results = data[f"results_noise_{impedance}_all_ch_LG"]
-            for key in uniformity_lg:
-                uniformity_lg[key].append(results.get(key))
-            gain_ratio_key = f"gain_ratio_{impedance}"
-            if gain_ratio_key in data:
-                results = data[gain_ratio_key]
-                if isinstance(results, list):
-                    for idx, value in enumerate(results):
-                        if idx in gain_ratio_values:
-                            gain_ratio_values[idx].append(value)
-                else:
-                    print(f"Warning: Expected a list for {gain_ratio_key}, but found {type(results)}")
-            if "power_ldo" in data:
-                for ldo in data["power_ldo"]:
-                    ldo_name = ldo.get("name")
-                    if not ldo_name:
-                        continue
-                    if ldo_name not in power_ldo_values:
-                        power_ldo_values[ldo_name] = {}
-                    for key, value in ldo.items():
-                        if key == "name":
-                            continue
-                        if key not in power_ldo_values[ldo_name]:
-                            power_ldo_values[ldo_name][key] = []
-                        power_ldo_values[ldo_name][key].append(value)
+            rows.append(extractor.extract(data, file_path))
 
-            cleaned = raw_time.replace('_T_', ' ').replace('_', '-')
-            # Parse datetime in the format "dd-mm-yy HH-MM-SS"
-            dt = datetime.datetime.strptime(cleaned, "%d-%m-%y %H-%M-%S")
-            hour_values.append(dt)
+            hour_values.append(cache.parse_test_time(raw_time))
             temp_values.append(i)
             i += 1
 
+    measurements = cache.measurements_from_rows(rows)
+    channel_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values = _baseline_collections(measurements, np.arange(len(rows)), impedance)
     return channel_values, hour_values, temp_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values
 
-def plot_baseline_timeplot(channel_values, hour_values, y, impedance, label, output_directory):
+def read_cache(measurements, label, impedance, start=None, end=None, last=None):
+    """Same collections as read_json_file, taken from a cache written by cache.update_cache.
+
+    Rows are in test_time order (see timeseries.TimeSeries) and hour_values is a
+    datetime64 array. start and end (datetimes) restrict them to a date range, last (a
+    datetime.timedelta) to the span before the newest run, e.g. timedelta(days=7).
+    """
+    rows = cache.select_rows(measurements, label, dedup=False)
+    rows = rows[~np.isnan(measurements["meta"]["board_temp"][rows])]
+    series = timeseries.TimeSeries.from_cache(measurements, rows)
+    rows = series.last(last) if last is not None else series.window(start, end)
+    channel_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values = _baseline_collections(measurements, rows, impedance)
+    hour_values = np.asarray(measurements["meta"]["test_time"])[rows].astype("datetime64[us]")
+    temp_values = list(range(len(rows)))
+    return channel_values, hour_values, temp_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values
+
+def _plot_control_bands(ax, x, value, name, shown=None):
+    """Overlay the EWMA with its control band, the rolling mean, the 3 sigma lines and the alerts of spc.chart_series.
+
+    The chart runs over every value; the band and lines are drawn at the shown indices only (all by default).
+    """
+    chart = spc.chart_series(value, name)
+    if chart["target"] is None:
+        return
+    shown = np.arange(len(value)) if shown is None else shown
+    xs = x[shown]
+    ax.fill_between(xs, chart["low"][shown], chart["high"][shown], color='C1', alpha=0.2, label="EWMA control band")
+    ax.plot(xs, chart["ewma"][shown], color='C1', linewidth=1, label="EWMA")
+    ax.plot(xs, chart["rolling"][shown], color='C2', linewidth=1, label=f"Rolling mean ({spc.ROLLING_WINDOW})")
+    for offset in (-spc.SHEWHART_L, spc.SHEWHART_L):
+        ax.axhline(chart["target"] + offset * chart["sigma"], color='gray', linestyle='--', linewidth=1)
+    ax.axhline(chart["target"], color='gray', linewidth=1, label="Target")
+    flagged = sorted({alert.index for alert in chart["alerts"]})
+    if flagged:
+        ax.plot(x[flagged], value[flagged], 'x', color='red', markersize=6, label="SPC alert")
+    ax.legend(fontsize=8)
+
+def plot_baseline_timeplot(channel_values, hour_values, y, impedance, label, output_directory, spc_bands=False,
+                           max_points=timeseries.MAX_POINTS, decimation="minmax"):
+    """One time plot per (channel, parameter); plots whose series did not change since
+    they were written (see artifacts.ArtifactIndex) are left as they are. With spc_bands
+    the EWMA control band, rolling mean and alerts of spc.chart_series are drawn over the values.
+    Series longer than max_points are drawn decimated to that many points with
+    timeseries.decimate ("minmax" or "lttb"), so drawing time does not grow with the archive."""
+    index = artifacts.ArtifactIndex(output_directory)
+    # Hashed and decimated as numbers once, not per plot.
+    x_numbers = timeseries.as_numbers(hour_values)
+    x_values = np.asarray(hour_values)
     for channel, values in channel_values.items():
         if not isinstance(values, dict):
             values = {channel: values}
             channel = None
         for param, value in values.items():
             if value:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.plot(hour_values, value, 'o-',markersize=2, linewidth=1)  # 'o' for dots
                 if len(str(param)) < 2:
                     param = "gain_ratio" + str(param)
+                filename = f"{label.lower()}_{param}_{impedance}_histogram.png" if channel is None \
+                    else f"{channel}_{param}_{impedance}_histogram.png"
+                decimated = max_points is not None and len(value) > max_points
+                key = artifacts.artifact_key("timeplot", y, label, channel, param, value, x_numbers,
+                                             *((["spc", spc.WARMUP, spc.EWMA_LAMBDA, spc.EWMA_L, spc.CUSUM_K, spc.CUSUM_H,
+                                                 spc.SHEWHART_L, spc.ROLLING_WINDOW],) if spc_bands else ()),
+                                             *((["decimate", max_points, decimation],) if decimated else ()))
+                if index.is_current(os.path.join(output_directory, filename), key):
+                    continue
+                fig, ax = plt.subplots(figsize=(10, 6))
+                shown = timeseries.decimate(x_numbers, value, max_points, decimation) if decimated else None
+                if shown is None:
+                    ax.plot(hour_values, value, 'o-',markersize=2, linewidth=1)  # 'o' for dots
+                else:
+                    ax.plot(x_values[shown], np.asarray(value, dtype=float)[shown], 'o-', markersize=2, linewidth=1)
+                if spc_bands:
+                    _plot_control_bands(ax, x_values, np.asarray(value, dtype=float), channel and f"{channel}_{param}_{impedance}" or f"{label}_{param}_{impedance}",
+                                        shown)
                 ax.set_ylabel(f"{param}")
                 if y:
                     ax.set_xlabel("Time", fontsize=12)
@@ -134,13 +152,13 @@ def plot_baseline_timeplot(channel_values, hour_values, y, impedance, label, out
                         ax.set_title(f"{param} Time Plot - {channel}")
                 ax.grid(True)
 
-                filename = f"{label.lower()}_{param}_{impedance}_histogram.png" if channel is None \
-                    else f"{channel}_{param}_{impedance}_histogram.png"
                 if y:
                     plt.savefig(os.path.join(output_directory, filename), dpi=300)
                 else:
                     plt.savefig(os.path.join(output_directory, filename), dpi=300)
                 plt.close(fig)  # Close this figure after saving
+                index.update(os.path.join(output_directory, filename), key)
+    index.save()
 
 if __name__ == '__main__':
     # Example usage
@@ -165,4 +183,5 @@ if __name__ == '__main__':
     plot_baseline_timeplot(uniformity_hg, temp_values, False, impedance, "HG", output_directory)
     plot_baseline_timeplot(uniformity_lg, temp_values, False, impedance, "LG", output_directory)
     plot_baseline_timeplot(gain_ratio_values, temp_values, False, impedance, "", output_directory)
+    diagnostics.report()
     
\ No newline at end of file
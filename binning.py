@@ -0,0 +1,95 @@
+import numpy as np
+import fitting
+from typing import List, NamedTuple
+
+# Hard cap on the bins of one histogram, under/overflow bins included.
+MAX_BINS = 160
+RULES = ["fd", "scott"]
+
+
+class Bins(NamedTuple):
+    """Bin edges of one histogram.
+
+    With underflow (overflow) set, the first (last) bin also counts every value below
+    (above) the edges, so outliers cost one bin instead of a run of empty ones.
+    """
+    edges: np.ndarray
+    underflow: bool = False
+    overflow: bool = False
+
+
+def rule_widths(series: List[List[float]], rule: str) -> np.ndarray:
+    """Bin width of every series with the Freedman-Diaconis ("fd") or Scott ("scott") rule.
+
+    Computed on the NaN-padded (series, longest) matrix at once. Series that give no
+    usable width (fewer than two values, zero spread) get NaN.
+    """
+    if rule not in RULES:
+        raise ValueError(f"Unknown binning rule {rule}, expected one of {RULES}")
+    matrix = fitting.pad_series(series)
+    widths = np.full(len(series), np.nan)
+    n = (~np.isnan(matrix)).sum(axis=1)
+    filled = n > 1
+    if filled.any():
+        rows = matrix[filled]
+        with np.errstate(invalid="ignore"):
+            if rule == "fd":
+                q1, q3 = np.nanpercentile(rows, [25, 75], axis=1)
+                widths[filled] = 2 * (q3 - q1) * n[filled] ** (-1 / 3)
+            else:
+                widths[filled] = (24 * np.sqrt(np.pi) / n[filled]) ** (1 / 3) * np.nanstd(rows, axis=1)
+    widths[~(widths > 0)] = np.nan
+    return widths
+
+
+def bounded_bins(values: List[float], bin_width: float, window_min: float, window_max: float,
+                 max_bins: int = MAX_BINS, reach: float = np.inf) -> Bins:
+    """Bins of bin_width from the smallest to the largest value, at most max_bins of them.
+
+    Values more than reach beyond the window are outliers: they are counted in an
+    underflow or overflow bin and do not stretch the grid. The grid is then
+    np.arange(min, max + bin_width, bin_width) of the other values whenever that fits
+    (one bin centred on the value when they are all equal). Otherwise only the part of
+    the grid inside the plot window is kept, coarsened by a whole factor if even that is
+    too long, and values outside go to the underflow and overflow bins as well.
+    """
+    values = np.asarray(values, dtype=float)
+    below = bool((values < window_min - reach).any())
+    above = bool((values > window_max + reach).any())
+    inside = values[(values >= window_min - reach) & (values <= window_max + reach)]
+    lo, hi = (inside.min(), inside.max()) if len(inside) else (window_min, window_max)
+    # Length np.arange would give, worked out before allocating anything.
+    n_edges = int(np.ceil((hi + bin_width - lo) / bin_width))
+    if n_edges - 1 <= max_bins - below - above:
+        edges = np.arange(lo, hi + bin_width, bin_width)
+        if len(edges) < 2:
+            edges = np.array([lo - bin_width / 2, lo + bin_width / 2])
+        return _outer_bins(edges, below, above, bin_width)
+
+    # Grid steps (counted from lo) of the window, clamped to the data range.
+    first = max(int(np.floor((window_min - lo) / bin_width)), 0)
+    last = min(int(np.ceil((window_max - lo) / bin_width)), n_edges - 1)
+    if last <= first:
+        first, last = 0, n_edges - 1
+    step = max(int(np.ceil((last - first) / (max_bins - 2))), 1)
+    last = first + int(np.ceil((last - first) / step)) * step
+    edges = lo + np.arange(first, last + 1, step) * bin_width
+    return _outer_bins(edges, below or bool(lo < edges[0]), above or bool(hi > edges[-1]), step * bin_width)
+
+
+def _outer_bins(edges: np.ndarray, underflow: bool, overflow: bool, width: float) -> Bins:
+    """Bins of edges with an underflow and/or overflow bin of width added outside them."""
+    if underflow:
+        edges = np.r_[edges[0] - width, edges]
+    if overflow:
+        edges = np.r_[edges, edges[-1] + width]
+    return Bins(edges, underflow, overflow)
+
+
+def histogram(values: List[float], bins: Bins):
+    """np.histogram counts and edges, with values past the edges folded into the under/overflow bins."""
+    values = np.asarray(values, dtype=float)
+    edges = bins.edges
+    if bins.underflow or bins.overflow:
+        values = np.clip(values, edges[0] if bins.underflow else -np.inf, edges[-1] if bins.overflow else np.inf)
+    return np.histogram(values, bins=edges)
@@ -0,0 +1,421 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import util
+import schema
+import diagnostics
+import sketch
+from typing import Dict, Any, List, Tuple
+
+# Bump whenever the extracted columns or their layout change so stale caches are rebuilt.
+CACHE_VERSION = 5
+
+# Per-row metadata columns stored next to the measurements.
+META_COLUMNS = ["path", "label", "serial", "timestamp", "test_time", "board_temp"]
+
+META_DTYPES = {"path": str, "label": str, "serial": str, "timestamp": np.int64,
+               "test_time": "datetime64[s]", "board_temp": np.float64}
+
+
+def find_result_files(root_directory: str) -> List[str]:
+    """Collect all results_all.json file paths below root_directory."""
+    file_paths = []
+    for dirpath, _, filenames in os.walk(root_directory):
+        if "results_all.json" in filenames:
+            file_paths.append(os.path.join(dirpath, "results_all.json"))
+    return file_paths
+
+
+def parse_test_time(raw_time: str) -> datetime:
+    """Parse a "dd_mm_yy_T_HH_MM_SS" test_time string."""
+    cleaned = raw_time.replace('_T_', ' ').replace('_', '-')
+    return datetime.strptime(cleaned, "%d-%m-%y %H-%M-%S")
+
+
+def _read_document(file_path: str):
+    with open(file_path, 'r') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            diagnostics.record("json_error", e.msg, file_path)
+            return None
+
+
+def _row_from_file(file_path: str, label: str):
+    """Decode one file into (metadata, schema row), or None if it cannot be used."""
+    data = _read_document(file_path)
+    if data is None:
+        return None
+    if "test_time" not in data:
+        diagnostics.record("missing_test_time", "", file_path)
+        return None
+    temps = data.get("board_temp")
+    board_temp = np.nan
+    if isinstance(temps, dict) and temps:
+        board_temp = sum(temps.values()) / len(temps)
+    meta = {
+        "path": file_path,
+        "label": label,
+        "serial": util.extract_serial(file_path) or "",
+        "timestamp": util.extract_timestamp(file_path),
+        "test_time": np.datetime64(parse_test_time(data["test_time"]), "s"),
+        "board_temp": board_temp,
+    }
+    return meta, schema.get_extractor().extract(data, file_path)
+
+
+def hash_file(file_path: str) -> str:
+    """sha1 of a file's bytes, read in 1 MiB chunks."""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_manifest(cache_directory: str) -> Dict[str, Dict[str, Any]]:
+    manifest_path = os.path.join(cache_directory, "manifest.json")
+    if not cache_is_current(cache_directory) or not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def _parse_item(item: Tuple[str, str]):
+    return _row_from_file(*item)
+
+
+def _parse_item_in_worker(item: Tuple[str, str]):
+    return diagnostics.collect(_row_from_file, *item)
+
+
+def parse_files(items: List[Tuple[str, str]], workers: int = 1):
+    """Decode (file_path, label) items, returning one (meta, record) or None per item.
+
+    With workers > 1 (None means one per core) the files are sharded across a process
+    pool; results always come back in the order of items, so the merge does not depend
+    on which worker finished first.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(items) < 2:
+        return [_parse_item(item) for item in items]
+    chunksize = max(1, len(items) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = []
+        for row, events in executor.map(_parse_item_in_worker, items, chunksize=chunksize):
+            diagnostics.merge(events)
+            results.append(row)
+        return results
+
+
+def _columns_from_rows(metas: List[Dict[str, Any]], rows: List[np.ndarray]):
+    """Turn decoded rows into ({meta name: array}, {column key: array})."""
+    extractor = schema.get_extractor()
+    meta = {name: np.array([m[name] for m in metas], dtype=META_DTYPES[name]) for name in META_COLUMNS}
+    matrix = np.vstack(rows) if rows else np.empty((0, extractor.width))
+    columns = {key: np.ascontiguousarray(matrix[:, i]) for i, key in enumerate(extractor.columns)}
+    return meta, columns
+
+
+def _as_measurements(meta: Dict[str, np.ndarray], columns: Dict[Tuple, np.ndarray]) -> Dict[str, Any]:
+    """Wrap in-memory columns in the same layout load_cache returns."""
+    column_info = [{"name": schema.column_name(*key), "group": key[0], "key": key[1], "param": key[2], "impedance": key[3]}
+                   for key in columns]
+    values = {info["name"]: array for info, array in zip(column_info, columns.values())}
+    return {"rows": len(next(iter(columns.values()), [])), "meta": meta, "columns": column_info, "values": values}
+
+
+def measurements_from_rows(rows: List[np.ndarray]) -> Dict[str, Any]:
+    """In-memory measurements (no metadata) for rows returned by the schema extractor."""
+    _, columns = _columns_from_rows([], rows)
+    return _as_measurements({}, columns)
+
+
+def _columns_from_cache(measurements: Dict[str, Any], rows: np.ndarray):
+    """Copy the given rows of an open cache into ({meta name: array}, {column key: array})."""
+    meta = {name: np.asarray(measurements["meta"][name])[rows] for name in META_COLUMNS}
+    columns = {}
+    for column in measurements["columns"]:
+        key = (column["group"], column["key"], column["param"], column["impedance"])
+        columns[key] = np.asarray(measurements["values"][column["name"]])[rows]
+    return meta, columns
+
+
+def _merge_columns(parts, label_order: List[str]):
+    """Concatenate (meta, columns) parts and order rows per label, newest first."""
+    n_rows = [len(meta["path"]) for meta, _ in parts]
+    meta = {name: np.concatenate([p[0][name].astype(META_DTYPES[name]) for p in parts]) for name in META_COLUMNS}
+    keys = {}
+    for _, columns in parts:
+        for key in columns:
+            keys.setdefault(key, None)
+    columns = {}
+    for key in keys:
+        columns[key] = np.concatenate([p[1].get(key, np.full(n, np.nan)) for p, n in zip(parts, n_rows)])
+
+    rank = {label: i for i, label in enumerate(label_order)}
+    label_rank = np.array([rank.get(label, len(rank)) for label in meta["label"]], dtype=np.int64)
+    order = np.lexsort((meta["path"], -meta["timestamp"], label_rank))
+    return {name: array[order] for name, array in meta.items()}, {key: array[order] for key, array in columns.items()}
+
+
+def _label_sketches(meta: Dict[str, np.ndarray], columns: Dict[Tuple, np.ndarray]) -> Dict[str, Dict[str, sketch.QuantileSketch]]:
+    """{label: {measurement name: QuantileSketch}} of every run's values (presence columns excluded)."""
+    labels = np.asarray(meta["label"])
+    return {str(label): sketch.sketch_columns({schema.column_name(*key): array[labels == label]
+                                                for key, array in columns.items() if key[0] != "present"})
+            for label in np.unique(labels)}
+
+
+def load_sketches(cache_directory: str) -> Dict[str, Dict[str, sketch.QuantileSketch]]:
+    """Quantile sketches stored with a cache, {label: {measurement name: QuantileSketch}}.
+
+    They cover every cached run of the label (no cutoff or serial dedup), so they answer
+    quantile questions (percentiles, x ranges, site comparisons) without opening the columns.
+    """
+    sketch_path = os.path.join(cache_directory, "sketches.json")
+    if not os.path.exists(sketch_path):
+        return {}
+    with open(sketch_path, "r") as f:
+        return {label: {name: sketch.QuantileSketch.from_dict(data) for name, data in part.items()}
+                for label, part in json.load(f).items()}
+
+
+def _write_cache(cache_directory: str, meta: Dict[str, np.ndarray], columns: Dict[Tuple, np.ndarray],
+                 manifest: Dict[str, Dict[str, Any]], sketches: Dict[str, Dict[str, sketch.QuantileSketch]]):
+    """Write a complete cache next to cache_directory and swap it in.
+
+    Readers that still hold memory maps of the previous files keep working, since those
+    files are unlinked rather than overwritten.
+    """
+    tmp_directory = cache_directory.rstrip("/\\") + ".tmp"
+    if os.path.exists(tmp_directory):
+        shutil.rmtree(tmp_directory)
+    os.makedirs(tmp_directory)
+
+    for name in META_COLUMNS:
+        np.save(os.path.join(tmp_directory, f"{name}.npy"), meta[name])
+    column_info = []
+    for i, ((group, key, param, impedance), array) in enumerate(columns.items()):
+        filename = f"col_{i:05d}.npy"
+        np.save(os.path.join(tmp_directory, filename), array)
+        column_info.append({"name": schema.column_name(group, key, param, impedance), "group": group, "key": key,
+                            "param": param, "impedance": impedance, "file": filename})
+
+    index = {"version": CACHE_VERSION, "rows": len(meta["path"]), "columns": column_info}
+    with open(os.path.join(tmp_directory, "index.json"), "w") as f:
+        json.dump(index, f, indent=1)
+    with open(os.path.join(tmp_directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    with open(os.path.join(tmp_directory, "sketches.json"), "w") as f:
+        json.dump({label: {name: part.to_dict() for name, part in parts.items()} for label, parts in sketches.items()}, f)
+
+    old_directory = cache_directory.rstrip("/\\") + ".old"
+    if os.path.exists(cache_directory):
+        if os.path.exists(old_directory):
+            shutil.rmtree(old_directory)
+        os.rename(cache_directory, old_directory)
+    os.rename(tmp_directory, cache_directory)
+    if os.path.exists(old_directory):
+        shutil.rmtree(old_directory)
+
+
+def update_cache(root_directorys: Dict[str, str], cache_directory: str, rebuild: bool = False, workers: int = 1):
+    """Bring the cache in line with the results_all.json files below the labelled roots.
+
+    manifest.json records path, label, size, mtime and sha1 of every file seen. Files
+    whose size and mtime are unchanged are trusted; otherwise the content hash decides
+    whether the file is decoded again. Rows of deleted files are dropped and the new rows
+    are merged with the kept ones, so a refresh only pays for what actually changed.
+    The per-label quantile sketches (see load_sketches) of new rows are merged into the
+    stored ones when no row was dropped, and rebuilt otherwise.
+    Every run that has a test_time is kept (no cutoff or serial dedup), ordered per label
+    newest first by the path timestamp, so each reader can apply its own selection.
+    Changed files of all labels are decoded together by parse_files with `workers`.
+    """
+    manifest = {} if rebuild else _load_manifest(cache_directory)
+    new_manifest = {}
+    to_parse = []
+    for label, root_directory in root_directorys.items():
+        for file_path in find_result_files(root_directory):
+            stat = os.stat(file_path)
+            entry = manifest.get(file_path)
+            if entry is not None and entry["label"] == label and entry["size"] == stat.st_size \
+                    and entry["mtime"] == stat.st_mtime:
+                new_manifest[file_path] = entry
+                continue
+            sha1 = hash_file(file_path)
+            if entry is not None and entry["label"] == label and entry["sha1"] == sha1:
+                new_manifest[file_path] = dict(entry, size=stat.st_size, mtime=stat.st_mtime)
+                continue
+            new_manifest[file_path] = {"label": label, "size": stat.st_size, "mtime": stat.st_mtime,
+                                       "sha1": sha1, "cached": False}
+            to_parse.append((file_path, label))
+
+    if manifest and not to_parse and new_manifest.keys() == manifest.keys():
+        with open(os.path.join(cache_directory, "manifest.json"), "w") as f:
+            json.dump(new_manifest, f)
+        return load_cache(cache_directory)
+
+    metas = []
+    rows = []
+    for (file_path, _), row in zip(to_parse, parse_files(to_parse, workers)):
+        if row is None:
+            continue
+        new_manifest[file_path]["cached"] = True
+        metas.append(row[0])
+        rows.append(row[1])
+    parts = [_columns_from_rows(metas, rows)]
+    sketches = None
+
+    if manifest:
+        old = load_cache(cache_directory)
+        reparsed = {file_path for file_path, _ in to_parse}
+        keep = np.array([path in new_manifest and path not in reparsed for path in old["meta"]["path"]], dtype=bool)
+        parts.insert(0, _columns_from_cache(old, np.flatnonzero(keep)))
+        old_sketches = load_sketches(cache_directory)
+        if keep.all() and old_sketches:
+            new_sketches = _label_sketches(*parts[-1])
+            sketches = {label: sketch.merge_sketches([old_sketches.get(label, {}), new_sketches.get(label, {})])
+                        for label in set(old_sketches) | set(new_sketches)}
+
+    meta, columns = _merge_columns(parts, list(root_directorys))
+    if sketches is None:
+        sketches = _label_sketches(meta, columns)
+    _write_cache(cache_directory, meta, columns, new_manifest, sketches)
+    return load_cache(cache_directory)
+
+
+def build_cache(root_directorys: Dict[str, str], cache_directory: str, workers: int = 1):
+    """Decode every results_all.json below the labelled roots into a fresh columnar cache."""
+    return update_cache(root_directorys, cache_directory, rebuild=True, workers=workers)
+
+
+def ingest(root_directorys: Dict[str, str], workers: int = 1) -> Dict[str, Any]:
+    """Decode the labelled roots into an in-memory cache, without writing anything to disk.
+
+    The result has the same layout as load_cache, so select_rows and
+    collections_from_cache work on it unchanged.
+    """
+    items = [(file_path, label) for label, root_directory in root_directorys.items()
+             for file_path in find_result_files(root_directory)]
+    rows = [row for row in parse_files(items, workers) if row is not None]
+    meta, columns = _merge_columns([_columns_from_rows([r[0] for r in rows], [r[1] for r in rows])],
+                                   list(root_directorys))
+    return _as_measurements(meta, columns)
+
+
+def load_cache(cache_directory: str, columns: List[str] = None, mmap: bool = True) -> Dict[str, Any]:
+    """Open a cache written by update_cache.
+
+    Only the requested measurement columns are opened (all of them by default); each one
+    is memory-mapped so nothing is read from disk until it is used.
+    """
+    with open(os.path.join(cache_directory, "index.json"), "r") as f:
+        index = json.load(f)
+    if index.get("version") != CACHE_VERSION:
+        raise ValueError(f"Cache in {cache_directory} has version {index.get('version')}, expected {CACHE_VERSION}")
+
+    mmap_mode = "r" if mmap else None
+    meta = {name: np.load(os.path.join(cache_directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in META_COLUMNS}
+    wanted = None if columns is None else set(columns)
+    info = [c for c in index["columns"] if wanted is None or c["name"] in wanted]
+    values = {c["name"]: np.load(os.path.join(cache_directory, c["file"]), mmap_mode=mmap_mode) for c in info}
+    return {"rows": index["rows"], "meta": meta, "columns": info, "values": values}
+
+
+def cache_is_current(cache_directory: str) -> bool:
+    index_path = os.path.join(cache_directory, "index.json")
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, "r") as f:
+        return json.load(f).get("version") == CACHE_VERSION
+
+
+def cutoff_mask(test_time: np.ndarray, cutoff: Tuple[int, int]) -> np.ndarray:
+    """True for runs tested on or after (month, day) of the run's own year."""
+    if cutoff is None:
+        return np.ones(len(test_time), dtype=bool)
+    month, day = cutoff
+    days = np.asarray(test_time).astype("datetime64[D]")
+    month_start = days.astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)
+    return days >= month_start.astype("datetime64[D]") + (day - 1)
+
+
+def select_rows(cache: Dict[str, Any], label: str = None, cutoff: Tuple[int, int] = None, dedup: bool = True,
+                policy: str = "latest") -> np.ndarray:
+    """Row indices of one label after the cutoff date and newest-run-per-serial selection.
+
+    This reproduces read_json_files: rows are visited newest first, runs before the cutoff
+    are dropped, then only the first run of each serial number is kept. With policy
+    "first" the oldest run of each serial is kept instead (see registry.SerialRegistry).
+    """
+    meta = cache["meta"]
+    mask = cutoff_mask(meta["test_time"], cutoff)
+    if label is not None:
+        mask &= np.asarray(meta["label"]) == label
+    if dedup:
+        mask &= np.asarray(meta["serial"]) != ""
+    rows = np.flatnonzero(mask)
+    if dedup and len(rows):
+        if policy not in ("latest", "first"):
+            raise ValueError(f"Cache rows can be selected by the latest or first run, not {policy}")
+        visit = rows if policy == "latest" else rows[::-1]
+        _, first = np.unique(np.asarray(meta["serial"])[visit], return_index=True)
+        rows = np.sort(visit[first])
+    return rows
+
+
+def collections_from_cache(cache: Dict[str, Any], rows: np.ndarray, impedance: str, drop_missing: bool = True):
+    """Rebuild the collections returned by plot_histograms.read_json_files from cache rows.
+
+    Missing values (NaN) are dropped for histograms. Time series pass drop_missing=False
+    to keep one value per row, aligned with the rows' test_time; series without any
+    value are empty either way.
+    """
+    channel_params = [
+        "baseline", "noise_rms_mv", "gain", "eni",
+        "peaking_time", "max_non_linearity", "fit_gain",
+        "gain_crude", "i2c_margin_list", "i2c_phase_list",
+        "residual", "slope_fit", "offset"
+    ]
+    channels = [
+        "CH0 HG", "CH1 HG", "CH2 HG", "CH3 HG",
+        "CH0 LG", "CH1 LG", "CH2 LG", "CH3 LG",
+        "SUM x3", "SUM x1", "LG0", "LG1", "LG2", "LG3",
+        "HG0", "HG1", "HG2", "HG3", "400_kHz", "1_MHz"
+    ]
+    channel_values = {channel: {param: [] for param in channel_params} for channel in channels}
+    power_ldo_values = {}
+    gain_ratio_values = {0: [], 1: [], 2: [], 3: []}
+    uniformity_hg = {param: [] for param in schema.UNIFORMITY_PARAMS}
+    uniformity_lg = {param: [] for param in schema.UNIFORMITY_PARAMS}
+    dclvl = {param: [] for param in schema.DCLVL_PARAMS}
+
+    for column in cache["columns"]:
+        group, key, param = column["group"], column["key"], column["param"]
+        if column["impedance"] not in (impedance, None):
+            continue
+        values = np.asarray(cache["values"][column["name"]])[rows]
+        missing = np.isnan(values)
+        values = values[~missing].tolist() if drop_missing or missing.all() else values.tolist()
+        if group == "channel":
+            if key in channel_values and param in channel_values[key]:
+                channel_values[key][param] = values
+        elif group == "power_ldo":
+            if values:
+                power_ldo_values.setdefault(key, {})[param] = values
+        elif group == "hg":
+            uniformity_hg[param] = values
+        elif group == "lg":
+            uniformity_lg[param] = values
+        elif group == "dclvl_sh_calib":
+            dclvl[param] = values
+        elif group == "gain_ratio" and param in gain_ratio_values:
+            gain_ratio_values[param] = values
+    return channel_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values, dclvl
@@ -1,154 +1,161 @@
 import json
 import re
-from collections import defaultdict
-from datetime import datetime
-import os
+import numpy as np
 import pandas as pd
 import os
 import util
+import cache
+import grading
+import diagnostics
+import prefilter
+import registry
+import repeatability
+import artifacts
 
-def save_exel(file_paths, criteria_file_path1, criteria_file_path2, output_file_path, empty_paths):
-    # Load criteria from the JSON file
-    
-    with open(criteria_file_path1, 'r') as f:
-        criteria1 = json.load(f)
-    with open(criteria_file_path2, 'r') as f:
-        criteria2 = json.load(f)
-
-    output = []
-    a_count = 0
-    b_count = 0
-    f_count = 0
-    param_stats = defaultdict(lambda: {"A": 0, "B": 0, "F": 0})
-
-    uniformity_key = {"gain_uniformity", "peaking_time_uniformity", "baseline_uniformity"}
-    c_key = {"hg_lg", "sum_x1", "sum_x3"}
-    u_key = ["x1", "x3"]
-    gain_ratio_key = {0, 1, 2, 3}
-    s_n = []
-    off = 0
-    dup = 0
-
-    for file_path in file_paths:
-        row = []
+# Size, mtime and sha1 of the files a workbook was graded from, next to the workbook.
+HASHES_NAME = "file_hashes.json"
 
-        with open(file_path, 'r') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from {file_path}: {e}")
-                continue
+def save_exel(file_paths, criteria_file_path1, criteria_file_path2, output_file_path, empty_paths, workers = 1, diagnostics_path = None, cutoff = (1, 11), policy = "latest",
+              cache_directory = None):
+    """Grade every chip and write the Results and Statistics workbook.
 
-        if "test_time" in data:
+    policy picks which run of a retested serial is graded, see registry.SerialRegistry;
+    "best" grades every run and keeps the best graded one. Nothing is decoded if the
+    workbook was written from the same files (paths and content hashes), criteria and
+    options; touching or copying a file does not redo it, any edit does. Only files whose
+    size or mtime changed are hashed again: the hashes are kept in file_hashes.json next
+    to the workbook, and taken from the manifest of cache_directory when given.
+    """
+    directory = os.path.dirname(output_file_path) or "."
+    index = artifacts.ArtifactIndex(directory)
+    known = cache._load_manifest(cache_directory) if cache_directory is not None else {}
+    known.update(_load_hashes(directory))
+    key = artifacts.artifact_key("workbook", _file_hashes(file_paths, known), _file_contents([criteria_file_path1, criteria_file_path2]),
+                                 sorted(empty_paths), cutoff, policy)
+    _save_hashes(directory, {path: known[path] for path in file_paths})
+    if index.is_current(output_file_path, key):
+        return
+    (criteria1, criteria2), _ = grading.load_tiers([("F", criteria_file_path1), ("B", criteria_file_path2)])
 
-            date_parts = data["test_time"].split('_')[:3]  # ['13', '06', '25']
-            date_str = f"{date_parts[0]}-{date_parts[1]}-{date_parts[2]}"  # '13-06-25'
-            date_obj = datetime.strptime(date_str, "%d-%m-%y")  # dd-mm-yy
+    output = []
+    stats = util.GradeStats()
+    # Runs tested before the (month, day) cutoff and older runs of a serial are dropped
+    # from test_time and path alone, so only the remaining files are decoded and graded.
+    # Files are graded (in parallel with workers > 1) as they stream in, in file order; a
+    # serial whose selected file does not decode is graded from its next run instead.
+    graded = list(prefilter.load_selected(file_paths, lambda paths: util.grade_files(paths, [criteria1, criteria2], workers),
+                                          cutoff, None if policy == "best" else policy))
+    runs = registry.SerialRegistry()
+    for entry, chip_grade in graded:
+        if runs.add(entry.path, entry.timestamp, entry.test_time, chip_grade.grade, entry.serial) is None:
+            diagnostics.record("no_serial", "", entry.path)
+    if policy == "best":
+        for run in runs.duplicates(policy):
+            diagnostics.record("duplicate_serial", run.serial, run.path)
+        kept = {run.path for run in runs.select(policy)}
+        graded = [(entry, chip_grade) for entry, chip_grade in graded if entry.path in kept]
 
-            # Define cutoff date (e.g., June 7, 2025)
-            cutoff_date = datetime(year=date_obj.year, month=1, day=11)
-
-            # Check if it's later
-            if date_obj < cutoff_date:
-                print(f"skipping file")
-                continue
-        else:
-            print(f"Warning: 'test_time' not found in {file_path}, skipping file")
-            continue
-
-        match = re.search(r'(\d{3}-\d{5})', file_path)
-        if not match:
-            match = re.search(r'(\d{3}-\s\d{5})', file_path)  # Handle cases with space
-        if match:
-            if match.group(1) not in s_n:
-                s_n.append(match.group(1))
-                row.append(match.group(1))
-            else:
-                print(f"({file_path}): Duplicate serial number {match.group(1)} found")
-                dup += 1
-                continue
-        else:
-            match = re.search(r'(\d{8})', file_path)
-            if not match:
-                match = re.search(r'(\d{6})', file_path)
-            if match:
-                if match.group(1) not in s_n:
-                    s_n.append(match.group(1))
-                    row.append(match.group(1))
-                else:
-                    print(f"({file_path}): Duplicate serial number {match.group(1)} found")
-                    dup += 1
-                    continue
-            else:
-                print(f"Warning({file_path}): No match found")
-                continue
+    for entry, chip_grade in graded:
+        file_path = entry.path
+        row = [entry.serial]
 
         ts = re.search(r'(_\d{10})', file_path)
         if not ts:
-            print(f"Warning({file_path}): No timestamp found")
+            diagnostics.record("no_timestamp", "", file_path)
         else:
             row.append(ts.group(1)[1:])
 
-        flag = util.get_grades(data, uniformity_key, gain_ratio_key, c_key, u_key, [criteria1, criteria2], file_path, param_stats, row)
+        stats.add(chip_grade)
+        row.extend(chip_grade.failures)
 
         # Insert Pass/Fail status at index 1
-
-        if flag == -1:
-            row.insert(1, 'F')
-            output.append(row)
-            f_count += 1
-        elif flag == 0:
-            row.insert(1, 'B')
+        row.insert(1, chip_grade.grade)
+        if chip_grade.flag < 1:
             output.append(row)
-            b_count += 1
-        else:
-            row.insert(1, 'A')
-            a_count += 1
 
-    empty_count = 0
+    a_count, b_count, f_count = stats.counts["A"], stats.counts["B"], stats.counts["F"]
+    param_stats = stats.param_stats
+    empty_rows, empty_dup = _empty_rows(empty_paths, runs)
+    output.extend(empty_rows)
+    f_count += len(empty_rows)
+    write_workbook(output_file_path, output, param_stats, {"A": a_count, "B": b_count, "F": f_count}, len(empty_rows))
+    index.update(output_file_path, key)
+    index.save()
+    diagnostics.report(diagnostics_path)
+
+def _file_hashes(file_paths, known):
+    """(path, sha1 of the content) of every file, what the workbook key checks the inputs by.
+
+    known maps paths to their size, mtime and sha1 (a cache manifest entry has them too);
+    files whose size or mtime differ from their entry are hashed and their entry replaced.
+    """
+    hashes = []
+    for path in file_paths:
+        stat = os.stat(path)
+        entry = known.get(path)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            entry = known[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha1": cache.hash_file(path)}
+        hashes.append((path, entry["sha1"]))
+    return hashes
+
+def _load_hashes(directory):
+    hashes_path = os.path.join(directory, HASHES_NAME)
+    if not os.path.exists(hashes_path):
+        return {}
+    with open(hashes_path, "r") as f:
+        return json.load(f)
+
+def _save_hashes(directory, hashes):
+    with open(os.path.join(directory, HASHES_NAME), "w") as f:
+        json.dump({path: {name: entry[name] for name in ("size", "mtime", "sha1")} for path, entry in hashes.items()}, f)
+
+def _file_contents(file_paths):
+    contents = []
+    for path in file_paths:
+        with open(path, "r") as f:
+            contents.append(f.read())
+    return contents
+
+def _empty_rows(empty_paths, runs):
+    """F rows for the runs that only left a metadata.json, skipping serials already in the registry."""
+    output = []
+    dup = 0
     for file_path in empty_paths:
-        row = []
-
-        match = re.search(r'(\d{3}-\d{5})', file_path)
-        if not match:
-            match = re.search(r'(\d{3}-\s\d{5})', file_path)  # Handle cases with space
-        if match:
-            if match.group(1) not in s_n:
-                s_n.append(match.group(1))
-                row.append(match.group(1))
-            else:
-                print(f"({file_path}): Duplicate serial number {match.group(1)} found")
-                dup += 1
-                continue
-        else:
-            match = re.search(r'(\d{8})', file_path)
-            if not match:
-                match = re.search(r'(\d{6})', file_path)
-            if match:
-                if match.group(1) not in s_n:
-                    s_n.append(match.group(1))
-                    row.append(match.group(1))
-                else:
-                    print(f"({file_path}): Duplicate serial number {match.group(1)} found")
-                    dup += 1
-                    continue
-            else:
-                print(f"Warning({file_path}): No match found")
-                continue
-        row.extend("F")
-        output.append(row)
-        f_count += 1
-        empty_count += 1
+        serial = registry.serial_from_path(file_path)
+        if serial is None:
+            diagnostics.record("no_serial", "", file_path)
+            continue
+        if serial in runs:
+            diagnostics.record("duplicate_serial", serial, file_path)
+            dup += 1
+            continue
+        runs.add(file_path, serial=serial)
+        output.append([serial, "F"])
+    return output, dup
+
+def write_workbook(output_file_path, output, param_stats, grade_counts, empty_count, tier_counts=None, repeatability_table=None):
+    """Write the Results and Statistics sheets.
+
+    grade_counts maps every grade to its chip count, best grade first and worst grade
+    last; runs without results (empty_count) count in the worst grade. tier_counts, a
+    DataFrame of per-chip measurement counts per grade, is written to a third sheet, and
+    repeatability_table (see repeatability_frame) to a sheet after Statistics.
+    """
+    grades = list(grade_counts)
+    total = sum(grade_counts.values())
     # Add a statistics row at the end of the dataframe
-    stats_row = ["Overall", a_count, b_count, f_count, a_count/(a_count + b_count + f_count)]
+    output = list(output)
+    stats_row = ["Overall"] + [grade_counts[grade] for grade in grades] + [grade_counts[grades[0]]/total]
     output.append(stats_row)
     for param, stats in sorted(param_stats.items()):
-        output.append([param, stats["A"], stats["B"], stats["F"] + empty_count, stats["A"]/(stats["A"] + stats["B"] + stats["F"] + empty_count)])
+        counts = [stats[grade] for grade in grades]
+        counts[-1] += empty_count
+        output.append([param] + counts + [counts[0]/sum(counts)])
 
     # Split output into main results and statistics
     main_results = output[:-1 * (len(param_stats) + 1)]
     statistics_results = output[-1 * (len(param_stats) + 1):]
-    statistics_results.insert(0,["", f"A", f"B", f"F", f"Ratio"])
+    statistics_results.insert(0,[""] + grades + [f"Ratio"])
 
     # Convert to DataFrames
     df_main = pd.DataFrame(main_results)
@@ -158,6 +165,10 @@ def save_exel(file_paths, criteria_file_path1, criteria_file_path2, output_file_
     with pd.ExcelWriter(output_file_path, engine='xlsxwriter') as writer:
         df_main.to_excel(writer, sheet_name='Results', index=False)
         df_stats.to_excel(writer, sheet_name='Statistics', index=False, header=False)
+        if repeatability_table is not None:
+            repeatability_table.to_excel(writer, sheet_name='Repeatability', index=False)
+        if tier_counts is not None:
+            tier_counts.to_excel(writer, sheet_name='Tier counts', index=False)
         # Get workbook and worksheet objects
         workbook  = writer.book
         worksheet = writer.sheets['Statistics']
@@ -167,6 +178,84 @@ def save_exel(file_paths, criteria_file_path1, criteria_file_path2, output_file_
         percent_col_idx = len(df_stats.columns) - 1
         worksheet.set_column(percent_col_idx, percent_col_idx, 12, percent_format)
 
+def save_exel_tiers(measurements, tiers, output_file_path, empty_paths, label=None, cutoff=(1, 11), top_grade="A", diagnostics_path=None,
+                    retests=False):
+    """Grade the cached chips against any number of criteria tiers and write the workbook.
+
+    tiers is [(grade, criteria file), ...] from the loosest to the tightest limits, see
+    grading.TIERS. Besides Results and Statistics the workbook gets a "Tier counts" sheet
+    with the number of measurements of every chip in each grade. With retests, every run
+    of the selected chips (not only the graded newest one) is used to fill a
+    "Repeatability" sheet, see repeatability.repeatability. The workbook is only written
+    again when the graded values of the selected runs, the criteria or the options changed.
+    """
+    rows = cache.select_rows(measurements, label, cutoff=cutoff)
+    all_runs = cache.select_rows(measurements, label, cutoff=cutoff, dedup=False) if retests else rows
+    meta = measurements["meta"]
+    index = artifacts.ArtifactIndex(os.path.dirname(output_file_path) or ".")
+    key = artifacts.artifact_key("workbook_tiers", [grade for grade, _ in tiers], _file_contents([path for _, path in tiers]),
+                                 top_grade, retests, sorted(empty_paths), meta["path"][all_runs].tolist(),
+                                 meta["serial"][all_runs].tolist(), meta["timestamp"][all_runs], meta["path"][rows].tolist(),
+                                 grading.measurement_matrix(measurements, all_runs, grading.grading_plan()["columns"]))
+    if index.is_current(output_file_path, key):
+        return
+    criterium, grade_names = grading.load_tiers(tiers, top_grade)
+    grades = grading.grade_cache(measurements, rows, criterium, grade_names)
+    serials = measurements["meta"]["serial"][rows]
+    timestamps = measurements["meta"]["timestamp"][rows]
+    chip_tiers = grades["chip_tiers"]
+    top = len(grade_names) - 1
+
+    output = []
+    for chip in np.flatnonzero(chip_tiers < top):
+        row = [str(serials[chip]), grade_names[chip_tiers[chip]]]
+        if timestamps[chip]:
+            row.append(str(timestamps[chip]))
+        row.extend(grading.failure_rows(grades, chip))
+        output.append(row)
+
+    empty_rows, _ = _empty_rows(empty_paths, registry.SerialRegistry.from_cache(measurements, rows))
+    for row in empty_rows:
+        row[1:] = [grade_names[0]]
+    output.extend(empty_rows)
+    grade_counts = {grade: int((chip_tiers == t).sum()) for t, grade in reversed(list(enumerate(grade_names)))}
+    grade_counts[grade_names[0]] += len(empty_rows)
+
+    tier_counts = pd.DataFrame(grades["tier_counts"][:, ::-1], columns=grade_names[::-1])
+    tier_counts.insert(0, "Serial", [str(serial) for serial in serials])
+    tier_counts.insert(1, "Grade", [grade_names[t] for t in chip_tiers])
+    table = None
+    if retests:
+        table = repeatability_frame(repeatability.repeatability(measurements, all_runs, criterium, grade_names))
+    write_workbook(output_file_path, output, grades["param_stats"], grade_counts, len(empty_rows), tier_counts, table)
+    index.update(output_file_path, key)
+    index.save()
+    diagnostics.report(diagnostics_path)
+
+def repeatability_frame(result):
+    """One row per graded measurement of a repeatability.repeatability result."""
+    return pd.DataFrame({
+        "Measurement": result["keys"],
+        "Runs": result["runs"].astype(int),
+        "Chips": result["chips"].astype(int),
+        "Retested chips": result["retested"].astype(int),
+        "Mean": result["mean"],
+        "Within-chip var": result["within"],
+        "Between-chip var": result["between"],
+        "Repeatability sigma": result["sigma"],
+        "Spec window": result["window"],
+        "6 sigma / window": result["sigma_ratio"],
+        "Grade flips": result["flips"].astype(int),
+        "Consecutive pairs": result["pairs"].astype(int),
+        "Flip rate": result["flip_rate"],
+    }).replace([np.inf, -np.inf], np.nan)
+
+def save_exel_from_cache(measurements, criteria_file_path1, criteria_file_path2, output_file_path, empty_paths, label=None, cutoff=(1, 11), diagnostics_path=None,
+                         retests=False):
+    """save_exel on a measurement cache, grading all selected chips at once with grading.grade_cache."""
+    save_exel_tiers(measurements, [("F", criteria_file_path1), ("B", criteria_file_path2)], output_file_path, empty_paths, label, cutoff,
+                    diagnostics_path=diagnostics_path, retests=retests)
+
 if __name__ == '__main__':
     root_directory = "../2025-08/"
     spec_path = "./spec.json"
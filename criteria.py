@@ -0,0 +1,101 @@
+import fnmatch
+import json
+import re
+import numpy as np
+from collections.abc import Mapping
+from typing import Dict, Any, List, Tuple
+
+
+class Criteria(Mapping):
+    """min/max limits looked up by measurement key, e.g. "CH0 HG_peaking_time_25".
+
+    Besides the flat {key: {"min", "max"}} files, criteria files may use rules:
+
+        {
+          "defaults": {"min": 1e-8, "max": 1e8},
+          "rules": [
+            {"key": "CH? HG_peaking_time_*", "min": 41, "max": 51},
+            {"key": "CH? ?G_eni_25", "max": 350},
+            {"key": "gain_ratio_*_25", "min": 17, "max": 27}
+          ]
+        }
+
+    Rule keys are shell-style patterns ("*", "?", "[..]"), so one rule covers every
+    channel and/or impedance. Rules are applied in order and later ones override earlier
+    ones; a rule may set only "min" or only "max", the rest comes from earlier matching
+    rules or from "defaults". Keys no rule matches fall back to "defaults" when it is
+    given, otherwise they are not in the criteria. Flat entries without wildcards are
+    indexed directly, and every key is resolved once and then served from a table.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], defaults: Dict[str, float] = None):
+        self.rules = rules
+        self.defaults = defaults
+        self._exact = {}
+        self._patterns = []
+        for order, rule in enumerate(rules):
+            key = rule["key"]
+            if any(c in key for c in "*?["):
+                self._patterns.append((order, re.compile(fnmatch.translate(key)), rule))
+            else:
+                self._exact.setdefault(key, []).append((order, rule))
+        self._table = {}
+
+    def _resolve(self, key: str):
+        if key in self._table:
+            return self._table[key]
+        matches = list(self._exact.get(key, []))
+        matches += [(order, rule) for order, pattern, rule in self._patterns if pattern.match(key)]
+        if not matches and self.defaults is None:
+            limits = None
+        else:
+            limits = dict(self.defaults or {})
+            for _, rule in sorted(matches, key=lambda match: match[0]):
+                limits.update({bound: rule[bound] for bound in ("min", "max") if bound in rule})
+            if "min" not in limits or "max" not in limits:
+                limits = None
+        self._table[key] = limits
+        return limits
+
+    def __contains__(self, key) -> bool:
+        return self._resolve(key) is not None
+
+    def __getitem__(self, key: str) -> Dict[str, float]:
+        limits = self._resolve(key)
+        if limits is None:
+            raise KeyError(key)
+        return limits
+
+    def __iter__(self):
+        return iter(key for key in self._exact if key in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def bounds(self, keys: List[str]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """min and max arrays aligned with keys (-inf/inf where no rule applies), plus the uncovered keys."""
+        lo = np.full(len(keys), -np.inf)
+        hi = np.full(len(keys), np.inf)
+        missing = []
+        for m, key in enumerate(keys):
+            limits = self._resolve(key)
+            if limits is None:
+                missing.append(key)
+            else:
+                lo[m] = limits["min"]
+                hi[m] = limits["max"]
+        return lo, hi, missing
+
+
+def as_criteria(criteria) -> Criteria:
+    """Criteria from a loaded criteria file, flat or rule based; Criteria pass through."""
+    if isinstance(criteria, Criteria):
+        return criteria
+    if "rules" in criteria and isinstance(criteria["rules"], list):
+        return Criteria(criteria["rules"], criteria.get("defaults"))
+    return Criteria([dict(limits, key=key) for key, limits in criteria.items()])
+
+
+def load_criteria(path: str) -> Criteria:
+    with open(path, 'r') as f:
+        return as_criteria(json.load(f))
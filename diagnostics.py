@@ -0,0 +1,126 @@
+import json
+from collections import defaultdict
+from typing import Dict, Any
+
+# What each event means, used as the heading of its summary line.
+EVENTS = {
+    "json_error": "could not be decoded",
+    "missing_test_time": "have no test_time, skipped",
+    "before_cutoff": "were tested before the cutoff date, skipped",
+    "duplicate_serial": "repeat a serial number already seen, skipped",
+    "no_serial": "have no serial number in their path, skipped",
+    "no_timestamp": "have no timestamp in their path",
+    "missing_criteria": "graded keys have no criteria rule, every value passes",
+    "missing_channel_list": "blocks have neither channel_list nor i2c_frequency_list",
+    "gain_ratio_index": "gain_ratio values are past the graded indices",
+    "gain_ratio_not_list": "gain_ratio blocks are not a list",
+    "missing_power_ldo": "files have no power_ldo",
+    "unknown_record": "power_ldo rails or fields are not in schema.SCHEMA, not extracted or graded",
+    "missing_board_temp": "files have no board_temp",
+    "spc_alert": "control chart alerts (EWMA, CUSUM or 3 sigma), see spc.py",
+    "spc_out_of_order": "results reached the control charts after a newer result",
+}
+
+
+class Diagnostics:
+    """Counts warnings by (event, key) instead of printing each one as it happens.
+
+    Every event keeps its first max_examples examples (usually file paths). Events named
+    in verbose, or all events with verbose="all", are also printed immediately, the way
+    the tools used to.
+    """
+
+    def __init__(self, max_examples: int = 3, verbose=()):
+        self.max_examples = max_examples
+        self.verbose = verbose
+        self.counts = defaultdict(int)
+        self.examples = defaultdict(list)
+
+    def record(self, event: str, key: str = "", example: str = None):
+        self.counts[(event, key)] += 1
+        if example is not None and len(self.examples[(event, key)]) < self.max_examples:
+            self.examples[(event, key)].append(example)
+        if self.verbose == "all" or event in self.verbose:
+            print(f"Warning({example}): {event} {key}" if example is not None else f"Warning: {event} {key}")
+
+    def merge(self, other: "Diagnostics"):
+        for event_key, count in other.counts.items():
+            self.counts[event_key] += count
+            examples = self.examples[event_key]
+            examples.extend(other.examples.get(event_key, [])[:self.max_examples - len(examples)])
+        return self
+
+    def clear(self):
+        self.counts.clear()
+        self.examples.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """{event: {"count": n, "keys": {key: {"count": n, "examples": [...]}}}}"""
+        report = {}
+        for (event, key), count in sorted(self.counts.items()):
+            entry = report.setdefault(event, {"count": 0, "keys": {}})
+            entry["count"] += count
+            entry["keys"][key] = {"count": count, "examples": self.examples.get((event, key), [])}
+        return report
+
+    def summary(self, max_keys: int = 5) -> str:
+        lines = []
+        for event, entry in self.to_dict().items():
+            lines.append(f"{entry['count']} {EVENTS.get(event, event)} [{event}]")
+            keys = sorted(entry["keys"].items(), key=lambda item: -item[1]["count"])
+            for key, info in keys[:max_keys]:
+                examples = ", ".join(str(example) for example in info["examples"])
+                lines.append(f"    {key or '-'}: {info['count']}" + (f" e.g. {examples}" if examples else ""))
+            if len(keys) > max_keys:
+                lines.append(f"    ... {len(keys) - max_keys} more keys")
+        return "\n".join(lines)
+
+    def report(self, path: str = None):
+        """Print the summary (if anything was recorded) and optionally write it as JSON."""
+        if self.counts:
+            print("Diagnostics:\n" + self.summary())
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=4)
+
+
+DIAGNOSTICS = Diagnostics()
+
+
+def configure(max_examples: int = None, verbose=None):
+    """Set how many examples are kept per event and which events are printed immediately."""
+    if max_examples is not None:
+        DIAGNOSTICS.max_examples = max_examples
+    if verbose is not None:
+        DIAGNOSTICS.verbose = verbose
+
+
+def record(event: str, key: str = "", example: str = None):
+    DIAGNOSTICS.record(event, key, example)
+
+
+def report(path: str = None, reset: bool = True):
+    """Print the run's summary, write it to path as JSON if given, and start over."""
+    DIAGNOSTICS.report(path)
+    if reset:
+        DIAGNOSTICS.clear()
+
+
+def collect(func, *args):
+    """Call func in a worker process, returning (result, events it recorded or None).
+
+    The parent passes the events to merge so pool runs report like serial ones.
+    """
+    global DIAGNOSTICS
+    outer = DIAGNOSTICS
+    DIAGNOSTICS = Diagnostics(outer.max_examples, outer.verbose)
+    try:
+        result = func(*args)
+        return result, (DIAGNOSTICS if DIAGNOSTICS.counts else None)
+    finally:
+        DIAGNOSTICS = outer
+
+
+def merge(events: Diagnostics):
+    if events is not None:
+        DIAGNOSTICS.merge(events)
@@ -0,0 +1,136 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.stats import skew, skewnorm
+from typing import Dict, Any, List
+
+TRIM_PERCENTILES = [10, 90]
+# Upper bound on the elements of one padded block, keeps memory flat for long series.
+BLOCK_ELEMENTS = 1 << 22
+
+FIT_FAILED = {"mu": 0, "sigma": 1, "a": 0, "loc": 0, "scale": 1, "label": "Fit Failed"}
+
+
+def gaussian_params(mu: float, sigma: float) -> Dict[str, Any]:
+    label = f'Gaussian Fit\n$\\mu$={mu:.3g}, $\\sigma$={sigma:.3g}'
+    return {"mu": mu, "sigma": sigma, "a": 0, "loc": mu, "scale": sigma, "label": label}
+
+
+def skewnorm_params(a: float, loc: float, scale: float) -> Dict[str, Any]:
+    label = f'Skew-Normal Fit\n$\\mu$={loc:.3g}, $\\sigma$={scale:.3g}'
+    return {"mu": loc, "sigma": scale, "a": a, "loc": loc, "scale": scale, "label": label}
+
+
+def pad_series(series: List[List[float]]) -> np.ndarray:
+    """(series, longest) matrix of the series, NaN after the end of each one."""
+    matrix = np.full((len(series), max((len(values) for values in series), default=0)), np.nan)
+    for row, values in enumerate(series):
+        matrix[row, :len(values)] = values
+    return matrix
+
+
+def trim_mask(matrix: np.ndarray) -> np.ndarray:
+    """Values between the 10th and 90th percentile of their own row (NaN padding excluded)."""
+    mask = np.zeros(matrix.shape, dtype=bool)
+    filled = ~np.isnan(matrix).all(axis=1)
+    if filled.any():
+        rows = matrix[filled]
+        if np.isnan(rows).any():
+            lo, hi = np.nanpercentile(rows, TRIM_PERCENTILES, axis=1)
+        else:
+            lo, hi = np.percentile(rows, TRIM_PERCENTILES, axis=1)
+        with np.errstate(invalid="ignore"):
+            mask[filled] = (lo[:, None] <= rows) & (rows <= hi[:, None])
+    return mask
+
+
+def trimmed_groups(matrix: np.ndarray, mask: np.ndarray):
+    """Yield (row indices, (rows, n) matrix of their trimmed values) per trimmed count n.
+
+    Rows with the same count are dense, so reductions along axis 1 give bit for bit what
+    the same reduction gives on each trimmed series alone (e.g. norm.fit).
+    """
+    count = mask.sum(axis=1)
+    for n in np.unique(count):
+        rows = np.flatnonzero(count == n)
+        yield rows, matrix[rows][mask[rows]].reshape(len(rows), n)
+
+
+def _moment_start(s, v, m):
+    """(a, loc, scale) from skewness, variance and mean, with the numpy scalar math skewnorm.fit uses."""
+    s = np.clip(s, -0.99, 0.99)
+    s_23 = np.abs(s) ** (2 / 3)
+    d = np.sign(s) * np.sqrt(np.pi / 2 * s_23 / (s_23 + ((4 - np.pi) / 2) ** (2 / 3)))
+    a = np.sqrt(np.divide(d ** 2, (1 - d ** 2))) * np.sign(s)
+    scale = np.sqrt(v / (1 - 2 * d ** 2 / np.pi))
+    return a, m - scale * d * np.sqrt(2 / np.pi), scale
+
+
+def skewnorm_starts(trimmed: np.ndarray):
+    """Method-of-moments (a, loc, scale) starting point of every row, as skewnorm.fit derives them.
+
+    Mean and variance are reduced over the whole matrix. Skewness and the closed form are
+    taken per row, because their vectorized forms can differ from skewnorm.fit's own in
+    the last bit, which moves the optimum of badly conditioned fits.
+    """
+    with np.errstate(all="ignore"):
+        return [_moment_start(skew(row), v, m) for row, v, m in zip(trimmed, np.var(trimmed, axis=1), trimmed.mean(axis=1))]
+
+
+def _fit_skewnorm(item):
+    values, start = item
+    if not np.all(np.isfinite(start)):
+        return skewnorm.fit(values)
+    a, loc, scale = start
+    return skewnorm.fit(values, a, loc=loc, scale=scale)
+
+
+def fit_batch(series: List[List[float]], use_skew: List[bool], workers: int = 1) -> List[Dict[str, Any]]:
+    """_fit_distribution for many series at once, returning the same parameter dicts.
+
+    Series are grouped by length into NaN-padded blocks and trimmed to their p10-p90
+    range block by block. Gaussian fits (mean and ddof-0 sigma, as norm.fit) are then
+    reductions over all series with the same trimmed length. Skew-normal fits need
+    scipy's optimizer; they start from moments computed the same way and run in a
+    process pool with workers > 1 (None means one per core).
+    """
+    fits = [None] * len(series)
+    skew_items = []
+    skew_rows = []
+    order = sorted(range(len(series)), key=lambda row: len(series[row]))
+    start = 0
+    while start < len(order):
+        width = max(len(series[order[start]]), 1)
+        stop = start + 1
+        while stop < len(order) and (stop - start + 1) * max(len(series[order[stop]]), 1) <= max(BLOCK_ELEMENTS, width):
+            stop += 1
+        block = order[start:stop]
+        start = stop
+
+        matrix = pad_series([series[row] for row in block])
+        for rows, trimmed in trimmed_groups(matrix, trim_mask(matrix)):
+            if trimmed.shape[1] == 0:
+                for k in rows:
+                    fits[block[k]] = dict(FIT_FAILED)
+                continue
+            skewed = np.array([use_skew[block[k]] for k in rows], dtype=bool)
+            mu = trimmed.mean(axis=1)
+            sigma = np.sqrt(((trimmed - mu[:, None]) ** 2).mean(axis=1))
+            for k, m, s in zip(rows[~skewed], mu[~skewed], sigma[~skewed]):
+                fits[block[k]] = gaussian_params(m, s)
+            if skewed.any():
+                for k, values, moment_start in zip(rows[skewed], trimmed[skewed], skewnorm_starts(trimmed[skewed])):
+                    skew_rows.append(block[k])
+                    skew_items.append((values, moment_start))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(skew_items) > 1:
+        chunksize = max(1, len(skew_items) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_fit_skewnorm, skew_items, chunksize=chunksize))
+    else:
+        results = [_fit_skewnorm(item) for item in skew_items]
+    for row, (a, loc, scale) in zip(skew_rows, results):
+        fits[row] = skewnorm_params(a, loc, scale)
+    return fits
@@ -0,0 +1,241 @@
+import numpy as np
+from collections import defaultdict
+from functools import lru_cache
+import criteria as criteria_rules
+import diagnostics
+import schema
+from typing import Dict, Any, List, Tuple
+
+GRADES = ["F", "B", "A"]
+
+# Criteria files from the loosest to the tightest, with the grade of a value that fails
+# each of them; values passing all of them get TOP_GRADE. Add entries to grade in more
+# bins, e.g. a "B-" file between spec and limits or a premium file after limits.
+TIERS = [("F", "spec.json"), ("B", "limits.json")]
+TOP_GRADE = "A"
+
+
+def _channel_block_specs(impedance: str) -> List[Dict[str, Any]]:
+    return [block for block in schema.SCHEMA
+            if block["kind"] == "channels" and impedance in block.get("graded", schema.IMPEDANCES)]
+
+
+@lru_cache(maxsize=None)
+def grading_plan() -> Dict[str, Any]:
+    """Everything util.get_grades checks, flattened into one list of measurements.
+
+    Measurements are grouped the way get_grades counts them in param_stats: one group per
+    block parameter (all channels together), per uniformity/dclvl/power_ldo value and per
+    gain_ratio list. Groups are contiguous so they can be reduced with np.*.reduceat.
+      columns        extractor column index of each measurement
+      criteria_keys  key looked up in spec.json/limits.json
+      group          group index of each measurement
+      row_keys       (row block, channel index, param index), orders the failure strings
+      styles         "block": per-channel block, B rows are dropped for parameters that are F
+                     "first_f": gain_ratio, rows stop at the first F
+                     "single": one value
+      stat_keys, presence, missing_is_f, starts   per group
+    """
+    extractor = schema.get_extractor()
+    index = {column: i for i, column in enumerate(extractor.columns)}
+    plan = {"columns": [], "criteria_keys": [], "group": [], "row_keys": [], "styles": [],
+            "stat_keys": [], "presence": [], "missing_is_f": [], "starts": []}
+    row_block = [0]
+
+    def add_group(stat_key, present, missing_is_f, style, items, block=None):
+        if block is None:
+            block = row_block[0]
+            row_block[0] += 1
+        plan["starts"].append(len(plan["columns"]))
+        plan["stat_keys"].append(stat_key)
+        plan["presence"].append(extractor.presence.get(present, -1))
+        plan["missing_is_f"].append(missing_is_f)
+        for column, criteria_key, position in items:
+            plan["columns"].append(index[column])
+            plan["criteria_keys"].append(criteria_key)
+            plan["group"].append(len(plan["stat_keys"]) - 1)
+            plan["row_keys"].append((block,) + position)
+            plan["styles"].append(style)
+
+    for impedance in schema.IMPEDANCES:
+        for b, block in enumerate(_channel_block_specs(impedance)):
+            key = block["key"].format(impedance=impedance)
+            column_impedance = impedance if "{impedance}" in block["key"] else None
+            # get_grades appends the uniformity and dclvl rows before the rows of the block itself.
+            if b < 2:
+                gain = "lg" if b == 1 else "hg"
+                for ukey in schema.UNIFORMITY_PARAMS:
+                    add_group(f"{gain}_{ukey}_{impedance}", key, True, "single",
+                              [((gain, None, ukey, impedance), f"{gain}_{ukey}_{impedance}", (0, 0))])
+            if key == f"results_baseline_{impedance}" and impedance == "25":
+                for ckey in schema.DCLVL_PARAMS:
+                    add_group(f"dclvl_sh_calib_{ckey}", schema.block_path(key, ["dclvl_sh_calib"]), False, "single",
+                              [(("dclvl_sh_calib", None, ckey, impedance), f"dclvl_sh_calib_{ckey}", (0, 0))])
+            g = key.split("_")[-1]
+            block_id = row_block[0]
+            row_block[0] += 1
+            for p, param in enumerate(block["params"]):
+                items = [(("channel", channel, param, column_impedance), f"{channel}_{param}_{impedance}", (c, p))
+                         for c, channel in enumerate(block["channels"])]
+                add_group(f"{param}_{impedance}_{g}", key, True, "block", items, block_id)
+
+        add_group(f"gain_ratio_{impedance}", f"gain_ratio_{impedance}", True, "first_f",
+                  [(("gain_ratio", None, idx, impedance), f"gain_ratio_{idx}_{impedance}", (idx, 0)) for idx in range(4)])
+
+        if impedance == "25":
+            ldo_block = next(block for block in schema.SCHEMA if block["key"] == "power_ldo")
+            for ldo_name, params in ldo_block["channels"].items():
+                for key in params:
+                    add_group(f"{ldo_name}_{key}_{impedance}", "power_ldo", True, "single",
+                              [(("power_ldo", ldo_name, key, None), f"{ldo_name}_{key}_{impedance}", (0, 0))])
+
+        present = schema.block_path(f"results_sum_uniformity_{impedance}", ["uniformity"])
+        for u in ["x1", "x3"]:
+            add_group(f"sum_{u}_uniformity_{impedance}", present, False, "single",
+                      [(("sum", None, f"{u}_uniformity", impedance), f"sum_{u}_uniformity_{impedance}", (0, 0))])
+
+    for name in ["columns", "group", "presence", "starts"]:
+        plan[name] = np.array(plan[name], dtype=np.int64)
+    plan["missing_is_f"] = np.array(plan["missing_is_f"], dtype=bool)
+    return plan
+
+
+def compile_criteria(criteria_keys: List[str], criterium: List[Dict[str, Dict[str, float]]]):
+    """Stack the min/max of every criteria file into (tiers, measurements) arrays.
+
+    Keys that are missing from a file accept every value, like util.is_within_criteria.
+    Also returns the keys that were missing from at least one file.
+    """
+    lo = np.full((len(criterium), len(criteria_keys)), -np.inf)
+    hi = np.full((len(criterium), len(criteria_keys)), np.inf)
+    missing = set()
+    for t, criteria in enumerate(criterium):
+        lo[t], hi[t], uncovered = criteria_rules.as_criteria(criteria).bounds(criteria_keys)
+        missing.update(uncovered)
+    return lo, hi, sorted(missing)
+
+
+def report_missing_criteria(criterium: List[Dict[str, Dict[str, float]]], names: List[str]):
+    """Record, once per file, the graded measurements each criteria file has no rule for."""
+    keys = grading_plan()["criteria_keys"]
+    for criteria, name in zip(criterium, names):
+        _, _, missing = criteria_rules.as_criteria(criteria).bounds(keys)
+        for key in missing:
+            diagnostics.record("missing_criteria", name, key)
+
+
+def measurement_matrix(measurements: Dict[str, Any], rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """(chips, columns) float matrix of the given extractor columns for the given cache rows."""
+    names = schema.get_extractor().names
+    matrix = np.full((len(rows), len(columns)), np.nan)
+    for j, column in enumerate(columns):
+        values = measurements["values"].get(names[column])
+        if values is not None:
+            matrix[:, j] = np.asarray(values)[rows]
+    return matrix
+
+
+def load_tiers(tiers: List[Tuple[str, str]] = TIERS, top_grade: str = TOP_GRADE) -> Tuple[List[Dict[str, Dict[str, float]]], List[str]]:
+    """Read the limit files of TIERS-style [(grade, path), ...] declarations.
+
+    Returns the criteria (see criteria.Criteria) in the given order and the grade names,
+    with top_grade appended for values that pass every file. Measurements a file has no
+    rule for are reported here, once.
+    """
+    criterium = [criteria_rules.load_criteria(path) for _, path in tiers]
+    report_missing_criteria(criterium, [path for _, path in tiers])
+    return criterium, [grade for grade, _ in tiers] + [top_grade]
+
+
+def grade_matrix(values: np.ndarray, present: np.ndarray, criterium: List[Dict[str, Dict[str, float]]],
+                 grades: List[str] = None) -> Dict[str, Any]:
+    """Grade every measurement of every chip at once against any number of criteria tiers.
+
+    criterium is ordered from the loosest limits to the tightest, grades names the tier of
+    a value that first fails criterium[t] and, last, the grade of a value that passes all
+    of them (default GRADES, i.e. [spec, limits] -> F, B, A). Every value is classified in
+    one pass over a (tiers, chips, measurements) comparison.
+
+    values is (chips, measurements) in grading_plan order, present is (chips, groups) and
+    tells whether the block of each group was found. Returns
+      tiers        (chips, measurements) index of the first criteria file the value fails,
+                   len(criterium) if it passes all of them or is missing
+      worst        (chips, groups) lowest tier of each group
+      chip_tiers   per chip, lowest tier over all measurements
+      tier_counts  (chips, tiers + 1) number of measurements of each chip in each tier
+      flags        chip_tiers - 1, i.e. -1 (F), 0 (B) or 1 (A) like util.get_grades for
+                   the two default files
+      param_stats  {stat key: {grade: count}}, for two files exactly like util.get_grades
+    """
+    plan = grading_plan()
+    n_tiers = len(criterium)
+    grades = list(grades) if grades is not None else GRADES
+    if len(grades) != n_tiers + 1:
+        raise ValueError(f"Expected {n_tiers + 1} grade names for {n_tiers} criteria files, got {grades}")
+    lo, hi, missing = compile_criteria(plan["criteria_keys"], criterium)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid="ignore"):
+        fails = ~((lo[:, None, :] <= values[None]) & (values[None] <= hi[:, None, :])) & valid[None]
+    tiers = np.where(fails.any(axis=0), fails.argmax(axis=0), n_tiers).astype(np.int8)
+
+    if len(values):
+        worst = np.minimum.reduceat(tiers, plan["starts"], axis=1)
+        any_valid = np.logical_or.reduceat(valid, plan["starts"], axis=1)
+    else:
+        worst = np.empty((0, len(plan["starts"])), dtype=np.int8)
+        any_valid = np.empty((0, len(plan["starts"])), dtype=bool)
+    counted = present & any_valid
+    chip_tiers = tiers.min(axis=1, initial=n_tiers).astype(np.int64)
+    tier_counts = np.stack([(tiers == t).sum(axis=1) for t in range(n_tiers + 1)], axis=1) if len(values) \
+        else np.zeros((0, n_tiers + 1), dtype=np.int64)
+
+    counts = [(counted & (worst == t)).sum(axis=0) for t in range(n_tiers + 1)]
+    counts[0] = counts[0] + ((~present) & plan["missing_is_f"]).sum(axis=0)
+    param_stats = defaultdict(lambda: {grade: 0 for grade in grades})
+    for g, stat_key in enumerate(plan["stat_keys"]):
+        for t, grade in enumerate(grades):
+            param_stats[stat_key][grade] += int(counts[t][g])
+    return {"values": values, "tiers": tiers, "worst": worst, "chip_tiers": chip_tiers, "tier_counts": tier_counts,
+            "flags": chip_tiers - 1, "param_stats": param_stats, "grades": grades, "missing_criteria": missing}
+
+
+def grade_cache(measurements: Dict[str, Any], rows: np.ndarray, criterium: List[Dict[str, Dict[str, float]]],
+                grades: List[str] = None) -> Dict[str, Any]:
+    """grade_matrix over the given rows of a cache (see cache.load_cache)."""
+    plan = grading_plan()
+    values = measurement_matrix(measurements, rows, plan["columns"])
+    present = np.ones((len(rows), len(plan["presence"])), dtype=bool)
+    has_presence = plan["presence"] >= 0
+    present[:, has_presence] = measurement_matrix(measurements, rows, plan["presence"][has_presence]) == 1.0
+    return grade_matrix(values, present, criterium, grades)
+
+
+def failure_rows(grades: Dict[str, Any], chip: int) -> List[str]:
+    """The "<criteria key>: <value> <grade>" strings util.get_grades appends for one chip.
+
+    Per-channel blocks only list the values at the worst tier of their parameter, and
+    gain_ratio stops at its first value in the lowest tier, as in get_grades.
+    """
+    plan = grading_plan()
+    tiers = grades["tiers"][chip]
+    worst = grades["worst"][chip]
+    names = grades["grades"]
+    first_f = {}
+    entries = []
+    for m in np.flatnonzero(tiers < len(names) - 1):
+        group = plan["group"][m]
+        style = plan["styles"][m]
+        tier = int(tiers[m])
+        if style == "block" and tier > worst[group]:
+            continue
+        if style == "first_f":
+            if group not in first_f:
+                members = np.flatnonzero(plan["group"] == group)
+                failed = members[tiers[members] == 0]
+                first_f[group] = failed[0] if len(failed) else len(tiers)
+            if m > first_f[group]:
+                continue
+        block, c, p = plan["row_keys"][m]
+        sort_key = (block, tier if style == "block" else 0, c, p)
+        entries.append((sort_key, f"{plan['criteria_keys'][m]}: {grades['values'][chip, m]} {names[tier]}"))
+    return [text for _, text in sorted(entries)]
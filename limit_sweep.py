@@ -0,0 +1,203 @@
+import fnmatch
+import json
+import numpy as np
+import criteria as criteria_rules
+import fitting
+import grading
+from typing import Dict, Any, List, Tuple
+
+
+def sweep_context(measurements: Dict[str, Any], rows: np.ndarray, tiers: List[Tuple[str, str]] = grading.TIERS,
+                  top_grade: str = grading.TOP_GRADE) -> Dict[str, Any]:
+    """Grade the given cache rows once against tiers, as the starting point of every sweep.
+
+    The last (tightest) file of tiers, limits.json by default, is the one swept; the
+    looser ones stay as they are. Returns the grading_plan keys, the (chips, measurements)
+    values, the tiers of grading.grade_cache, the grade names and loose, the tier of every
+    value against the looser files only (len(tiers) where it passes them).
+    """
+    criterium, grade_names = grading.load_tiers(tiers, top_grade)
+    grades = grading.grade_cache(measurements, rows, criterium, grade_names)
+    last = len(criterium) - 1
+    loose = np.where(grades["tiers"] < last, grades["tiers"], last + 1).astype(np.int8)
+    return {"keys": grading.grading_plan()["criteria_keys"], "values": grades["values"], "tiers": grades["tiers"],
+            "loose": loose, "grades": grade_names, "criterium": criterium, "paths": [path for _, path in tiers]}
+
+
+def _match(context: Dict[str, Any], pattern: str) -> np.ndarray:
+    """Measurement indices whose criteria key matches the shell-style pattern."""
+    return np.array([m for m, key in enumerate(context["keys"]) if fnmatch.fnmatchcase(key, pattern)], dtype=np.int64)
+
+
+def _split(context: Dict[str, Any], columns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per chip, the lowest tier of the swept columns against the looser files, and of all other columns."""
+    n_chips, n_meas = context["tiers"].shape
+    top = len(context["grades"]) - 1
+    others = np.ones(n_meas, dtype=bool)
+    others[columns] = False
+    swept = context["loose"][:, columns].min(axis=1, initial=top)
+    fixed = context["tiers"][:, others].min(axis=1, initial=top)
+    return swept, fixed
+
+
+def _yield_counts(lower: np.ndarray, inside: np.ndarray, n_grades: int) -> np.ndarray:
+    """(..., grades) chip counts per grade, from the chips' fixed tier and the inside counts.
+
+    lower is the tier every chip has whatever the swept limits are (top when it passes
+    everything else), inside the number of top chips within the swept limits per scenario.
+    """
+    top = n_grades - 1
+    fixed = np.bincount(lower, minlength=n_grades)
+    counts = np.zeros(inside.shape + (n_grades,), dtype=np.int64)
+    counts[..., :top - 1] = fixed[:top - 1]
+    counts[..., top] = inside
+    counts[..., top - 1] = fixed[top - 1] + fixed[top] - inside
+    return counts
+
+
+def _inside_grid(lows: np.ndarray, highs: np.ndarray, chip_lo: np.ndarray, chip_hi: np.ndarray) -> np.ndarray:
+    """(mins, maxs) number of chips with chip_lo >= min and chip_hi <= max, for every pair.
+
+    Every chip lands in one cell of a (mins + 1, maxs + 1) table by where its values sort
+    among the candidates; a suffix sum over the mins and a prefix sum over the maxs then
+    count all pairs at once, O(chips + mins * maxs).
+    """
+    lo_order, hi_order = np.argsort(lows), np.argsort(highs)
+    a = np.searchsorted(lows[lo_order], chip_lo, side="right")
+    b = np.searchsorted(highs[hi_order], chip_hi, side="left")
+    table = np.zeros((len(lows) + 1, len(highs) + 1), dtype=np.int64)
+    np.add.at(table, (a, b), 1)
+    suffix = table[::-1].cumsum(axis=0)[::-1]
+    inside = suffix[1:].cumsum(axis=1)[:, :len(highs)]
+    result = np.empty_like(inside)
+    result[np.ix_(lo_order, hi_order)] = inside
+    return result
+
+
+def sweep_grid(context: Dict[str, Any], pattern: str, lows: List[float], highs: List[float]) -> Dict[str, Any]:
+    """Yields for every (min, max) pair of candidate limits on the measurements matching pattern.
+
+    pattern is a criteria key or a shell-style pattern as in criteria rules, e.g.
+    "CH? HG_peaking_time_25"; all matching measurements get the same candidate limits and
+    every other measurement keeps its current ones. Returns
+      lows, highs  the candidates
+      param        (mins, maxs, grades) chips per grade of the matched measurements alone
+      overall      (mins, maxs, grades) chips per overall grade
+      grades       grade names, from the lowest
+    A pair with min > max fails every chip that has a matched value.
+    """
+    lows, highs = np.asarray(lows, dtype=float), np.asarray(highs, dtype=float)
+    columns = _match(context, pattern)
+    if not len(columns):
+        raise ValueError(f"No graded measurement matches {pattern}")
+    n_grades = len(context["grades"])
+    top = n_grades - 1
+    values = context["values"][:, columns]
+    # Missing values pass every candidate: +inf / -inf sort past all of them.
+    chip_lo = np.where(np.isnan(values), np.inf, values).min(axis=1)
+    chip_hi = np.where(np.isnan(values), -np.inf, values).max(axis=1)
+    swept, fixed = _split(context, columns)
+    overall = np.minimum(swept, fixed)
+    param_top = swept == top
+    overall_top = overall == top
+    return {"pattern": pattern, "lows": lows, "highs": highs, "grades": context["grades"],
+            "param": _yield_counts(swept, _inside_grid(lows, highs, chip_lo[param_top], chip_hi[param_top]), n_grades),
+            "overall": _yield_counts(overall, _inside_grid(lows, highs, chip_lo[overall_top], chip_hi[overall_top]), n_grades)}
+
+
+def fit_sigmas(context: Dict[str, Any], workers: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """mu and sigma of every measurement, fitted as plot_histograms does (see fitting.fit_batch).
+
+    Uniformity measurements get a skew-normal fit, whose loc and scale are used. Measurements
+    without values get NaN.
+    """
+    values = context["values"]
+    series = [column[~np.isnan(column)] for column in values.T]
+    fits = fitting.fit_batch(series, ['uniformity' in key.lower() for key in context["keys"]], workers)
+    mu = np.array([fit["mu"] for fit in fits], dtype=float)
+    sigma = np.array([fit["sigma"] for fit in fits], dtype=float)
+    empty = np.array([not len(s) for s in series])
+    mu[empty], sigma[empty] = np.nan, np.nan
+    return mu, sigma
+
+
+def sweep_sigma(context: Dict[str, Any], ks: List[float], mu: np.ndarray, sigma: np.ndarray,
+                pattern: str = "*") -> Dict[str, Any]:
+    """Yields with the limits of every measurement matching pattern set to mu -/+ k * sigma.
+
+    mu and sigma come from fit_sigmas. Every value needs a k of |value - mu| / sigma to
+    pass; a chip passes at every k at or above its largest one, so one sort of the chips
+    answers all ks. Measurements without a fit keep their current limits. Returns
+      ks        the candidates
+      param     (ks, measurements, grades) chips per grade of each matched measurement
+      overall   (ks, grades) chips per overall grade
+      keys      criteria keys of the matched measurements
+    """
+    ks = np.asarray(ks, dtype=float)
+    columns = _match(context, pattern)
+    columns = columns[np.isfinite(mu[columns]) & np.isfinite(sigma[columns])]
+    n_grades = len(context["grades"])
+    top = n_grades - 1
+    values = context["values"][:, columns]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        needed = np.abs(values - mu[columns]) / sigma[columns]
+    # Missing values pass every k, and a value right on a zero-sigma fit needs none.
+    needed[np.isnan(values)] = 0.0
+    needed[np.isnan(needed)] = 0.0
+
+    loose = context["loose"][:, columns]
+    param = np.empty((len(ks), len(columns), n_grades), dtype=np.int64)
+    for j in range(len(columns)):
+        eligible = loose[:, j] == top
+        inside = np.searchsorted(np.sort(needed[eligible, j]), ks, side="right")
+        param[:, j] = _yield_counts(loose[:, j], inside, n_grades)
+
+    swept, fixed = _split(context, columns)
+    overall = np.minimum(swept, fixed)
+    chip_k = needed.max(axis=1, initial=0.0)
+    inside = np.searchsorted(np.sort(chip_k[overall == top]), ks, side="right")
+    return {"pattern": pattern, "ks": ks, "keys": [context["keys"][m] for m in columns], "grades": context["grades"],
+            "param": param, "overall": _yield_counts(overall, inside, n_grades)}
+
+
+def sigma_limits(context: Dict[str, Any], k: float, mu: np.ndarray, sigma: np.ndarray,
+                 pattern: str = "*") -> Dict[str, Tuple[float, float]]:
+    """{criteria key: (min, max)} of mu -/+ k * sigma for the fitted measurements matching pattern."""
+    return {key: (float(mu[m] - k * sigma[m]), float(mu[m] + k * sigma[m])) for m, key in enumerate(context["keys"])
+            if fnmatch.fnmatchcase(key, pattern) and np.isfinite(mu[m]) and np.isfinite(sigma[m])}
+
+
+def best_limits(result: Dict[str, Any], min_yield: float, of: str = "overall") -> Tuple[float, float]:
+    """The (min, max) of a sweep_grid result with the narrowest window whose top-grade share
+    of all chips is at least min_yield, or None if no pair reaches it.
+
+    of is "overall" to rank by the chips' overall grade or "param" by the swept measurements alone.
+    """
+    counts = result[of]
+    share = counts[..., -1] / max(counts[0, 0].sum(), 1)
+    width = result["highs"][None, :] - result["lows"][:, None]
+    width = np.where((share >= min_yield) & (width >= 0), width, np.inf)
+    if not np.isfinite(width).any():
+        return None
+    i, j = np.unravel_index(np.argmin(width), width.shape)
+    return float(result["lows"][i]), float(result["highs"][j])
+
+
+def write_limits(path: str, proposal: Dict[str, Tuple[float, float]], base_path: str = "limits.json"):
+    """Write base_path with the limits of proposal ({criteria key or pattern: (min, max)}) applied.
+
+    Rule based files get one rule per entry, appended so it overrides earlier rules; in flat
+    files every graded key the entry matches is set.
+    """
+    with open(base_path, "r") as f:
+        data = json.load(f)
+    if "rules" in data and isinstance(data["rules"], list):
+        data["rules"].extend({"key": key, "min": lo, "max": hi} for key, (lo, hi) in proposal.items())
+    else:
+        keys = grading.grading_plan()["criteria_keys"]
+        for pattern, (lo, hi) in proposal.items():
+            for key in [key for key in keys if fnmatch.fnmatchcase(key, pattern)] or [pattern]:
+                data[key] = {"min": lo, "max": hi}
+    criteria_rules.as_criteria(data)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
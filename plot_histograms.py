@@ -1,165 +1,73 @@
 import json
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 from scipy.stats import fit, norm, skewnorm
 import numpy as np
-from datetime import datetime
 import util
+import cache
+import schema
+import diagnostics
+import prefilter
+import fitting
+import binning
+import artifacts
+import streaming
+import sketch
+import thermal
 from typing import Dict, Any, List, Tuple
 
 # Fixed number of bins (e.g., 20 bins)
 N_BINS = 40
+# x axis label of each parameter
+PARAM_UNITS = {
+    "baseline": "Baseline (mV)",
+    "noise_rms_mv": "noise rms (mV)",
+    "gain": "Gain ($\\Omega$)",
+    "eni": "ENI (nA)",
+    "peaking_time": "Peaking Time (ns)",
+    "max_non_linearity": "INL (%)",
+    "fit_gain": "Fit Gain ($\\Omega$)",
+    "gain_crude": "Gain Crude ($\\Omega$)",
+    "gain_uniformity": "Gain Uniformity (%)",
+    "peaking_time_uniformity": "Peaking Time Uniformity (%)",
+    "baseline_uniformity": "Baseline Uniformity (%)",
+    "i2c_frequency_list": "I2C Frequency (kHz)",
+    0: "Gain Ratio",
+    2: "Gain Ratio",
+    1: "Gain Ratio",
+    3: "Gain Ratio",
+    "voltage": "Voltage (mV)",
+    "current": "Current (mA)",
+    "i2c_margin_list": "dB",
+}
+# Grid mode: panel size (inches), most panels per row and resolution of the figure.
+GRID_PANEL_SIZE = (4, 3)
+GRID_COLUMNS = 4
+GRID_DPI = 150
 
-def read_json_files(file_paths, impedance):
-    # Define per-channel parameters (excluding uniformity)
-    channel_params = [
-        "baseline", "noise_rms_mv", "gain", "eni", 
-        "peaking_time", "max_non_linearity", "fit_gain", 
-        "gain_crude", "i2c_margin_list", "i2c_phase_list",
-        "residual", "slope_fit", "offset"
-    ]
-    
-    # List of channels found in the JSON files
-    channels = [
-        "CH0 HG", "CH1 HG", "CH2 HG", "CH3 HG", 
-        "CH0 LG", "CH1 LG", "CH2 LG", "CH3 LG", 
-        "SUM x3", "SUM x1", "LG0", "LG1", "LG2", "LG3", 
-        "HG0", "HG1", "HG2", "HG3", "400_kHz", "1_MHz"
-    ]
-    
-    # Initialize per-channel data storage
-    channel_values = {channel: {param: [] for param in channel_params} for channel in channels}
-    power_ldo_values = {}
-    gain_ratio_values = {0: [], 1: [], 2: [], 3: []}
-    uniformity_hg = {"gain_uniformity": [], "peaking_time_uniformity": [], "baseline_uniformity": []}
-    uniformity_lg = {"gain_uniformity": [], "peaking_time_uniformity": [], "baseline_uniformity": []}
-    dclvl = {"hg_lg": [], "sum_x1": [], "sum_x3": []}
-    s_n = []
-
-    def process_results(data, key_suffix, params):
-        if key_suffix in data:
-            results = data[key_suffix]
-            channel_list = results.get("channel_list", results.get("i2c_frequency_list", None))
-            if not channel_list:
-                print(f"Warning: Neither 'channel_list' nor 'i2c_frequency_list' found in {key_suffix}")
-                return
-            for idx, channel in enumerate(channel_list):
-                for param in params:
-                    if param in results:
-                        value = results[param]
-                        val = value[idx] if isinstance(value, list) else value
-                        if channel in channel_values and param in channel_values[channel]:
-                            channel_values[channel][param].append(val)
-
-    for file_path in file_paths:
-        with open(file_path, 'r') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from {file_path}: {e}")
-                continue
-                
-        if "test_time" in data:
-
-            date_parts = data["test_time"].split('_')[:3]  # ['13', '06', '25']
-            date_str = f"{date_parts[0]}-{date_parts[1]}-{date_parts[2]}"  # '13-06-25'
-            date_obj = datetime.strptime(date_str, "%d-%m-%y")  # dd-mm-yy
+def read_json_files(file_paths, impedance, cutoff=(6, 7)):
+    return read_json_files_multi(file_paths, [impedance], cutoff)[impedance]
 
-            # Define cutoff date (e.g., June 7, 2025)
-            cutoff_date = datetime(year=date_obj.year, month=6, day=7)
+def read_json_files_multi(file_paths, impedances=("25", "50"), cutoff=(6, 7)):
+    """Read every file once and extract all requested impedances from the same decode.
 
-            # Check if it's later
-            if date_obj < cutoff_date:
-                print(f"skipping file")
-                continue
-        else:
-            print(f"Warning: 'test_time' not found in {file_path}, skipping file")
-            continue
+    Returns {impedance: (channel_values, power_ldo_values, uniformity_hg, uniformity_lg,
+    gain_ratio_values, dclvl)}. Files tested before the (month, day) cutoff and older runs
+    of a serial are dropped by prefilter from their test_time and path alone, so only the
+    remaining files are decoded (and, for a file that does not decode, the serial's next
+    run, see prefilter.load_selected). Each document is flattened by the schema extractor, the
+    same one the cache and util.get_grades use.
+    """
+    extractor = schema.get_extractor()
+    rows = []
 
-        match = re.search(r'(\d{3}-\d{5})', file_path)
-        if not match:
-            match = re.search(r'(\d{3}-\s\d{5})', file_path)  # Handle cases with space
-        if match:
-            if match.group(1) not in s_n:
-                s_n.append(match.group(1))
-            else:
-                print(f"({file_path}): Duplicate serial number {match.group(1)} found")
-                continue
-        else:
-            match = re.search(r'(\d{8})', file_path)
-            if not match:
-                match = re.search(r'(\d{6})', file_path)
-            if match:
-                if match.group(1) not in s_n:
-                    s_n.append(match.group(1))
-                else:
-                    print(f"({file_path}): Duplicate serial number {match.group(1)} found")
-                    continue
-            else:
-                print(f"Warning({file_path}): No match found")
-                continue
+    for entry, data in prefilter.load_selected(file_paths, cutoff=cutoff):
+        rows.append(extractor.extract(data, entry.path))
 
-        # Process HG
-        key_hg = f"results_noise_{impedance}_all_ch_HG"
-        process_results(data, key_hg, ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-        if key_hg in data:
-            results = data[key_hg]
-            for key in uniformity_hg:
-                uniformity_hg[key].append(results.get(key))
-
-        # Process LG
-        key_lg = f"results_noise_{impedance}_all_ch_LG"
-        process_results(data, key_lg, ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-        if key_lg in data:
-            results = data[key_lg]
-            for key in uniformity_lg:
-                uniformity_lg[key].append(results.get(key))
-
-        # Process sum and linearity data
-        process_results(data, f"results_noise_{impedance}_sum_x3", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-        process_results(data, f"results_noise_{impedance}_sum_x1", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"])
-        process_results(data, f"results_linearity_{impedance}_sum_x3", ["max_non_linearity", "fit_gain"])
-        process_results(data, f"results_linearity_{impedance}_sum_x1", ["max_non_linearity", "fit_gain"])
-        process_results(data, f"results_linearity_{impedance}_all_ch_HG", ["max_non_linearity", "fit_gain"])
-        process_results(data, f"results_linearity_{impedance}_all_ch_LG", ["max_non_linearity", "fit_gain"])
-        process_results(data, f"results_channel_enable_{impedance}", ["gain_crude"])
-        process_results(data, "i2c_results", ["i2c_margin_list", "i2c_phase_list"])
-        process_results(data, f"results_baseline_{impedance}", ["residual", "slope_fit", "offset"])
-        if f"results_baseline_{impedance}" in data:
-            baseline_results = data[f"results_baseline_{impedance}"]
-            if "dclvl_sh_calib" in baseline_results:
-                c_results = baseline_results["dclvl_sh_calib"]
-                for key in dclvl:
-                    dclvl[key].append(c_results.get(key))
-
-        # Gain ratio
-        gain_ratio_key = f"gain_ratio_{impedance}"
-        if gain_ratio_key in data:
-            results = data[gain_ratio_key]
-            if isinstance(results, list):
-                for idx, value in enumerate(results):
-                    if idx in gain_ratio_values:
-                        gain_ratio_values[idx].append(value)
-            else:
-                print(f"Warning: Expected a list for {gain_ratio_key}, but found {type(results)}")
-
-        # Power LDO
-        if "power_ldo" in data:
-            for ldo in data["power_ldo"]:
-                ldo_name = ldo.get("name")
-                if not ldo_name:
-                    continue
-                if ldo_name not in power_ldo_values:
-                    power_ldo_values[ldo_name] = {}
-                for key, value in ldo.items():
-                    if key == "name":
-                        continue
-                    if key not in power_ldo_values[ldo_name]:
-                        power_ldo_values[ldo_name][key] = []
-                    power_ldo_values[ldo_name][key].append(value)
-
-    return channel_values, power_ldo_values, uniformity_hg, uniformity_lg, gain_ratio_values, dclvl
+    measurements = cache.measurements_from_rows(rows)
+    all_rows = np.arange(len(rows))
+    return {impedance: cache.collections_from_cache(measurements, all_rows, impedance) for impedance in impedances}
 
 def load_existing_xlim(output_directory, impedance):
     xlim_file_path = os.path.join(output_directory, f"limits.json")
@@ -170,19 +78,25 @@ def load_existing_xlim(output_directory, impedance):
 
 def _fit_distribution(values: List[float], use_skew: bool) -> Dict[str, Any]:
     """1. FIT: Fits data to a distribution and returns its parameters."""
-    p10, p90 = np.percentile(values, [10, 90])
-    filtered = [v for v in values if p10 <= v <= p90]
-    if not filtered:
-        return {"mu": 0, "sigma": 1, "a": 0, "loc": 0, "scale": 1, "label": "Fit Failed"}
-
-    if use_skew:
-        a, loc, scale = skewnorm.fit(filtered)
-        label = f'Skew-Normal Fit\n$\\mu$={loc:.3g}, $\\sigma$={scale:.3g}'
-        return {"mu": loc, "sigma": scale, "a": a, "loc": loc, "scale": scale, "label": label}
-    else:
-        mu, sigma = norm.fit(filtered)
-        label = f'Gaussian Fit\n$\\mu$={mu:.3g}, $\\sigma$={sigma:.3g}'
-        return {"mu": mu, "sigma": sigma, "a": 0, "loc": mu, "scale": sigma, "label": label}
+    return fitting.fit_batch([values], [use_skew])[0]
+
+def _items_to_plot(data_dict: Dict[Any, Any]) -> Dict[Tuple[Any, Any], List[float]]:
+    """Flatten {channel: {param: values}} and {param: values} into {(channel or None, param): values}."""
+    items_to_plot = {}
+    for outer_key, inner_data in data_dict.items():
+        if isinstance(inner_data, dict):
+            items_to_plot.update({(outer_key, k): v for k, v in inner_data.items()})
+        else:
+            items_to_plot[(None, outer_key)] = inner_data
+    return items_to_plot
+
+def _output_path(output_directory: str, impedance: str, label: str, key_prefix: str, outer_key: Any, param: Any,
+    grid: bool = False) -> str:
+    """Image a (channel, parameter) histogram goes to: its own, or its parameter's grid figure."""
+    if grid:
+        return os.path.join(output_directory, f"{label.lower()}_{param}_{impedance}_grid.png")
+    filename = f"{outer_key or key_prefix}_{param}_{impedance}_histogram.png".replace(f"_{key_prefix}", label.lower())
+    return os.path.join(output_directory, filename)
 
 def _prepare_canvas(xlim: Dict[str, float],  
     essentials: Dict[str, str],
@@ -190,13 +104,19 @@ def _prepare_canvas(xlim: Dict[str, float],
     config: Dict[str, Any]) -> Tuple[Any, Any, Any]:
     """2. PREPARE: Creates and returns the Matplotlib figure and axes."""
     fig, ax1 = plt.subplots(figsize=(10, 6))
-    ax1.set_xlim(xlim["min"], xlim["max"])
-    ax2 = ax1.twinx()
-    ax2.set_yticks([]) # The twin axis is for scaling only
-    
+    ax2 = _prepare_axes(ax1, xlim, essentials, spec_limits, config)
+
     # Set primary axis labels
     ax1.set_xlabel(config["x_axis_label"])
     ax1.set_ylabel('Count')
+    return fig, ax1, ax2
+
+def _prepare_axes(ax1: Any, xlim: Dict[str, float], essentials: Dict[str, str],
+    spec_limits: Dict[str, Any], config: Dict[str, Any]) -> Any:
+    """Window, grid and spec limit lines of one histogram axes; returns its density twin."""
+    ax1.set_xlim(xlim["min"], xlim["max"])
+    ax2 = ax1.twinx()
+    ax2.set_yticks([]) # The twin axis is for scaling only
     ax1.grid(True)
 
     # Plot specification limit lines
@@ -204,18 +124,30 @@ def _prepare_canvas(xlim: Dict[str, float],
         lim = spec_limits[essentials["full_key"]]
         ax1.axvline(x=lim["min"], color='r', ls='--', label=f'Min: {lim["min"]:.3g}')
         ax1.axvline(x=lim["max"], color='r', ls='--', label=f'Max: {lim["max"]:.3g}')
-    return fig, ax1, ax2
+    return ax2
 
 def _plot_on_canvas(
-    ax1: Any, ax2: Any, plot_values: List[float], bins: Any,
+    ax1: Any, ax2: Any, plot_values: List[float], bins: binning.Bins,
     fit_params: Dict[str, Any], config: Dict[str, Any]
 ):
-    """3. PLOT: Draws all data, fits, and lines onto the prepared axes."""
-    # Plot main histogram and the invisible scaling histogram
+    """3. PLOT: Draws all data, fits, and lines onto the prepared axes.
+
+    The values are binned once (or come binned in a streaming.BinAccumulator); ax1 shows
+    the counts and ax2 only takes the density range, which scales the fit curves.
+    Returns the counts and bin edges.
+    """
     color = config["color"]
     label = config["label"]
-    ax1.hist(plot_values, bins=bins, histtype='step', alpha=0.7, label=label, color=color, linewidth=3)
-    ax2.hist(plot_values, bins=bins, alpha=0, density=True)
+    if isinstance(plot_values, streaming.BinAccumulator):
+        counts, edges = plot_values.histogram()
+    else:
+        counts, edges = binning.histogram(plot_values, bins)
+    ax1.stairs(counts, edges, alpha=0.7, label=label, color=color, linewidth=3)
+    # Nothing to scale the density axis by when no value falls in the bins.
+    if counts.size and counts.sum():
+        density = counts / np.diff(edges).astype(float) / counts.sum()
+        ax2.update_datalim([(edges[0], 0), (edges[-1], density.max())])
+        ax2.autoscale_view()
 
     # Plot the fitted curve
     if config["show_fit"]:
@@ -223,11 +155,13 @@ def _plot_on_canvas(
         y_fit = (skewnorm.pdf(x_fit, fit_params["a"], fit_params["loc"], fit_params["scale"])
                  if config["use_skew"]
                  else norm.pdf(x_fit, fit_params["mu"], fit_params["sigma"]))
-        ax2.plot(x_fit, y_fit, 'k--', color=color, label=fit_params["label"])
+        ax2.plot(x_fit, y_fit, linestyle='--', color=color, label=fit_params["label"])
+    return counts, edges
 
 def _finalize_and_save_plot(fig: Any, ax1: Any, ax2: Any, filepath: str, title: str):
     """4. SAVE: Sets final touches like title/legend, then saves and closes."""
     ax1.set_title(title)
+    ax2.set_ylim(bottom=0)  # densities start at zero, like the bars of a density histogram
     
     # Combine legends from both axes into one
     lines1, labels1 = ax1.get_legend_handles_labels()
@@ -238,36 +172,163 @@ def _finalize_and_save_plot(fig: Any, ax1: Any, ax2: Any, filepath: str, title:
     plt.savefig(filepath, dpi=300)
     plt.close(fig)
 
+def _render_job(job: Dict[str, Any]) -> str:
+    """Draw and save one histogram figure, every label on the same canvas."""
+    # 1. Prepare the canvas from the first label's config
+    if "panels" in job:
+        return _render_grid(job)
+    fig, ax1, ax2 = _prepare_canvas(job["xlim"], job["essentials"], job["spec_limits"], job["layers"][0][3])
+    # 2. Plot all data onto the canvas
+    layers = _plot_layers(ax1, ax2, job["layers"])
+    # 3. Finalize and save the plot
+    _finalize_and_save_plot(fig, ax1, ax2, job["filepath"], job["title"])
+    _save_sidecar(job["filepath"], _sidecar_entry(job, layers))
+    return job["filepath"]
+
+def _render_grid(job: Dict[str, Any]) -> str:
+    """Draw and save one figure holding a histogram panel per channel of a parameter.
+
+    Panels keep their own bins and fits. All panels share the count axis and the panels
+    of a column share the x window (the union of their windows), so heights and
+    positions compare at a glance; the x label, the count label and the legend of the
+    labels are drawn once for the whole figure.
+    """
+    columns = min(len(job["panels"]), GRID_COLUMNS)
+    rows = -(-len(job["panels"]) // columns)
+    windows = {}
+    for n, panel in enumerate(job["panels"]):
+        lo, hi = windows.get(n % columns, (np.inf, -np.inf))
+        windows[n % columns] = (min(lo, panel["xlim"]["min"]), max(hi, panel["xlim"]["max"]))
+    panels = [dict(panel, xlim={"min": windows[n % columns][0], "max": windows[n % columns][1]})
+              for n, panel in enumerate(job["panels"])]
+    fig, axes = plt.subplots(rows, columns, figsize=(GRID_PANEL_SIZE[0] * columns, GRID_PANEL_SIZE[1] * rows),
+                             squeeze=False, sharex="col", sharey=True)
+    entries = []
+    for ax1, panel in zip(axes.flat, panels):
+        ax2 = _prepare_axes(ax1, panel["xlim"], panel["essentials"], panel["spec_limits"], panel["layers"][0][3])
+        entries.append(_sidecar_entry(panel, _plot_layers(ax1, ax2, panel["layers"])))
+        ax1.set_title(panel["essentials"]["panel"], fontsize=10)
+        ax2.set_ylim(bottom=0)
+        # Fit and spec limit labels differ per panel, so they get a small legend of their own.
+        spec_lines, spec_labels = ax1.get_legend_handles_labels()
+        spec = [(line, text) for line, text in zip(spec_lines, spec_labels) if text.startswith(("Min:", "Max:"))]
+        fit_lines, fit_labels = ax2.get_legend_handles_labels()
+        if spec or fit_lines:
+            ax2.legend([line for line, _ in spec] + fit_lines, [text for _, text in spec] + fit_labels,
+                       loc='upper right', fontsize=6)
+    for n in range(len(panels), rows * columns):
+        axes.flat[n].set_visible(False)
+        # The panel above is the last of its column, it shows the x ticks instead.
+        axes.flat[n - columns].xaxis.set_tick_params(labelbottom=True)
+
+    fig.suptitle(job["title"])
+    fig.supxlabel(panels[0]["layers"][0][3]["x_axis_label"])
+    fig.supylabel('Count')
+    # Every panel draws the same labels in the same colors, the first one stands for all.
+    data_lines, data_labels = axes.flat[0].get_legend_handles_labels()
+    data = [(line, text) for line, text in zip(data_lines, data_labels) if not text.startswith(("Min:", "Max:"))]
+    fig.legend([line for line, _ in data], [text for _, text in data], loc='upper right', fontsize=10)
+    fig.tight_layout()
+    fig.savefig(job["filepath"], dpi=GRID_DPI)
+    plt.close(fig)
+    _save_sidecar(job["filepath"], {"title": job["title"], "panels": entries})
+    return job["filepath"]
+
+def _plot_layers(ax1: Any, ax2: Any, layers: List[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+    """Draw every label of a histogram, returning the sidecar entries of the layers."""
+    entries = []
+    for values, bins, fit_params, config in layers:
+        counts, edges = _plot_on_canvas(ax1, ax2, values, bins, fit_params, config)
+        entries.append({"label": config["label"], "n": len(values), "counts": counts.tolist(), "edges": edges.tolist(),
+                        "underflow": bins.underflow, "overflow": bins.overflow,
+                        "fit": {key: value if isinstance(value, str) else float(value) for key, value in fit_params.items()}})
+    return entries
+
+def _sidecar_entry(job: Dict[str, Any], layers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"title": job["title"], "key": job["essentials"]["full_key"],
+            "xlim": {key: float(value) for key, value in job["xlim"].items()}, "layers": layers}
+
+def _save_sidecar(filepath: str, content: Dict[str, Any]):
+    """Write the counts, bin edges and fit parameters of a figure next to its image.
+
+    <image>.json holds the title, xlim and, per label, the number of values, the
+    histogram counts and edges (and whether the outer bins hold the outliers) and the
+    fit dict, so reports can use the binned data without the raw values. Grid figures
+    hold one such entry per panel under "panels".
+    """
+    with open(os.path.splitext(filepath)[0] + ".json", "w") as f:
+        json.dump(content, f)
+
+def _init_render_worker():
+    plt.switch_backend("Agg")
+
+def render_jobs(jobs: List[Dict[str, Any]], workers: int = 1) -> List[str]:
+    """Render figure jobs built by plot_histograms, returning the saved paths.
+
+    Every job holds everything its figure needs (values, bins, fit params, configs,
+    output path), so with workers > 1 (None means one per core) the figures are drawn by
+    a process pool on the non-interactive Agg backend. The images are byte-identical
+    to the serial ones.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(jobs) < 2:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as executor:
+        return list(executor.map(_render_job, jobs))
+
 def plot_histograms(
     data_collection: Dict[str, Dict[str, Any]], output_directory: str, root_directory: str,
-    impedance: str, label: str, key_prefix: str, xlimb: bool, show_fit: bool = False
+    impedance: str, label: str, key_prefix: str, xlimb: bool, show_fit: bool = False, workers: int = 1,
+    bin_rule: str = None, max_bins: int = binning.MAX_BINS, grid: bool = False
 ):
+    """One histogram per (channel, parameter), every label of data_collection overlaid.
+
+    With grid the histograms of all channels of a parameter are panels of one figure,
+    <label>_<param>_<impedance>_grid.png, instead of one image each.
+
+    Every image is keyed by its series, limits.json entries and plot settings (see
+    artifacts.artifact_key); only images whose key changed are fitted and drawn again.
+
+    With xlimb the bins span the data at N_BINS per fit window, or at the bin_rule
+    ("fd" or "scott", see binning.rule_widths) width when given; either way a plot has
+    at most max_bins bins, outliers past them are counted in under/overflow bins.
+    """
 
     # --- Initial Setup ---
     spec_limits = load_existing_xlim(root_directory, impedance) if xlimb else {}
 
-    channel_params_units = {
-    "baseline": "Baseline (mV)",            
-    "noise_rms_mv": "noise rms (mV)",
-    "gain": "Gain ($\\Omega$)",         
-    "eni": "ENI (nA)",                             
-    "peaking_time": "Peaking Time (ns)",                   
-    "max_non_linearity": "INL (%)",                 
-    "fit_gain": "Fit Gain ($\\Omega$)",                    
-    "gain_crude": "Gain Crude ($\\Omega$)",
-    "gain_uniformity": "Gain Uniformity (%)",
-    "peaking_time_uniformity": "Peaking Time Uniformity (%)",
-    "baseline_uniformity": "Baseline Uniformity (%)",
-    "i2c_frequency_list": "I2C Frequency (kHz)",
-    0: "Gain Ratio",
-    2: "Gain Ratio",
-    1: "Gain Ratio",
-    3: "Gain Ratio",
-    "voltage": "Voltage (mV)",
-    "current": "Current (mA)",
-    "i2c_margin_list": "dB",  
-    }
+    channel_params_units = PARAM_UNITS
     
+    # Key every image by what goes into it; up-to-date ones are skipped before any fitting.
+    index = artifacts.ArtifactIndex(output_directory)
+    settings = {"xlimb": xlimb, "show_fit": show_fit, "n_bins": N_BINS, "bin_rule": bin_rule, "max_bins": max_bins,
+                "grid": grid, "labels": list(data_collection)}
+    inputs = {}
+    for data_key, data_dict in data_collection.items():
+        for (outer_key, param), values in _items_to_plot(data_dict).items():
+            if values:
+                full_key = f"{outer_key or key_prefix}_{param}_{impedance}"
+                output = _output_path(output_directory, impedance, label, key_prefix, outer_key, param, grid)
+                inputs.setdefault(output, []).extend([data_key, full_key, values, spec_limits.get(full_key)])
+    keys = {output: artifacts.artifact_key(settings, *parts) for output, parts in inputs.items()}
+    stale = {output for output, key in keys.items() if not index.is_current(output, key)}
+
+    # Fit every series that still needs a histogram in one batch (see fitting.fit_batch).
+    requests = []
+    for data_key, data_dict in data_collection.items():
+        for (outer_key, param), values in _items_to_plot(data_dict).items():
+            full_key = f"{outer_key or key_prefix}_{param}_{impedance}"
+            output = _output_path(output_directory, impedance, label, key_prefix, outer_key, param, grid)
+            if values and output in stale:
+                requests.append(((data_key, outer_key, param), values, 'uniformity' in full_key.lower()))
+    batch = fitting.fit_batch([values for _, values, _ in requests], [use_skew for _, _, use_skew in requests], workers)
+    fits = {request[0]: fit for request, fit in zip(requests, batch)}
+    rule_widths = {}
+    if xlimb and bin_rule is not None:
+        widths = binning.rule_widths([values for _, values, _ in requests], bin_rule)
+        rule_widths = {request[0]: width for request, width in zip(requests, widths) if np.isfinite(width)}
+
     plot_values = []
     bins = []
     fit_params = []
@@ -278,12 +339,7 @@ def plot_histograms(
     i = 0
     for data_key, data_dict in data_collection.items():
 
-        items_to_plot = {}
-        for outer_key, inner_data in data_dict.items():
-            if isinstance(inner_data, dict):
-                items_to_plot.update({(outer_key, k): v for k, v in inner_data.items()})
-            else:
-                items_to_plot[(None, outer_key)] = inner_data
+        items_to_plot = _items_to_plot(data_dict)
             
         j = 0
         plot_values.append([])
@@ -295,19 +351,20 @@ def plot_histograms(
                 continue
         
             # --- Data Preparation Step ---
+            if _output_path(output_directory, impedance, label, key_prefix, outer_key, param, grid) not in stale:
+                continue
             if i == 0:
                 essentials.append({ 
                     "full_key": f"{outer_key or key_prefix}_{param}_{impedance}",
-                    "title": f"{param} for {outer_key}" if outer_key else f"{label} {param}"
+                    "title": f"{param} for {outer_key}" if outer_key else f"{label} {param}",
+                    "param": param, "panel": outer_key or f"{label} {param}",
                 })
-            filename = f"{essentials[j]['full_key']}_histogram.png".replace(f"_{key_prefix}", label.lower())
             if i == 0:
-                filepath.append(os.path.join(output_directory, filename))
-            if os.path.exists(filepath[j]):
-                continue
+                filepath.append(_output_path(output_directory, impedance, label, key_prefix, outer_key, param))
             
             use_skew = 'uniformity' in essentials[j]["full_key"].lower()
-            fit_params[i].append(_fit_distribution(values, use_skew))
+            fit = fits.get((data_key, outer_key, param))
+            fit_params[i].append(fit if fit is not None else _fit_distribution(values, use_skew))
             sigma = fit_params[i][j]["sigma"]
             mu = fit_params[i][j]["mu"]
             if sigma < 1e-9: # Use a small threshold to handle floating point inaccuracies
@@ -323,13 +380,14 @@ def plot_histograms(
                 xlim[j]["min"] = min(xlim[j]["min"], xlim_min)
                 xlim[j]["max"] = max(xlim[j]["max"], xlim_max)
             
-            bin_width = (xlim_max - xlim_min) / N_BINS
+            window_width = (xlim_max - xlim_min) / N_BINS
+            bin_width = rule_widths.get((data_key, outer_key, param), window_width)
         
-            plot_values[i].append([v for v in values if xlim[j]["min"] - 100 * bin_width <= v <= xlim[j]["max"] + 100 * bin_width])
-            if not plot_values[i][j]:
-                continue
-            bins[i].append(np.linspace(xlim_min, xlim_max, N_BINS) if not xlimb
-                    else np.arange(min(plot_values[i][j]), max(plot_values[i][j]) + bin_width, bin_width))
+            # Values more than 100 window widths out are counted in the outer bins, not spread over them.
+            plot_values[i].append(values)
+            bins[i].append(binning.Bins(np.linspace(xlim_min, xlim_max, N_BINS)) if not xlimb
+                    else binning.bounded_bins(values, bin_width, xlim[j]["min"], xlim[j]["max"], max_bins,
+                                              reach=100 * window_width))
                     
             plot_config[i].append({
                 "show_fit": show_fit, "use_skew": use_skew, "xlimb": xlimb, "label": data_key, "color": 'C0',
@@ -341,46 +399,180 @@ def plot_histograms(
 
     
     colorss = plt.cm.hsv(np.linspace(0, 0.77, i))
+    jobs = []
     for jj in range(0, j):
-        fig, ax1, ax2 = _prepare_canvas(xlim[jj], essentials[jj], spec_limits, plot_config[0][jj])
-
+        layers = []
         for ii in range(0, i):
-            # 2. Plot all data onto the canvas
             plot_config[ii][jj]["color"] = colorss[ii]
-            _plot_on_canvas(ax1, ax2, plot_values[ii][jj], bins[ii][jj], fit_params[ii][jj], plot_config[ii][jj])
-        
-        # 3. Finalize and save the plot
-        _finalize_and_save_plot(fig, ax1, ax2, filepath[jj], essentials[jj]["title"] + " - " + impedance)
+            layers.append((plot_values[ii][jj], bins[ii][jj], fit_params[ii][jj], plot_config[ii][jj]))
+        full_key = essentials[jj]["full_key"]
+        jobs.append({
+            "xlim": xlim[jj], "essentials": essentials[jj], "layers": layers, "filepath": filepath[jj],
+            "spec_limits": {full_key: spec_limits[full_key]} if full_key in spec_limits else {},
+            "title": essentials[jj]["title"] + " - " + impedance,
+        })
+    if grid:
+        panels = {}
+        for job in jobs:
+            panels.setdefault(job["essentials"]["param"], []).append(job)
+        jobs = [{"filepath": _output_path(output_directory, impedance, label, key_prefix, None, param, grid=True),
+                 "title": f"{label} {param} - {impedance}", "panels": param_jobs}
+                for param, param_jobs in panels.items()]
+    for output in render_jobs(jobs, workers):
+        index.update(output, keys[output])
+    index.save()
+
+
+def plot_streamed_histograms(accumulators: Dict[str, Dict[Tuple, streaming.BinAccumulator]], output_directory: str,
+    root_directory: str, impedance: str, show_fit: bool = False, workers: int = 1, grid: bool = False):
+    """plot_histograms for series binned by streaming.accumulate, every label overlaid.
+
+    accumulators is {label: {(impedance, group, key, param): BinAccumulator}}. The window
+    of each plot is the one its series were binned in; the fit overlay is the Gaussian of
+    the p10-p90 trimmed values, as in fitting.fit_batch, taken from the accumulator's
+    quantile sketch (no skew-normal fit, which needs the values themselves).
+    """
+    spec_limits = load_existing_xlim(root_directory, impedance)
+    index = artifacts.ArtifactIndex(output_directory)
+    labels = list(accumulators)
+    colors = plt.cm.hsv(np.linspace(0, 0.77, len(labels)))
+    names = sorted({name for series in accumulators.values() for name, accumulator in series.items()
+                    if name[0] == impedance and len(accumulator)}, key=str)
+    jobs, keys = [], {}
+    for _, group, outer_key, param in names:
+        label, key_prefix = streaming.GROUPS[group]
+        full_key = f"{outer_key or key_prefix}_{param}_{impedance}"
+        essentials = {"full_key": full_key, "title": f"{param} for {outer_key}" if outer_key else f"{label} {param}",
+                      "param": param, "panel": outer_key or f"{label} {param}"}
+        layers = []
+        for color, data_key in zip(colors, labels):
+            accumulator = accumulators[data_key].get((impedance, group, outer_key, param))
+            if accumulator is None or not len(accumulator):
+                continue
+            mu, sigma = accumulator.sketch.trimmed_moments(*fitting.TRIM_PERCENTILES)
+            layers.append((accumulator, accumulator.bins(), fitting.gaussian_params(mu, sigma), {
+                "show_fit": show_fit, "use_skew": False, "xlimb": True, "label": data_key, "color": color,
+                "x_axis_label": PARAM_UNITS.get(param, param)}))
+        first = layers[0][0]
+        jobs.append({
+            "xlim": {"min": first.edges[0], "max": first.edges[-1]}, "essentials": essentials, "layers": layers,
+            "filepath": _output_path(output_directory, impedance, label, key_prefix, outer_key, param),
+            "spec_limits": {full_key: spec_limits[full_key]} if full_key in spec_limits else {},
+            "title": essentials["title"] + " - " + impedance, "group": (label, key_prefix),
+        })
+    if grid:
+        panels = {}
+        for job in jobs:
+            panels.setdefault((job["group"], job["essentials"]["param"]), []).append(job)
+        jobs = [{"filepath": _output_path(output_directory, impedance, label, key_prefix, None, param, grid=True),
+                 "title": f"{label} {param} - {impedance}", "panels": param_jobs}
+                for ((label, key_prefix), param), param_jobs in panels.items()]
+
+    stale = []
+    for job in jobs:
+        parts = [(layer[3]["label"], *layer[0].histogram(), layer[0].n, layer[0].mean, layer[0].m2)
+                 for panel in job.get("panels", [job]) for layer in panel["layers"]]
+        limits = [panel["spec_limits"] for panel in job.get("panels", [job])]
+        keys[job["filepath"]] = artifacts.artifact_key("stream", show_fit, grid, limits, *[part for layer in parts for part in layer])
+        if not index.is_current(job["filepath"], keys[job["filepath"]]):
+            stale.append(job)
+    for output in render_jobs(stale, workers):
+        index.update(output, keys[output])
+    index.save()
 
+def main(root_directorys: Dict[str, any], output_directory, xlimb = False, cache_directory = None, workers = 1, diagnostics_path = None, cutoff = (6, 7), bin_rule = None, max_bins = binning.MAX_BINS, grid = False, stream = False, summary_path = None,
+         temperature_path = None):
+    """Histograms of every label in root_directorys, for both impedances.
 
-def main(root_directorys: Dict[str, any], output_directory, xlimb = False):
+    With stream (which needs xlimb), series that have a limits.json entry are binned as
+    the files are read, see streaming.accumulate, so memory depends on the number of bins
+    instead of the number of chips. Series without an entry are binned over the p1-p99
+    range of the quantile sketches of an existing cache in cache_directory (which is not
+    updated in this mode), or not plotted without one.
+
+    summary_path writes per-measurement quantiles of every label and of all labels
+    together as CSV (see sketch.site_summary), from the cache's or the stream's sketches.
+    temperature_path writes the board_temp regression of every graded measurement over
+    the selected runs of all labels as CSV (see thermal.cache_regression); without
+    cache_directory the files are decoded into an in-memory cache for it (see
+    cache.ingest). It is not available with stream.
+    """
     impedance = ["25", "50"]
     current_directory = "./"
-    for impedance_index in impedance:
-        os.makedirs(output_directory, exist_ok=True)
-   
+    os.makedirs(output_directory, exist_ok=True)
+    if stream:
+        if not xlimb:
+            raise ValueError("stream needs xlimb=True, the bins come from limits.json")
+        if temperature_path is not None:
+            raise ValueError("temperature_path needs the cached columns, it is not available with stream")
+        known = None
+        if cache_directory is not None and cache.cache_is_current(cache_directory):
+            known = sketch.merge_sketches(list(cache.load_sketches(cache_directory).values()))
+        windows = {}
+        for impedance_index in impedance:
+            windows.update(streaming.series_windows(load_existing_xlim(current_directory, impedance_index), [impedance_index],
+                                                    sketches=known))
+        accumulators = {}
+        for label, root_directory in root_directorys.items():
+            file_paths = sorted(cache.find_result_files(root_directory), key=util.extract_timestamp, reverse=True)
+            accumulators[label] = streaming.accumulate_files(file_paths, windows, cutoff)
+        for impedance_index in impedance:
+            plot_streamed_histograms(accumulators, output_directory, current_directory, impedance_index, workers=workers, grid=grid)
+        if summary_path is not None:
+            sketch.write_site_summary(summary_path, {label: {
+                f"{key or streaming.GROUPS[group][1]}_{param}_{impedance_index}": accumulator.sketch
+                for (impedance_index, group, key, param), accumulator in series.items()} for label, series in accumulators.items()})
+        diagnostics.report(diagnostics_path)
+        return
+    measurements = None
+    if cache_directory is not None:
+        measurements = cache.update_cache(root_directorys, cache_directory, workers=workers)
+    elif workers != 1 or temperature_path is not None:
+        # Decode the files of all labels at once (across the process pool with workers != 1).
+        measurements = cache.ingest(root_directorys, workers)
+
+    if summary_path is not None and cache_directory is not None:
+        sketch.write_site_summary(summary_path, cache.load_sketches(cache_directory))
+    if temperature_path is not None:
+        rows = np.concatenate([cache.select_rows(measurements, label, cutoff=cutoff) for label in root_directorys])
+        thermal.write_report(temperature_path, thermal.cache_regression(measurements, rows))
+
+    # Both impedances come out of a single pass over the files of each label.
+    collections = {impedance_index: {} for impedance_index in impedance}
+    for label, root_directory in root_directorys.items():
+        if measurements is not None:
+            rows = cache.select_rows(measurements, label, cutoff=cutoff)
+            for impedance_index in impedance:
+                collections[impedance_index][label] = cache.collections_from_cache(measurements, rows, impedance_index)
+            continue
         # Collect all results_all.json file paths.
+        file_paths = []
+        for dirpath, _, filenames in os.walk(root_directory):
+            if "results_all.json" in filenames:
+                file_paths.append(os.path.join(dirpath, "results_all.json"))
+
+        file_paths = sorted(file_paths, key=util.extract_timestamp, reverse=True)
+        for impedance_index, values in read_json_files_multi(file_paths, impedance, cutoff).items():
+            collections[impedance_index][label] = values
+
+    for impedance_index in impedance:
         channel_values = {}
         power_ldo_values = {}
         uniformity_hg = {}
         uniformity_lg = {}
         gain_ratio_values = {}
         dclvl = {}
-        for label, root_directory in root_directorys.items():
-            file_paths = []
-            for dirpath, _, filenames in os.walk(root_directory):
-                if "results_all.json" in filenames:
-                    file_paths.append(os.path.join(dirpath, "results_all.json"))
-        
-            file_paths = sorted(file_paths, key=util.extract_timestamp, reverse=True)
-            channel_values[label], power_ldo_values[label], uniformity_hg[label], uniformity_lg[label], gain_ratio_values[label], dclvl[label] = read_json_files(file_paths, impedance_index)
-   
-        plot_histograms(channel_values, output_directory, current_directory, impedance_index, "Channel", "channel", xlimb)
-        plot_histograms(power_ldo_values, output_directory, current_directory, impedance_index, "Power_LDO", "power_ldo", xlimb)
-        plot_histograms(uniformity_hg, output_directory, current_directory, impedance_index, "HG", "hg", xlimb)
-        plot_histograms(uniformity_lg, output_directory, current_directory, impedance_index, "LG", "lg", xlimb)
-        plot_histograms(dclvl, output_directory, current_directory, impedance_index, "dclvl_sh_calib", "dclvl_sh_calib", xlimb)
-        plot_histograms(gain_ratio_values, output_directory, current_directory, impedance_index, "Gain_Ratio", "gain_ratio", xlimb)
+        for label, values in collections[impedance_index].items():
+            channel_values[label], power_ldo_values[label], uniformity_hg[label], uniformity_lg[label], gain_ratio_values[label], dclvl[label] = values
+
+        plot_histograms(channel_values, output_directory, current_directory, impedance_index, "Channel", "channel", xlimb, workers=workers, bin_rule=bin_rule, max_bins=max_bins, grid=grid)
+        plot_histograms(power_ldo_values, output_directory, current_directory, impedance_index, "Power_LDO", "power_ldo", xlimb, workers=workers, bin_rule=bin_rule, max_bins=max_bins, grid=grid)
+        plot_histograms(uniformity_hg, output_directory, current_directory, impedance_index, "HG", "hg", xlimb, workers=workers, bin_rule=bin_rule, max_bins=max_bins, grid=grid)
+        plot_histograms(uniformity_lg, output_directory, current_directory, impedance_index, "LG", "lg", xlimb, workers=workers, bin_rule=bin_rule, max_bins=max_bins, grid=grid)
+        plot_histograms(dclvl, output_directory, current_directory, impedance_index, "dclvl_sh_calib", "dclvl_sh_calib", xlimb, workers=workers, bin_rule=bin_rule, max_bins=max_bins, grid=grid)
+        plot_histograms(gain_ratio_values, output_directory, current_directory, impedance_index, "Gain_Ratio", "gain_ratio", xlimb, workers=workers, bin_rule=bin_rule, max_bins=max_bins, grid=grid)
+    # One summary of everything skipped or missing, instead of a line per file.
+    diagnostics.report(diagnostics_path)
 
 if __name__ == '__main__':
     root_directory = {"BNL robot": "../July/", "BNL manual": "../0603_0611/", "IJC robot": "../2025-08/"}  # Update with your actual root directory.
@@ -0,0 +1,132 @@
+import json
+import re
+import util
+import diagnostics
+import registry
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+TEST_TIME_PATTERN = re.compile(rb'"test_time"\s*:\s*"([^"]*)"')
+CHUNK_SIZE = 4096
+
+
+class HeaderEntry(NamedTuple):
+    """What is known about a results_all.json without decoding it."""
+    path: str
+    serial: str
+    timestamp: int
+    test_time: str
+
+
+def read_test_time(file_path: str, chunk_size: int = CHUNK_SIZE):
+    """test_time of a results_all.json, read from the raw bytes without decoding the document.
+
+    test_time is normally the first field, so one small read is enough; otherwise the
+    file is scanned chunk by chunk until it turns up. Returns None if the file has none.
+    """
+    tail = b""
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            buffer = tail + chunk
+            match = TEST_TIME_PATTERN.search(buffer)
+            if match:
+                return match.group(1).decode()
+            # Keep enough of the end to match a field split across two reads.
+            tail = buffer[-64:]
+    return None
+
+
+def build_index(file_paths: List[str]) -> List[HeaderEntry]:
+    """(path, serial, path timestamp, test_time) of every file, in the given order."""
+    return [HeaderEntry(file_path, util.extract_serial(file_path), util.extract_timestamp(file_path), read_test_time(file_path))
+            for file_path in file_paths]
+
+
+def _dated(entries: List[HeaderEntry], cutoff: Tuple[int, int] = None) -> List[HeaderEntry]:
+    """Entries with a test_time on or after the cutoff."""
+    dated = []
+    for entry in entries:
+        if entry.test_time is None:
+            diagnostics.record("missing_test_time", "", entry.path)
+            continue
+        if cutoff is not None and util.before_cutoff(entry.test_time, cutoff):
+            diagnostics.record("before_cutoff", f"{cutoff[0]:02d}-{cutoff[1]:02d}", entry.path)
+            continue
+        dated.append(entry)
+    return dated
+
+
+def _pick(entries: List[HeaderEntry], policy: str) -> Tuple[registry.SerialRegistry, List[HeaderEntry]]:
+    """The registry of entries and the one entry per serial it keeps with policy, in input order."""
+    runs = registry.SerialRegistry()
+    for entry in entries:
+        if runs.add(entry.path, entry.timestamp, entry.test_time, serial=entry.serial) is None:
+            diagnostics.record("no_serial", "", entry.path)
+    kept = {run.path for run in runs.select(policy)}
+    return runs, [entry for entry in entries if entry.path in kept]
+
+
+def _select_dated(dated: List[HeaderEntry], policy: str) -> List[HeaderEntry]:
+    if policy is None:
+        return dated
+    runs, kept = _pick(dated, policy)
+    for run in runs.duplicates(policy):
+        diagnostics.record("duplicate_serial", run.serial, run.path)
+    return kept
+
+
+def _serial(entry: HeaderEntry) -> str:
+    """The serial the registry files an entry under."""
+    return registry.normalize_serial(entry.serial) if entry.serial else registry.serial_from_path(entry.path)
+
+
+def select(entries: List[HeaderEntry], cutoff: Tuple[int, int] = None, policy: str = "latest") -> List[HeaderEntry]:
+    """Entries that survive the same checks the readers apply after a full decode.
+
+    Files without test_time or tested before (month, day) of their own year (when cutoff
+    is given) are dropped, then one run per serial number is kept with a
+    registry.SerialRegistry policy ("latest" or "first"; None keeps every run). Entries
+    are returned in their input order.
+    """
+    return _select_dated(_dated(entries, cutoff), policy)
+
+
+def prefilter(file_paths: List[str], cutoff: Tuple[int, int] = None, policy: str = "latest") -> List[HeaderEntry]:
+    """select(build_index(file_paths)): the files worth decoding."""
+    return select(build_index(file_paths), cutoff, policy)
+
+
+def read_documents(file_paths: List[str]) -> Iterator[Optional[Dict[str, Any]]]:
+    """Decoded document of every file, one at a time; None (and a json_error) if it does not decode."""
+    for file_path in file_paths:
+        with open(file_path, 'r') as f:
+            try:
+                yield json.load(f)
+            except json.JSONDecodeError as e:
+                diagnostics.record("json_error", e.msg, file_path)
+                yield None
+
+
+def load_selected(file_paths: List[str], load: Callable[[List[str]], Iterable[Any]] = read_documents,
+                  cutoff: Tuple[int, int] = None, policy: str = "latest") -> Iterator[Tuple[HeaderEntry, Any]]:
+    """(entry, result) of every file prefilter keeps, with result from load.
+
+    load takes a list of paths and returns (or yields) one result per path, None for a
+    file that cannot be used, e.g. because it does not decode. The serial of such a file
+    is then loaded from its next run by policy, so the selection agrees with
+    cache.select_rows, which only ever sees the decodable runs. Replacements come after
+    the first pick, each round in input order.
+    """
+    dated = _dated(build_index(file_paths), cutoff)
+    selected = _select_dated(dated, policy)
+    tried = set()
+    while selected:
+        failed = set()
+        for entry, result in zip(selected, load([entry.path for entry in selected])):
+            if result is None:
+                failed.add(_serial(entry))
+            else:
+                yield entry, result
+        if policy is None or not failed:
+            return
+        tried.update(entry.path for entry in selected)
+        _, selected = _pick([entry for entry in dated if entry.path not in tried and _serial(entry) in failed], policy)
@@ -0,0 +1,101 @@
+import re
+import numpy as np
+from typing import Dict, Any, List, NamedTuple
+
+# Tried in order on the path; the space variant is normalized to "ddd-ddddd".
+SERIAL_PATTERNS = [re.compile(r'(\d{3}-\d{5})'), re.compile(r'(\d{3}-\s\d{5})'), re.compile(r'(\d{8})'), re.compile(r'(\d{6})')]
+POLICIES = ["latest", "first", "best"]
+
+
+def normalize_serial(serial: str) -> str:
+    return re.sub(r'\s+', '', serial)
+
+
+def serial_from_path(file_path: str):
+    """Normalized serial number in a run's path, None if there is none."""
+    for pattern in SERIAL_PATTERNS:
+        match = pattern.search(file_path)
+        if match:
+            return normalize_serial(match.group(1))
+    return None
+
+
+class Run(NamedTuple):
+    """One test run of a chip; index is the order it was added to the registry in."""
+    index: int
+    serial: str
+    path: str
+    timestamp: int
+    test_time: str
+    grade: str
+
+
+class SerialRegistry:
+    """All runs of every chip, keyed by normalized serial number.
+
+    select picks one run per serial with a policy instead of relying on the order the
+    files were visited in:
+      latest  highest path timestamp (the newest run, what the tools used to keep)
+      first   lowest path timestamp
+      best    best grade, the newest run among equally graded ones
+    Ties go to the run added first, so with newest-first paths "latest" keeps exactly
+    the run the old first-seen dedup kept.
+    """
+
+    def __init__(self, grades: List[str] = ("F", "B", "A")):
+        self.grade_rank = {grade: rank for rank, grade in enumerate(grades)}
+        self.runs = {}
+        self.count = 0
+
+    def add(self, file_path: str, timestamp: int = 0, test_time: str = None, grade: str = None, serial: str = None):
+        """Register a run, returning it, or None if its path has no serial number."""
+        serial = normalize_serial(serial) if serial else serial_from_path(file_path)
+        if serial is None:
+            return None
+        run = Run(self.count, serial, file_path, timestamp, test_time, grade)
+        self.runs.setdefault(serial, []).append(run)
+        self.count += 1
+        return run
+
+    def __contains__(self, serial) -> bool:
+        return serial is not None and normalize_serial(serial) in self.runs
+
+    def __len__(self) -> int:
+        return len(self.runs)
+
+    def serials(self) -> List[str]:
+        return list(self.runs)
+
+    def history(self, serial: str) -> List[Run]:
+        """Every run of a serial, oldest first."""
+        return sorted(self.runs.get(normalize_serial(serial), []), key=lambda run: (run.timestamp, run.index))
+
+    def choose(self, runs: List[Run], policy: str = "latest") -> Run:
+        if policy == "latest":
+            return min(runs, key=lambda run: (-run.timestamp, run.index))
+        if policy == "first":
+            return min(runs, key=lambda run: (run.timestamp, run.index))
+        if policy == "best":
+            return min(runs, key=lambda run: (-self.grade_rank.get(run.grade, -1), -run.timestamp, run.index))
+        raise ValueError(f"Unknown selection policy {policy}, expected one of {POLICIES}")
+
+    def select(self, policy: str = "latest") -> List[Run]:
+        """One run per serial, in the order the runs were added."""
+        return sorted((self.choose(runs, policy) for runs in self.runs.values()), key=lambda run: run.index)
+
+    def duplicates(self, policy: str = "latest") -> List[Run]:
+        """The runs select does not keep, in the order they were added."""
+        kept = {run.index for run in self.select(policy)}
+        return [run for runs in self.runs.values() for run in runs if run.index not in kept]
+
+    @classmethod
+    def from_cache(cls, cache: Dict[str, Any], rows: np.ndarray = None) -> "SerialRegistry":
+        """Registry of the given rows (all by default) of a cache from cache.load_cache."""
+        meta = cache["meta"]
+        rows = np.arange(len(meta["path"])) if rows is None else rows
+        registry = cls()
+        for path, serial, timestamp, test_time in zip(np.asarray(meta["path"])[rows], np.asarray(meta["serial"])[rows],
+                                                      np.asarray(meta["timestamp"])[rows], np.asarray(meta["test_time"])[rows]):
+            if serial:
+                registry.add(str(path), int(timestamp), str(test_time), serial=str(serial))
+        return registry
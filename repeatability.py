@@ -0,0 +1,79 @@
+import numpy as np
+import grading
+from typing import Dict, Any, List, Tuple
+
+
+def retest_groups(measurements: Dict[str, Any], rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Group cache rows by serial number.
+
+    Returns the rows ordered by serial and then test_time, the chip index of each of
+    them, the start of every chip's contiguous block (for np.*.reduceat) and the serials.
+    Rows without a serial number are left out.
+    """
+    meta = measurements["meta"]
+    rows = rows[np.asarray(meta["serial"])[rows] != ""]
+    serials, chip = np.unique(np.asarray(meta["serial"])[rows], return_inverse=True)
+    order = np.lexsort((np.asarray(meta["test_time"])[rows], chip))
+    rows, chip = rows[order], chip[order]
+    starts = np.flatnonzero(np.r_[True, chip[1:] != chip[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    return rows, chip, starts, serials
+
+
+def repeatability(measurements: Dict[str, Any], rows: np.ndarray, criterium: List[Dict[str, Dict[str, float]]],
+                  grades: List[str] = None) -> Dict[str, Any]:
+    """Repeatability of every graded measurement, estimated from the retests of each chip.
+
+    rows should keep every run (cache.select_rows(..., dedup=False)). Per measurement,
+    in grading_plan order, a one-way random-effects ANOVA over chips gives
+      within      pooled variance of the runs of a chip around the chip's mean
+      between     variance of the true chip values, (MS_between - MS_within) / n0, >= 0
+      sigma       repeatability sigma, sqrt(within)
+      window      width of the spec window, criterium[0] max - min (inf if open)
+      sigma_ratio 6 * sigma / window, the share of the spec window eaten by retest noise
+      flips       consecutive runs of the same chip graded differently (grading.grade_matrix
+                  tiers), out of pairs runs with both values present
+    plus runs, chips and retested (chips with more than one valid run) counts. Everything is
+    computed with reductions over the serial-sorted (runs, measurements) matrix.
+    """
+    plan = grading.grading_plan()
+    rows, chip, starts, serials = retest_groups(measurements, rows)
+    n_meas = len(plan["criteria_keys"])
+    result = {"keys": plan["criteria_keys"], "serials": serials}
+    values = grading.measurement_matrix(measurements, rows, plan["columns"])
+    valid = ~np.isnan(values)
+    if not len(rows):
+        empty = np.zeros(n_meas)
+        return dict(result, runs=empty, chips=empty, retested=empty, mean=empty * np.nan, within=empty * np.nan,
+                    between=empty * np.nan, sigma=empty * np.nan, window=empty * np.nan, sigma_ratio=empty * np.nan,
+                    flips=empty, pairs=empty, flip_rate=empty * np.nan)
+
+    filled = np.where(valid, values, 0.0)
+    n_g = np.add.reduceat(valid, starts, axis=0).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_g = np.add.reduceat(filled, starts, axis=0) / n_g
+        deviation = np.where(valid, values - mean_g[chip], 0.0)
+        ss_within = (deviation ** 2).sum(axis=0)
+        n = n_g.sum(axis=0)
+        k = (n_g > 0).sum(axis=0)
+        df_within = n - k
+        grand = filled.sum(axis=0) / n
+        ss_between = np.nansum(n_g * (mean_g - grand) ** 2, axis=0)
+        ms_within = ss_within / df_within
+        ms_between = ss_between / (k - 1)
+        n0 = (n - (n_g ** 2).sum(axis=0) / n) / (k - 1)
+        between = np.maximum((ms_between - ms_within) / n0, 0.0)
+        sigma = np.sqrt(ms_within)
+
+        lo, hi, _ = grading.compile_criteria(plan["criteria_keys"], criterium[:1])
+        window = hi[0] - lo[0]
+        sigma_ratio = 6 * sigma / window
+
+    tiers = grading.grade_matrix(values, np.ones((len(rows), len(plan["starts"])), dtype=bool), criterium, grades)["tiers"]
+    same_chip = (chip[1:] == chip[:-1])[:, None]
+    pairs = same_chip & valid[1:] & valid[:-1]
+    flips = pairs & (tiers[1:] != tiers[:-1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        flip_rate = flips.sum(axis=0) / pairs.sum(axis=0)
+    return dict(result, runs=n, chips=k, retested=(n_g > 1).sum(axis=0), mean=grand, within=ms_within,
+                between=between, sigma=sigma, window=window, sigma_ratio=sigma_ratio,
+                flips=flips.sum(axis=0), pairs=pairs.sum(axis=0), flip_rate=flip_rate)
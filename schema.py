@@ -0,0 +1,188 @@
+import numpy as np
+import diagnostics
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple
+
+IMPEDANCES = ["25", "50"]
+
+NOISE_PARAMS = ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"]
+UNIFORMITY_PARAMS = ["gain_uniformity", "peaking_time_uniformity", "baseline_uniformity"]
+DCLVL_PARAMS = ["hg_lg", "sum_x1", "sum_x3"]
+
+HG_CHANNELS = ["CH0 HG", "CH1 HG", "CH2 HG", "CH3 HG"]
+LG_CHANNELS = ["CH0 LG", "CH1 LG", "CH2 LG", "CH3 LG"]
+ENABLE_CHANNELS = ["SUM x1", "SUM x3", "LG0", "LG1", "LG2", "LG3", "HG0", "HG1", "HG2", "HG3"]
+I2C_CHANNELS = ["400_kHz", "1_MHz"]
+# power_ldo records by name, with the fields read from each.
+POWER_LDO_RAILS = {"1V2": ["voltage", "current"], "2V5": ["voltage", "current"], "pwr_total_mw": ["power"]}
+
+# Every block the tools read from results_all.json, in the order util.get_grades grades them.
+#   key:        block key, "{impedance}" is expanded for every entry of IMPEDANCES
+#   kind:       "channels" - per-channel values, a list indexed like the block's channel_list
+#                            (or i2c_frequency_list), or a scalar shared by all channels
+#               "fields"   - scalar fields of the block
+#               "list"     - positional values of a list, params name the positions
+#               "records"  - list of dicts identified by their "name" (power_ldo); records
+#                            or fields not listed are reported as "unknown_record"
+#   channels:   channel names for "channels", {name: params} for "records"
+#   params:     parameter names (positions for "list")
+#   path:       nested keys to follow inside the block before reading values
+#   group:      collection the values belong to, see cache.collections_from_cache
+#   graded:     impedances util.get_grades checks this block for
+SCHEMA = [
+    {"key": "results_noise_{impedance}_all_ch_HG", "kind": "channels", "channels": HG_CHANNELS, "params": NOISE_PARAMS, "group": "channel"},
+    {"key": "results_noise_{impedance}_all_ch_LG", "kind": "channels", "channels": LG_CHANNELS, "params": NOISE_PARAMS, "group": "channel"},
+    {"key": "results_noise_{impedance}_sum_x3", "kind": "channels", "channels": ["SUM x3"], "params": NOISE_PARAMS, "group": "channel"},
+    {"key": "results_noise_{impedance}_sum_x1", "kind": "channels", "channels": ["SUM x1"], "params": NOISE_PARAMS, "group": "channel"},
+    {"key": "results_linearity_{impedance}_sum_x3", "kind": "channels", "channels": ["SUM x3"], "params": ["max_non_linearity", "fit_gain"], "group": "channel"},
+    {"key": "results_linearity_{impedance}_sum_x1", "kind": "channels", "channels": ["SUM x1"], "params": ["max_non_linearity", "fit_gain", "peaking_time_std"], "group": "channel"},
+    {"key": "results_linearity_{impedance}_all_ch_HG", "kind": "channels", "channels": HG_CHANNELS, "params": ["max_non_linearity", "fit_gain"], "group": "channel"},
+    {"key": "results_linearity_{impedance}_all_ch_LG", "kind": "channels", "channels": LG_CHANNELS, "params": ["max_non_linearity", "fit_gain"], "group": "channel"},
+    {"key": "results_channel_enable_{impedance}", "kind": "channels", "channels": ENABLE_CHANNELS, "params": ["gain_crude"], "group": "channel", "graded": ["25"]},
+    {"key": "results_baseline_{impedance}", "kind": "channels", "channels": ENABLE_CHANNELS, "params": ["residual", "slope_fit", "offset"], "group": "channel", "graded": ["25"]},
+    {"key": "i2c_results", "kind": "channels", "channels": I2C_CHANNELS, "params": ["i2c_margin_list", "i2c_phase_list"], "group": "channel", "graded": ["25"]},
+    {"key": "results_noise_{impedance}_all_ch_HG", "kind": "fields", "params": UNIFORMITY_PARAMS, "group": "hg"},
+    {"key": "results_noise_{impedance}_all_ch_LG", "kind": "fields", "params": UNIFORMITY_PARAMS, "group": "lg"},
+    {"key": "results_baseline_{impedance}", "kind": "fields", "path": ["dclvl_sh_calib"], "params": DCLVL_PARAMS, "group": "dclvl_sh_calib"},
+    {"key": "gain_ratio_{impedance}", "kind": "list", "params": [0, 1, 2, 3], "group": "gain_ratio"},
+    {"key": "results_sum_uniformity_{impedance}", "kind": "list", "path": ["uniformity"], "params": ["x1_uniformity", "x3_uniformity"], "group": "sum"},
+    {"key": "power_ldo", "kind": "records", "channels": POWER_LDO_RAILS, "group": "power_ldo"},
+]
+
+
+def column_name(group: str, key, param, impedance: str) -> str:
+    """Measurement id of a column, in the same format as the spec.json/limits.json keys.
+
+    Impedance-independent columns (impedance None) take the 25 ohm suffix the criteria
+    files use for them. Block presence columns are named "present:<block key>".
+    """
+    if group == "present":
+        return f"present:{key}"
+    return f"{key or group}_{param}_{impedance or '25'}"
+
+
+def _as_float(value) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return np.nan
+    return float(value)
+
+
+def block_path(key: str, path: List[str]) -> str:
+    """Name of a (possibly nested) block, e.g. "results_baseline_25/dclvl_sh_calib"."""
+    return "/".join([key] + list(path))
+
+
+def channel_blocks(impedance: str) -> List[Tuple[str, List[str]]]:
+    """(block key, params) of the per-channel blocks graded at this impedance, in grading order."""
+    return [(block["key"].format(impedance=impedance), block["params"]) for block in SCHEMA
+            if block["kind"] == "channels" and impedance in block.get("graded", IMPEDANCES)]
+
+
+class Extractor:
+    """Flat, precompiled form of SCHEMA.
+
+    columns[i] is the (group, key, param, impedance) of position i in every row returned
+    by extract; values that are missing from a document are NaN. Every block also gets a
+    ("present", block path, None, None) column that is 1.0 when the block is found with
+    the expected type, which tells a missing block apart from a missing parameter.
+    """
+
+    def __init__(self, schema: List[Dict[str, Any]]):
+        self.columns = []
+        self.blocks = []
+        self.presence = {}
+        for block in schema:
+            impedances = IMPEDANCES if "{impedance}" in block["key"] else [None]
+            for impedance in impedances:
+                key = block["key"].format(impedance=impedance)
+                kind = block["kind"]
+                present = block_path(key, block.get("path", []))
+                if present not in self.presence:
+                    self.presence[present] = self._add("present", present, None, None)
+                if kind == "channels":
+                    entries = [(param, [(channel, self._add(block["group"], channel, param, impedance)) for channel in block["channels"]])
+                               for param in block["params"]]
+                elif kind == "records":
+                    entries = {name: [(param, self._add(block["group"], name, param, impedance)) for param in params]
+                               for name, params in block["channels"].items()}
+                else:
+                    entries = [(i if kind == "list" else param, self._add(block["group"], None, param, impedance))
+                               for i, param in enumerate(block["params"])]
+                self.blocks.append((key, block.get("path", []), kind, entries, self.presence[present]))
+        self.width = len(self.columns)
+        self.names = [column_name(*column) for column in self.columns]
+
+    def _add(self, group, key, param, impedance) -> int:
+        self.columns.append((group, key, param, impedance))
+        return len(self.columns) - 1
+
+    def extract(self, data: Dict[str, Any], source: str = None) -> np.ndarray:
+        """Map one results_all.json document to a fixed-width row.
+
+        source (the file path) is the example diagnostics gives for records the schema
+        does not know, which have no column and are left out of the row.
+        """
+        row = np.full(self.width, np.nan)
+        for key, path, kind, entries, present in self.blocks:
+            results = data.get(key)
+            for step in path:
+                results = results.get(step) if isinstance(results, dict) else None
+            if results is None:
+                continue
+
+            if kind == "channels":
+                if not isinstance(results, dict):
+                    continue
+                row[present] = 1.0
+                channel_list = results.get("channel_list", results.get("i2c_frequency_list", None))
+                if not channel_list:
+                    continue
+                position = {channel: idx for idx, channel in enumerate(channel_list)}
+                for param, columns in entries:
+                    value = results.get(param)
+                    if value is None:
+                        continue
+                    if isinstance(value, list):
+                        for channel, col in columns:
+                            idx = position.get(channel)
+                            if idx is not None and idx < len(value):
+                                row[col] = _as_float(value[idx])
+                    else:
+                        value = _as_float(value)
+                        for channel, col in columns:
+                            if channel in position:
+                                row[col] = value
+            elif kind == "fields":
+                if isinstance(results, dict):
+                    row[present] = 1.0
+                    for param, col in entries:
+                        row[col] = _as_float(results.get(param))
+            elif kind == "list":
+                if isinstance(results, list):
+                    row[present] = 1.0
+                    for idx, col in entries:
+                        if idx < len(results):
+                            row[col] = _as_float(results[idx])
+            elif kind == "records":
+                if not isinstance(results, list):
+                    continue
+                row[present] = 1.0
+                for record in results:
+                    if not isinstance(record, dict):
+                        continue
+                    name = record.get("name")
+                    params = entries.get(name)
+                    if params is None:
+                        diagnostics.record("unknown_record", f"{key}/{name}", source)
+                        continue
+                    for param, col in params:
+                        row[col] = _as_float(record.get(param))
+                    for field in record.keys() - {"name"} - {param for param, _ in params}:
+                        diagnostics.record("unknown_record", f"{key}/{name}/{field}", source)
+        return row
+
+
+@lru_cache(maxsize=None)
+def get_extractor() -> Extractor:
+    """The Extractor compiled from SCHEMA, built once per process."""
+    return Extractor(SCHEMA)
@@ -0,0 +1,185 @@
+import csv
+import math
+import numpy as np
+from typing import Dict, Any, List, Tuple
+
+# Size of the top compactor; rank error is about 1.7 / SKETCH_K of the count.
+SKETCH_K = 200
+SUMMARY_QUANTILES = [0.01, 0.1, 0.5, 0.9, 0.99]
+
+
+class QuantileSketch:
+    """KLL quantile sketch of one series.
+
+    Values are kept in levels of compactors; an item of level h stands for 2**h values.
+    A full level is sorted and every other item (alternating offsets, so results are
+    reproducible) moves up one level. Memory stays around 3 * k items whatever the
+    number of values, series below k values are kept exactly, and sketches of the same
+    k merge into one for the union of their values (files, workers, sites).
+    """
+
+    def __init__(self, k: int = SKETCH_K):
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.flips = 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _capacity(self, level: int) -> int:
+        return max(math.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items = np.sort(self.levels[level])
+                if len(items) % 2:
+                    # An odd item stays behind, so the weight of the level is conserved.
+                    self.levels[level] = [float(items[-1])]
+                    items = items[:-1]
+                else:
+                    self.levels[level] = []
+                self.levels[level + 1].extend(items[self.flips % 2::2].tolist())
+                self.flips += 1
+            level += 1
+
+    def update(self, value: float):
+        self.levels[0].append(float(value))
+        self.n += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        # Feed at most one compactor's worth at a time, so no level grows without bound.
+        step = max(self._capacity(0), 2)
+        for start in range(0, len(values), step):
+            self.levels[0].extend(values[start:start + step].tolist())
+            self._compress()
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.k != self.k:
+            raise ValueError("Cannot merge sketches of a different k")
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted retained items and the number of values each one stands for."""
+        values = np.concatenate([np.asarray(items, dtype=float) for items in self.levels])
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], weights[order]
+
+    def quantiles(self, qs) -> np.ndarray:
+        """Values at the quantiles qs (0..1): the smallest item whose cumulative weight reaches q of the total."""
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        if not self.n:
+            return np.full(len(qs), np.nan)
+        values, weights = self.weighted()
+        cumulative = np.cumsum(weights)
+        index = np.searchsorted(cumulative, qs * cumulative[-1], side="left")
+        result = values[np.minimum(index, len(values) - 1)]
+        result[qs <= 0] = self.min
+        result[qs >= 1] = self.max
+        return result
+
+    def quantile(self, q: float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def trimmed_moments(self, lo: float = 10, hi: float = 90) -> Tuple[float, float]:
+        """(mean, ddof-0 sigma) of the values between the lo-th and hi-th percentiles, inclusive.
+
+        The sketch counterpart of the p10-p90 trimming fitting.fit_batch applies to raw series.
+        """
+        if not self.n:
+            return np.nan, np.nan
+        low, high = self.quantiles([lo / 100, hi / 100])
+        values, weights = self.weighted()
+        inside = (values >= low) & (values <= high)
+        if not inside.any():
+            return np.nan, np.nan
+        mean = np.average(values[inside], weights=weights[inside])
+        return float(mean), float(np.sqrt(np.average((values[inside] - mean) ** 2, weights=weights[inside])))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "n": self.n, "min": self.min if self.n else None, "max": self.max if self.n else None,
+                "flips": self.flips, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(data["k"])
+        sketch.levels = [list(items) for items in data["levels"]] or [[]]
+        sketch.n = data["n"]
+        sketch.min = data["min"] if data["min"] is not None else np.inf
+        sketch.max = data["max"] if data["max"] is not None else -np.inf
+        sketch.flips = data.get("flips", 0)
+        return sketch
+
+
+def sketch_columns(columns: Dict[str, np.ndarray], k: int = SKETCH_K) -> Dict[str, QuantileSketch]:
+    """A sketch of every column of values (NaN = missing)."""
+    sketches = {}
+    for name, values in columns.items():
+        sketches[name] = QuantileSketch(k)
+        sketches[name].update_many(values)
+    return sketches
+
+
+def merge_sketches(parts: List[Dict[str, QuantileSketch]]) -> Dict[str, QuantileSketch]:
+    """Merge {name: sketch} dicts, e.g. of several sites, into new sketches."""
+    merged = {}
+    for part in parts:
+        for name, sketch in part.items():
+            if name not in merged:
+                merged[name] = QuantileSketch(sketch.k)
+            merged[name].merge(sketch)
+    return merged
+
+
+def site_summary(sketches: Dict[str, Dict[str, QuantileSketch]], quantiles: List[float] = SUMMARY_QUANTILES) -> List[Dict[str, Any]]:
+    """Per measurement, one row per site and one for all sites together.
+
+    sketches is {site: {measurement: sketch}}, e.g. cache.load_sketches. Rows hold the
+    count, min, max and the requested quantiles (p10 etc.) of the site's values.
+    """
+    combined = merge_sketches(list(sketches.values()))
+    rows = []
+    for name in sorted(combined):
+        for site, sketch in list((site, part.get(name)) for site, part in sketches.items()) + [("all", combined[name])]:
+            if sketch is None or not len(sketch):
+                continue
+            row = {"measurement": name, "site": site, "n": sketch.n, "min": sketch.min, "max": sketch.max}
+            row.update({f"p{q * 100:g}": value for q, value in zip(quantiles, sketch.quantiles(quantiles))})
+            rows.append(row)
+    return rows
+
+
+def write_site_summary(path: str, sketches: Dict[str, Dict[str, QuantileSketch]], quantiles: List[float] = SUMMARY_QUANTILES):
+    """site_summary as a CSV file."""
+    rows = site_summary(sketches, quantiles)
+    fields = ["measurement", "site", "n", "min"] + [f"p{q * 100:g}" for q in quantiles] + ["max"]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,234 @@
+import json
+import os
+from collections import deque
+import numpy as np
+import cache
+import diagnostics
+import schema
+from typing import Dict, Any, List, NamedTuple
+
+# Values used to estimate the in-control mean and sigma before any alert is raised.
+WARMUP = 20
+# EWMA weight of the newest value and width of its control limits, in sigmas.
+EWMA_LAMBDA = 0.2
+EWMA_L = 3.0
+# CUSUM slack and decision interval, in sigmas.
+CUSUM_K = 0.5
+CUSUM_H = 5.0
+# Width of the individual-value limits, in sigmas.
+SHEWHART_L = 3.0
+ROLLING_WINDOW = 20
+# Groups monitored by default: the per-channel parameters (baseline, gain, peaking_time...).
+GROUPS = ["channel"]
+STATE_NAME = "spc_state.json"
+
+
+class Alert(NamedTuple):
+    series: str
+    index: int
+    time: str
+    rule: str
+    value: float
+    statistic: float
+
+
+class ControlChart:
+    """EWMA, CUSUM, individual-value and rolling-mean control chart of one series.
+
+    Every update is O(1): the in-control mean and sigma are Welford moments of the first
+    warmup values (unless given as target), the EWMA and the two one-sided CUSUMs are
+    recursions, the EWMA limit factor (1 - lambda)**(2i) is carried along and the rolling
+    mean keeps a running sum of its window. The whole state is a few numbers and the
+    window, see to_dict.
+    """
+
+    def __init__(self, name: str = "", target: float = None, sigma: float = None, warmup: int = WARMUP,
+                 ewma_lambda: float = EWMA_LAMBDA, ewma_l: float = EWMA_L, cusum_k: float = CUSUM_K,
+                 cusum_h: float = CUSUM_H, shewhart_l: float = SHEWHART_L, window: int = ROLLING_WINDOW):
+        self.name = name
+        self.warmup = warmup
+        self.ewma_lambda, self.ewma_l = ewma_lambda, ewma_l
+        self.cusum_k, self.cusum_h = cusum_k, cusum_h
+        self.shewhart_l = shewhart_l
+        self.n = 0
+        self.seen = 0
+        self.mean, self.m2 = 0.0, 0.0
+        self.target, self.sigma = target, sigma
+        self.ewma = target
+        self.decay = 1.0
+        self.cusum_high, self.cusum_low = 0.0, 0.0
+        self.recent = deque(maxlen=window)
+        self.recent_sum = 0.0
+
+    @property
+    def ready(self) -> bool:
+        """True once the in-control mean and sigma are known."""
+        return self.target is not None and self.sigma is not None
+
+    @property
+    def rolling_mean(self) -> float:
+        return self.recent_sum / len(self.recent) if self.recent else np.nan
+
+    def ewma_limits(self):
+        """(low, high) EWMA control limits at the current point."""
+        if not self.ready:
+            return np.nan, np.nan
+        width = self.ewma_l * self.sigma * np.sqrt(self.ewma_lambda / (2 - self.ewma_lambda) * (1 - self.decay))
+        return self.target - width, self.target + width
+
+    def _roll(self, value: float):
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_sum -= self.recent[0]
+        self.recent.append(value)
+        self.recent_sum += value
+
+    def update(self, value: float, time: str = "") -> List[Alert]:
+        """Add the next value; returns the alerts it raises. Missing (NaN) values are skipped."""
+        index = self.seen
+        self.seen += 1
+        if value != value:
+            return []
+        self._roll(value)
+        if not self.ready:
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (value - self.mean)
+            if self.n >= self.warmup:
+                self.target = self.mean if self.target is None else self.target
+                self.sigma = np.sqrt(self.m2 / (self.n - 1)) if self.sigma is None else self.sigma
+                self.ewma = self.target
+            return []
+
+        alerts = []
+        self.decay *= (1 - self.ewma_lambda) ** 2
+        self.ewma = self.ewma_lambda * value + (1 - self.ewma_lambda) * self.ewma
+        if self.sigma > 0:
+            z = (value - self.target) / self.sigma
+            if abs(z) > self.shewhart_l:
+                alerts.append(Alert(self.name, index, time, "shewhart", value, float(z)))
+            low, high = self.ewma_limits()
+            if not low <= self.ewma <= high:
+                alerts.append(Alert(self.name, index, time, "ewma", value, float((self.ewma - self.target) / self.sigma)))
+            self.cusum_high = max(0.0, self.cusum_high + z - self.cusum_k)
+            self.cusum_low = max(0.0, self.cusum_low - z - self.cusum_k)
+            for rule in ("cusum_high", "cusum_low"):
+                if getattr(self, rule) > self.cusum_h:
+                    alerts.append(Alert(self.name, index, time, rule, value, float(getattr(self, rule))))
+                    # Restart the CUSUM so a lasting shift raises one alert per decision interval.
+                    setattr(self, rule, 0.0)
+        return alerts
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = {name: getattr(self, name) for name in ("name", "warmup", "ewma_lambda", "ewma_l", "cusum_k", "cusum_h",
+                                                          "shewhart_l", "n", "seen", "mean", "m2", "target", "sigma",
+                                                          "ewma", "decay", "cusum_high", "cusum_low", "recent_sum")}
+        state["window"] = self.recent.maxlen
+        state["recent"] = list(self.recent)
+        return {name: float(value) if isinstance(value, np.floating) else value for name, value in state.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ControlChart":
+        chart = cls(data["name"], warmup=data["warmup"], ewma_lambda=data["ewma_lambda"], ewma_l=data["ewma_l"],
+                    cusum_k=data["cusum_k"], cusum_h=data["cusum_h"], shewhart_l=data["shewhart_l"], window=data["window"])
+        for name in ("n", "seen", "mean", "m2", "target", "sigma", "ewma", "decay", "cusum_high", "cusum_low", "recent_sum"):
+            setattr(chart, name, data[name])
+        chart.recent.extend(data["recent"])
+        return chart
+
+
+def chart_series(values: List[float], name: str = "", **settings) -> Dict[str, Any]:
+    """Run a fresh ControlChart over a whole series, for plotting.
+
+    Returns per point the EWMA, its low and high control limits and the rolling mean (NaN
+    before the chart is ready or at missing values), the chart's target and sigma and its
+    alerts. settings are ControlChart arguments.
+    """
+    chart = ControlChart(name, **settings)
+    series = {name: np.full(len(values), np.nan) for name in ("ewma", "low", "high", "rolling")}
+    alerts = []
+    for i, value in enumerate(values):
+        value = np.nan if value is None else float(value)
+        alerts.extend(chart.update(value))
+        if chart.ready and value == value:
+            series["ewma"][i] = chart.ewma
+            series["low"][i], series["high"][i] = chart.ewma_limits()
+            series["rolling"][i] = chart.rolling_mean
+    return dict(series, target=chart.target, sigma=chart.sigma, alerts=alerts)
+
+
+class SPCMonitor:
+    """ControlCharts of every monitored measurement, fed one result at a time.
+
+    The state (the charts, the paths of the results already fed and the newest test_time
+    seen) is kept in spc_state.json in the state directory, so each run only feeds the
+    results that are new since the previous one, in test_time order; nothing is recomputed
+    over the history. A result older than one already fed is still charted and recorded in
+    diagnostics as "spc_out_of_order". Alerts are returned and recorded as "spc_alert".
+    """
+
+    def __init__(self, state_directory: str, groups: List[str] = GROUPS, **settings):
+        self.path = os.path.join(state_directory, STATE_NAME)
+        self.settings = settings
+        self.charts: Dict[str, ControlChart] = {}
+        self.last_time = None
+        self.fed = set()
+        self._fed_until = None
+        extractor = schema.get_extractor()
+        self.columns = [(i, extractor.names[i]) for i, (group, _, _, _) in enumerate(extractor.columns) if group in groups]
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            self.last_time = state["last_time"]
+            self.fed = set(state.get("fed", []))
+            # States saved before the fed paths were kept only know the newest test_time.
+            self._fed_until = None if "fed" in state else self.last_time
+            self.charts = {name: ControlChart.from_dict(data) for name, data in state["charts"].items()}
+
+    def update(self, row: np.ndarray, time: str = "", source: str = None) -> List[Alert]:
+        """Feed one extractor row (see schema.Extractor.extract); O(1) per monitored measurement."""
+        alerts = []
+        for column, name in self.columns:
+            if name not in self.charts:
+                self.charts[name] = ControlChart(name, **self.settings)
+            alerts.extend(self.charts[name].update(float(row[column]), time))
+        for alert in alerts:
+            diagnostics.record("spc_alert", f"{alert.series} {alert.rule}", source or time)
+        if source is not None:
+            self.fed.add(source)
+        if time and not np.isnat(np.datetime64(time)):
+            if self.last_time is not None and np.datetime64(time) < np.datetime64(self.last_time):
+                diagnostics.record("spc_out_of_order", "", source or time)
+            else:
+                self.last_time = time
+        return alerts
+
+    def update_from_cache(self, measurements: Dict[str, Any], label: str = None) -> List[Alert]:
+        """Feed the cache rows (of label) not fed yet, oldest first and those without a
+        test_time last, then save the state so the next call skips them."""
+        meta = measurements["meta"]
+        rows = cache.select_rows(measurements, label, dedup=False)
+        times = np.asarray(meta["test_time"])[rows]
+        paths = [str(path) for path in np.asarray(meta["path"])[rows]]
+        if self._fed_until is not None:
+            self.fed.update(path for path, time in zip(paths, times <= np.datetime64(self._fed_until)) if time)
+            self._fed_until = None
+        keep = np.array([path not in self.fed for path in paths], dtype=bool)
+        rows, times = rows[keep], times[keep]
+        # argsort puts NaT last.
+        order = np.argsort(times, kind="stable")
+        names = schema.get_extractor().names
+        alerts = []
+        for row, time in zip(rows[order], times[order]):
+            values = np.full(len(names), np.nan)
+            for column, name in self.columns:
+                column_values = measurements["values"].get(name)
+                if column_values is not None:
+                    values[column] = column_values[row]
+            alerts.extend(self.update(values, str(time), str(meta["path"][row])))
+        self.save()
+        return alerts
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump({"last_time": self.last_time, "fed": sorted(self.fed), "charts": {name: chart.to_dict() for name, chart in self.charts.items()}}, f)
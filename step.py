@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
 import numpy as np
-import json
 import util
+import grading
+import diagnostics
 import os
 from sklearn.neighbors import KernelDensity
 
@@ -11,34 +12,19 @@ def get_step_data(x_values):
     y_step = [0] + list(range(1, len(xx) + 1))
     return x_step, y_step
 
-def get_values(file_paths, criteria_file_path1, criteria_file_path2):
-    with open(criteria_file_path1, 'r') as f:
-        criteria1 = json.load(f)
-    with open(criteria_file_path2, 'r') as f:
-        criteria2 = json.load(f)
+def get_values(file_paths, criteria_file_path1, criteria_file_path2, workers = 1, diagnostics_path = None):
+    (criteria1, criteria2), _ = grading.load_tiers([("F", criteria_file_path1), ("B", criteria_file_path2)])
 
-    a_count = 0
-    b_count = 0
-    f_count = 0
-
-    uniformity_key = {"gain_uniformity", "peaking_time_uniformity", "baseline_uniformity"}
-    c_key = {"hg_lg", "sum_x1", "sum_x3"}
-    u_key = ["x1", "x3"]
-    gain_ratio_key = {0, 1, 2, 3}
     tc = 0
     x_f = []
     x_b = []
-    for file_path in file_paths:
-        with open(file_path, 'r') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from {file_path}: {e}")
-                continue
-        if "test_time" not in data:
-            print(f"Warning: 'test_time' not found in {file_path}, skipping file")
+    for file_path, chip_grade in zip(file_paths, util.grade_files(file_paths, [criteria1, criteria2], workers)):
+        if chip_grade is None:
+            continue
+        if chip_grade.test_time is None:
+            diagnostics.record("missing_test_time", "", file_path)
             continue
-        flag = util.get_grades(data, uniformity_key, gain_ratio_key, c_key, u_key, [criteria1, criteria2], file_path)
+        flag = chip_grade.flag
         
         if flag == -1:
             x_f.append(tc)
@@ -47,6 +33,7 @@ def get_values(file_paths, criteria_file_path1, criteria_file_path2):
 
         tc += 1
 
+    diagnostics.report(diagnostics_path)
     return x_f, x_b
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+import numpy as np
+import schema
+import prefilter
+import binning
+import sketch
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+N_BINS = 40
+# The window of a series is its limits.json range widened by this share of its width on each side.
+WINDOW_MARGIN = 0.5
+# Collections plot_histograms draws, by schema group: (label, key prefix).
+GROUPS = {
+    "channel": ("Channel", "channel"),
+    "power_ldo": ("Power_LDO", "power_ldo"),
+    "hg": ("HG", "hg"),
+    "lg": ("LG", "lg"),
+    "dclvl_sh_calib": ("dclvl_sh_calib", "dclvl_sh_calib"),
+    "gain_ratio": ("Gain_Ratio", "gain_ratio"),
+}
+
+
+class BinAccumulator:
+    """Fixed-bin histogram of one series with running mean and variance.
+
+    Only the counts of N bins over [lo, hi], an underflow and an overflow count, the
+    Welford moments (n, mean, M2) and a sketch.QuantileSketch (for percentiles) are kept,
+    so memory does not grow with the number of values. Accumulators of the same bins
+    merge (the moments exactly, Chan et al.), e.g. across labels or worker processes.
+    """
+
+    def __init__(self, lo: float, hi: float, n_bins: int = N_BINS):
+        self.edges = np.linspace(lo, hi, n_bins + 1)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sketch = sketch.QuantileSketch()
+
+    def __len__(self) -> int:
+        return self.n
+
+    def add(self, value: float):
+        """Count one value, O(1)."""
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.sketch.update(value)
+        lo, hi = self.edges[0], self.edges[-1]
+        if value < lo:
+            self.underflow += 1
+        elif value > hi:
+            self.overflow += 1
+        else:
+            # Same bins as np.histogram: half open, the last one closed.
+            last = len(self.counts) - 1
+            index = min(int((value - lo) / (hi - lo) * len(self.counts)), last)
+            if value < self.edges[index]:
+                index -= 1
+            elif index < last and value >= self.edges[index + 1]:
+                index += 1
+            self.counts[index] += 1
+
+    def add_many(self, values: np.ndarray):
+        """Count a block of values at once; same result as add on each of them."""
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return
+        block = BinAccumulator(self.edges[0], self.edges[-1], len(self.counts))
+        block.counts, _ = np.histogram(values, bins=self.edges)
+        block.underflow = int((values < self.edges[0]).sum())
+        block.overflow = int((values > self.edges[-1]).sum())
+        block.n, block.mean = len(values), float(values.mean())
+        block.m2 = float(((values - block.mean) ** 2).sum())
+        block.sketch.update_many(values)
+        self.merge(block)
+
+    def merge(self, other: "BinAccumulator") -> "BinAccumulator":
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge accumulators with different bins")
+        n = self.n + other.n
+        if n:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+            self.mean += delta * other.n / n
+        self.n = n
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def sigma(self) -> float:
+        """Population standard deviation (ddof 0, as norm.fit)."""
+        return float(np.sqrt(self.m2 / self.n)) if self.n else 0.0
+
+    def histogram(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(counts, edges) with the under/overflow counts as one extra bin on each side, when present."""
+        counts, edges = self.counts, self.edges
+        width = edges[1] - edges[0]
+        if self.underflow:
+            counts, edges = np.r_[self.underflow, counts], np.r_[edges[0] - width, edges]
+        if self.overflow:
+            counts, edges = np.r_[counts, self.overflow], np.r_[edges, edges[-1] + width]
+        return counts, edges
+
+    def bins(self) -> binning.Bins:
+        _, edges = self.histogram()
+        return binning.Bins(edges, bool(self.underflow), bool(self.overflow))
+
+
+def series_windows(spec_limits: Dict[str, Any], impedances: List[str] = schema.IMPEDANCES,
+                   margin: float = WINDOW_MARGIN, sketches: Dict[str, sketch.QuantileSketch] = None) -> Dict[Tuple, Tuple[float, float]]:
+    """(lo, hi) window of every plotted series that has a limits.json entry.
+
+    Keyed by (impedance, group, key, param); impedance-independent columns get a series
+    per impedance, as in plot_histograms. Series without an entry (or with an open or
+    empty range) take the p1-p99 range of their sketch in sketches ({measurement name:
+    sketch}, e.g. merged cache.load_sketches) when there is one; otherwise they cannot be
+    binned before their values are seen and are left out.
+    """
+    windows = {}
+    for impedance in impedances:
+        for group, key, param, column_impedance in schema.get_extractor().columns:
+            if group not in GROUPS or column_impedance not in (impedance, None):
+                continue
+            limits = spec_limits.get(f"{key or GROUPS[group][1]}_{param}_{impedance}")
+            if isinstance(limits, dict) and "min" in limits and "max" in limits:
+                lo, hi = float(limits["min"]), float(limits["max"])
+            else:
+                lo, hi = np.nan, np.nan
+            if not (hi > lo) and sketches is not None:
+                known = sketches.get(schema.column_name(group, key, param, column_impedance))
+                if known is not None and len(known):
+                    lo, hi = known.quantiles([0.01, 0.99])
+            if np.isfinite(lo) and np.isfinite(hi) and hi > lo:
+                windows[(impedance, group, key, param)] = (lo - margin * (hi - lo), hi + margin * (hi - lo))
+    return windows
+
+
+def documents(file_paths: List[str], cutoff: Tuple[int, int] = None) -> Iterator[Dict[str, Any]]:
+    """Decoded results_all.json documents that pass prefilter, one at a time (see prefilter.load_selected)."""
+    for _, data in prefilter.load_selected(file_paths, cutoff=cutoff):
+        yield data
+
+
+def rows(docs: Iterable[Dict[str, Any]]) -> Iterator[np.ndarray]:
+    """Extractor row of every document."""
+    extractor = schema.get_extractor()
+    for data in docs:
+        yield extractor.extract(data)
+
+
+def accumulate(row_stream: Iterable[np.ndarray], windows: Dict[Tuple, Tuple[float, float]],
+               n_bins: int = N_BINS) -> Dict[Tuple, BinAccumulator]:
+    """Feed every row's values into one BinAccumulator per windowed series.
+
+    Rows are consumed one at a time; missing (NaN) values are not counted.
+    """
+    extractor = schema.get_extractor()
+    accumulators = {name: BinAccumulator(*window, n_bins) for name, window in windows.items()}
+    columns, targets = [], []
+    for i, (group, key, param, column_impedance) in enumerate(extractor.columns):
+        for impedance in ([column_impedance] if column_impedance is not None else schema.IMPEDANCES):
+            if (impedance, group, key, param) in accumulators:
+                columns.append(i)
+                targets.append(accumulators[(impedance, group, key, param)])
+    for row in row_stream:
+        for column, accumulator in zip(columns, targets):
+            value = row[column]
+            if value == value:
+                accumulator.add(value)
+    return accumulators
+
+
+def accumulate_files(file_paths: List[str], windows: Dict[Tuple, Tuple[float, float]], cutoff: Tuple[int, int] = None,
+                     n_bins: int = N_BINS) -> Dict[Tuple, BinAccumulator]:
+    """accumulate(rows(documents(file_paths))): histograms of the files without keeping their values."""
+    return accumulate(rows(documents(file_paths, cutoff)), windows, n_bins)
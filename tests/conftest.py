@@ -0,0 +1,74 @@
+import json
+import os
+import random
+import sys
+
+import matplotlib
+import pytest
+
+matplotlib.use("Agg")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_results(root, seed=0, n=40, start=0):
+    """n synthetic ALFE_<serial>_<timestamp>/results_all.json runs below root, a few per serial."""
+    rng = random.Random(seed)
+
+    def r(mu, sigma):
+        return rng.gauss(mu, sigma)
+
+    paths = []
+    for i in range(start, start + n):
+        serial = f"{rng.randint(100, 102)}-{rng.randint(10000, 10030):05d}"
+        stamp = 1750000000 + i * 3600
+        d = {"test_time": f"{rng.randint(1, 28):02d}_{rng.choice([7, 8, 9]):02d}_25_T_{i % 24:02d}_00_00",
+             "board_temp": {"a": r(24, 1), "b": r(23.5, 1)}}
+        for imp in ["25", "50"]:
+            for g in ["HG", "LG"]:
+                d[f"results_noise_{imp}_all_ch_{g}"] = {
+                    "channel_list": [f"CH{c} {g}" for c in range(4)],
+                    "baseline": [r(-600, 60) for _ in range(4)], "noise_rms_mv": [r(1, .1) for _ in range(4)],
+                    "gain": [r(100, 5) for _ in range(4)], "eni": [r(150, 40) for _ in range(4)],
+                    "peaking_time": [r(46, 1.5) for _ in range(4)], "gain_uniformity": abs(r(1, .5)),
+                    "peaking_time_uniformity": abs(r(1, .5)), "baseline_uniformity": abs(r(1, .5))}
+                d[f"results_linearity_{imp}_all_ch_{g}"] = {
+                    "channel_list": [f"CH{c} {g}" for c in range(4)],
+                    "max_non_linearity": [abs(r(.1, .04)) for _ in range(4)], "fit_gain": [r(100, 5) for _ in range(4)]}
+            for s in ["x3", "x1"]:
+                d[f"results_noise_{imp}_sum_{s}"] = {
+                    "channel_list": [f"SUM {s}"], "baseline": [r(-600, 60)], "noise_rms_mv": r(1, .1),
+                    "gain": [r(100, 5)], "eni": [r(150, 40)], "peaking_time": [r(46, 1.5)]}
+                d[f"results_linearity_{imp}_sum_{s}"] = {
+                    "channel_list": [f"SUM {s}"], "max_non_linearity": [abs(r(.1, .04))], "fit_gain": [r(100, 5)]}
+            d[f"results_linearity_{imp}_sum_x1"]["peaking_time_std"] = [abs(r(.5, .2))]
+            channels = ["SUM x1"] + [f"LG{c}" for c in range(4)] + [f"HG{c}" for c in range(4)]
+            d[f"results_channel_enable_{imp}"] = {"channel_list": channels, "gain_crude": [r(100, 10) for _ in channels]}
+            d[f"results_baseline_{imp}"] = {
+                "channel_list": channels, "residual": [r(1, .3) for _ in channels],
+                "slope_fit": [r(1, .1) for _ in channels], "offset": [r(0, 10) for _ in channels],
+                "dclvl_sh_calib": {"hg_lg": r(5, 1), "sum_x1": r(5, 1), "sum_x3": r(5, 1)}}
+            d[f"gain_ratio_{imp}"] = [r(23.4, .4) for _ in range(4)]
+            d[f"results_sum_uniformity_{imp}"] = {"uniformity": [abs(r(1, .5)), abs(r(1, .5))]}
+        d["i2c_results"] = {"i2c_frequency_list": ["400_kHz", "1_MHz"], "i2c_margin_list": [r(10, 2), r(8, 2)],
+                            "i2c_phase_list": [r(3, 1), r(2, 1)]}
+        d["power_ldo"] = [{"name": "1V2", "voltage": r(1200, 10), "current": r(50, 5)},
+                          {"name": "2V5", "voltage": r(2500, 10), "current": r(30, 3)},
+                          {"name": "pwr_total_mw", "power": r(140, 10)}]
+        if rng.random() < 0.1:
+            del d["results_noise_25_all_ch_LG"]["gain"]
+        directory = os.path.join(str(root), f"ALFE_{serial}_{stamp}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "results_all.json")
+        with open(path, "w") as f:
+            json.dump(d, f)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """Run every test from the repository root, where spec.json and limits.json live."""
+    monkeypatch.chdir(ROOT)
+    return ROOT
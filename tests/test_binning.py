@@ -0,0 +1,41 @@
+import numpy as np
+
+import binning
+
+
+def test_normal_data_gets_the_arange_grid():
+    values = np.random.default_rng(0).normal(10, 1, 500)
+    bins = binning.bounded_bins(values, 0.25, 4, 16)
+    assert np.array_equal(bins.edges, np.arange(values.min(), values.max() + 0.25, 0.25))
+    assert not bins.underflow and not bins.overflow
+
+
+def test_constant_series_gets_one_bin():
+    bins = binning.bounded_bins([3.0] * 10, 0.5, 2, 4)
+    assert len(bins.edges) == 2
+    counts, _ = binning.histogram([3.0] * 10, bins)
+    assert counts.tolist() == [10]
+
+
+def test_far_outliers_go_to_the_outer_bins():
+    values = np.r_[np.linspace(0.01, 0.98, 1000), -1e6, 1e6]
+    bins = binning.bounded_bins(values, 0.1, 0, 1, reach=10)
+    assert bins.underflow and bins.overflow
+    assert len(bins.edges) - 1 <= binning.MAX_BINS
+    counts, _ = binning.histogram(values, bins)
+    assert counts.sum() == len(values)
+    assert counts[0] == 1 and counts[-1] == 1
+
+
+def test_wide_data_is_capped_at_max_bins():
+    values = np.r_[np.random.default_rng(1).normal(0, 1, 200), 500.0]
+    bins = binning.bounded_bins(values, 0.01, -6, 6, max_bins=50)
+    assert len(bins.edges) - 1 <= 50
+    assert bins.overflow
+    counts, _ = binning.histogram(values, bins)
+    assert counts.sum() == len(values)
+
+
+def test_rule_widths_of_short_or_flat_series_are_nan():
+    widths = binning.rule_widths([[1.0], [2.0, 2.0, 2.0], list(np.arange(10.0))], "fd")
+    assert np.isnan(widths[:2]).all() and widths[2] > 0
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import numpy as np
+
+import baseline_timeplot
+import cache
+from conftest import write_results
+
+
+def _assert_same_cache(a, b):
+    assert a["rows"] == b["rows"]
+    for name in cache.META_COLUMNS:
+        assert np.array_equal(np.asarray(a["meta"][name]), np.asarray(b["meta"][name]), equal_nan=name == "board_temp")
+    assert set(a["values"]) == set(b["values"])
+    for name, values in a["values"].items():
+        assert np.array_equal(np.asarray(values), np.asarray(b["values"][name]), equal_nan=True), name
+
+
+def test_update_matches_rebuild(tmp_path):
+    root = tmp_path / "results"
+    paths = write_results(root, seed=2, n=30)
+    cache.build_cache({"A": str(root)}, str(tmp_path / "cache"))
+
+    # New runs, one rewritten run and one deleted run.
+    write_results(root, seed=3, n=10, start=30)
+    shutil.copy(write_results(tmp_path / "other", seed=4, n=1)[0], paths[5])
+    shutil.rmtree(os.path.dirname(paths[0]))
+
+    updated = cache.update_cache({"A": str(root)}, str(tmp_path / "cache"))
+    rebuilt = cache.build_cache({"A": str(root)}, str(tmp_path / "rebuilt"))
+    _assert_same_cache(updated, rebuilt)
+
+
+def test_update_without_changes_keeps_the_cache(tmp_path):
+    write_results(tmp_path / "results", seed=5, n=10)
+    first = cache.build_cache({"A": str(tmp_path / "results")}, str(tmp_path / "cache"))
+    second = cache.update_cache({"A": str(tmp_path / "results")}, str(tmp_path / "cache"))
+    _assert_same_cache(first, second)
+
+
+def test_appended_runs_merge_into_the_sketches(tmp_path):
+    root = tmp_path / "results"
+    write_results(root, seed=6, n=20)
+    cache.build_cache({"A": str(root)}, str(tmp_path / "cache"))
+    write_results(root, seed=7, n=20, start=20)
+    measurements = cache.update_cache({"A": str(root)}, str(tmp_path / "cache"))
+    sketches = cache.load_sketches(str(tmp_path / "cache"))["A"]
+    for name, values in measurements["values"].items():
+        if name in sketches:
+            values = np.asarray(values)
+            assert sketches[name].n == np.count_nonzero(~np.isnan(values)), name
+
+
+def test_time_series_keep_missing_values(tmp_path):
+    write_results(tmp_path, seed=9, n=30)
+    measurements = cache.ingest({"A": str(tmp_path)})
+    channel_values, hour_values, *_ = baseline_timeplot.read_cache(measurements, "A", "25")
+    gain = channel_values["CH0 LG"]["gain"]
+    assert len(gain) == len(hour_values)
+    assert np.isnan(gain).any()
+    histogram_values = cache.collections_from_cache(measurements, np.arange(measurements["rows"]), "25")[0]
+    assert len(histogram_values["CH0 LG"]["gain"]) == np.count_nonzero(~np.isnan(gain))
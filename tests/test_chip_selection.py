@@ -0,0 +1,51 @@
+import os
+
+import cache
+import chip_selection
+from conftest import write_results
+
+
+def _count_hashes(monkeypatch):
+    hashed = []
+    hash_file = cache.hash_file
+    monkeypatch.setattr(cache, "hash_file", lambda path: hashed.append(path) or hash_file(path))
+    return hashed
+
+
+def test_workbook_is_redone_when_a_run_changes(tmp_path, monkeypatch):
+    paths = sorted(write_results(tmp_path / "results", seed=12, n=10), reverse=True)
+    output = str(tmp_path / "chips.xlsx")
+    chip_selection.save_exel(paths, "spec.json", "limits.json", output, [])
+    written = os.stat(output).st_mtime_ns
+    hashed = _count_hashes(monkeypatch)
+
+    # Nothing changed: no file is hashed again.
+    chip_selection.save_exel(paths, "spec.json", "limits.json", output, [])
+    assert hashed == []
+
+    # Same bytes, new mtime: only that file is hashed and the workbook is still current.
+    os.utime(paths[0])
+    chip_selection.save_exel(paths, "spec.json", "limits.json", output, [])
+    assert hashed == [paths[0]]
+    assert os.stat(output).st_mtime_ns == written
+
+    # Different values: redone.
+    with open(paths[0]) as f:
+        content = f.read()
+    edited = content.replace('"gain": [1', '"gain": [2', 1)
+    assert edited != content
+    with open(paths[0], "w") as f:
+        f.write(edited)
+    os.utime(paths[0], ns=(0, os.stat(paths[0]).st_mtime_ns + 10**9))
+    chip_selection.save_exel(paths, "spec.json", "limits.json", output, [])
+    assert os.stat(output).st_mtime_ns != written
+
+
+def test_workbook_reuses_the_cache_manifest_hashes(tmp_path, monkeypatch):
+    root = tmp_path / "results"
+    paths = sorted(write_results(root, seed=14, n=6), reverse=True)
+    cache.update_cache({"A": str(root)}, str(tmp_path / "cache"))
+    hashed = _count_hashes(monkeypatch)
+    chip_selection.save_exel(paths, "spec.json", "limits.json", str(tmp_path / "chips.xlsx"), [],
+                             cache_directory=str(tmp_path / "cache"))
+    assert hashed == []
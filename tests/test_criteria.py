@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+import criteria
+import util
+
+RULES = {
+    "defaults": {"min": -100, "max": 100},
+    "rules": [
+        {"key": "CH? HG_peaking_time_*", "min": 41, "max": 51},
+        {"key": "CH? ?G_peaking_time_25", "max": 49},
+        {"key": "CH0 HG_peaking_time_25", "min": 43},
+        {"key": "CH[01] HG_peaking_time_50", "min": 40},
+        {"key": "CH? HG_eni_*", "max": 350},
+    ],
+}
+
+
+def test_later_matching_rules_override_earlier_ones():
+    limits = criteria.as_criteria(RULES)
+    assert limits["CH0 HG_peaking_time_25"] == {"min": 43, "max": 49}
+    assert limits["CH1 HG_peaking_time_25"] == {"min": 41, "max": 49}
+    assert limits["CH1 HG_peaking_time_50"] == {"min": 40, "max": 51}
+    assert limits["CH2 HG_peaking_time_50"] == {"min": 41, "max": 51}
+    # Only "max" is set by the rules, "min" comes from defaults.
+    assert limits["CH3 LG_peaking_time_25"] == {"min": -100, "max": 49}
+    assert limits["CH3 HG_eni_50"] == {"min": -100, "max": 350}
+
+
+def test_exact_rules_keep_their_place_in_the_order():
+    limits = criteria.as_criteria({"rules": [{"key": "gain_ratio_0_25", "min": 20, "max": 25},
+                                             {"key": "gain_ratio_*_25", "min": 17, "max": 27}]})
+    assert limits["gain_ratio_0_25"] == {"min": 17, "max": 27}
+
+
+def test_keys_without_a_rule_use_the_defaults():
+    limits = criteria.as_criteria(RULES)
+    assert limits["1V2_voltage_25"] == {"min": -100, "max": 100}
+    assert util.is_within_criteria(150, "1V2_voltage_25", limits) is False
+
+    no_defaults = criteria.as_criteria({"rules": RULES["rules"]})
+    assert "1V2_voltage_25" not in no_defaults
+    assert util.is_within_criteria(150, "1V2_voltage_25", no_defaults)
+    # A rule that sets one bound with no default for the other gives no limits.
+    assert "CH3 HG_eni_25" not in no_defaults
+    lo, hi, missing = no_defaults.bounds(["CH0 HG_peaking_time_25", "1V2_voltage_25"])
+    assert lo.tolist() == [43, -np.inf] and hi.tolist() == [49, np.inf]
+    assert missing == ["1V2_voltage_25"]
+
+
+def test_flat_files_still_load(tmp_path):
+    path = tmp_path / "limits.json"
+    path.write_text(json.dumps({"CH0 HG_gain_25": {"min": 1, "max": 2}}))
+    limits = criteria.load_criteria(str(path))
+    assert dict(limits) == {"CH0 HG_gain_25": {"min": 1, "max": 2}}
+    assert "CH1 HG_gain_25" not in limits
@@ -0,0 +1,56 @@
+import numpy as np
+from scipy.stats import norm, skewnorm
+
+import fitting
+
+
+def _trimmed(values):
+    values = np.asarray(values, dtype=float)
+    lo, hi = np.percentile(values, fitting.TRIM_PERCENTILES)
+    return values[(lo <= values) & (values <= hi)]
+
+
+def _series():
+    rng = np.random.default_rng(3)
+    return [rng.normal(5, 2, n).tolist() for n in (1, 2, 7, 40, 40, 333)] + \
+        [skewnorm.rvs(4, loc=1, scale=3, size=n, random_state=rng).tolist() for n in (15, 120)] + [[], [2.5] * 9]
+
+
+def test_gaussian_fits_match_norm_fit_of_the_trimmed_series():
+    series = _series()
+    fits = fitting.fit_batch(series, [False] * len(series))
+    for values, fit in zip(series, fits):
+        # Nothing is left of an empty series, nor of two values (both outside p10-p90).
+        if not len(values) or not len(_trimmed(values)):
+            assert fit == fitting.FIT_FAILED
+            continue
+        mu, sigma = norm.fit(_trimmed(values))
+        assert np.isclose(fit["mu"], mu, rtol=1e-12, atol=1e-12)
+        assert np.isclose(fit["sigma"], sigma, rtol=1e-12, atol=1e-12)
+        assert (fit["a"], fit["loc"], fit["scale"]) == (0, fit["mu"], fit["sigma"])
+
+
+def test_skewnorm_fits_match_skewnorm_fit_of_the_trimmed_series():
+    # skewnorm.fit fails on a constant series, with or without fit_batch.
+    series = [values for values in _series() if len(values) >= 7 and np.ptp(values) > 0]
+    use_skew = [True] * len(series)
+    use_skew[0] = False
+    for workers in (1, 2):
+        fits = fitting.fit_batch(series, use_skew, workers)
+        assert fits[0]["label"].startswith("Gaussian")
+        for values, fit in zip(series[1:], fits[1:]):
+            a, loc, scale = skewnorm.fit(_trimmed(values))
+            assert np.allclose([fit["a"], fit["loc"], fit["scale"]], [a, loc, scale], rtol=1e-6, atol=1e-9)
+            assert (fit["mu"], fit["sigma"]) == (fit["loc"], fit["scale"])
+
+
+def test_blocks_do_not_change_the_fits(monkeypatch):
+    series = _series()
+    fits = fitting.fit_batch(series, [False] * len(series))
+    monkeypatch.setattr(fitting, "BLOCK_ELEMENTS", 8)
+    assert fitting.fit_batch(series, [False] * len(series)) == fits
+
+
+def test_no_series():
+    assert fitting.fit_batch([], []) == []
+    assert fitting.fit_batch([[]], [True]) == [fitting.FIT_FAILED]
@@ -0,0 +1,66 @@
+import json
+from collections import defaultdict
+
+import numpy as np
+
+import cache
+import grading
+import util
+from conftest import write_results
+
+
+def _edit(path, change):
+    with open(path) as f:
+        data = json.load(f)
+    change(data)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def _assert_same_grades(root):
+    measurements = cache.ingest({"A": str(root)})
+    rows = np.arange(measurements["rows"])
+    criterium, grade_names = grading.load_tiers()
+    grades = grading.grade_cache(measurements, rows, criterium, grade_names)
+
+    param_stats = defaultdict(lambda: {"A": 0, "B": 0, "F": 0})
+    for chip, row in enumerate(rows):
+        path = str(measurements["meta"]["path"][row])
+        with open(path) as f:
+            expected = util.grade_document(json.load(f), criterium, path)
+        assert grades["flags"][chip] == expected.flag
+        # get_grades walks util.UNIFORMITY_KEY, a set, so its order follows the string hash seed.
+        assert sorted(grading.failure_rows(grades, chip)) == sorted(expected.failures)
+        for key, a, b, f in expected.stats:
+            for grade, count in zip("ABF", (a, b, f)):
+                param_stats[key][grade] += count
+    # grade_matrix lists every stat key, get_grades only those it met.
+    counted = {key: dict(stats) for key, stats in grades["param_stats"].items() if any(stats.values())}
+    assert counted == {key: stats for key, stats in param_stats.items() if any(stats.values())}
+    return param_stats
+
+
+def test_grade_cache_matches_grade_document(tmp_path):
+    write_results(tmp_path, seed=1, n=40)
+    _assert_same_grades(tmp_path)
+
+
+def test_missing_power_ldo_counts_every_rail_as_f(tmp_path):
+    paths = write_results(tmp_path, seed=13, n=10)
+    for path in paths[:3]:
+        _edit(path, lambda data: data.pop("power_ldo"))
+    param_stats = _assert_same_grades(tmp_path)
+    assert param_stats["1V2_voltage_25"]["F"] >= 3
+
+
+def test_rails_and_fields_outside_the_schema_are_not_graded(tmp_path):
+    paths = write_results(tmp_path, seed=17, n=10)
+
+    def add_rail(data):
+        data["power_ldo"].append({"name": "3V3", "voltage": 3300.0, "current": 20.0})
+        data["power_ldo"][0]["temperature"] = 45.0
+
+    for path in paths[:4]:
+        _edit(path, add_rail)
+    param_stats = _assert_same_grades(tmp_path)
+    assert not any(key.startswith("3V3_") or "_temperature_" in key for key in param_stats)
@@ -0,0 +1,33 @@
+import fnmatch
+
+import numpy as np
+
+import cache
+import criteria
+import grading
+import limit_sweep
+from conftest import write_results
+
+PATTERN = "CH? HG_peaking_time_25"
+
+
+def test_sweep_grid_matches_grading_each_pair(tmp_path):
+    write_results(tmp_path, seed=8, n=40)
+    measurements = cache.ingest({"A": str(tmp_path)})
+    rows = np.arange(measurements["rows"])
+    context = limit_sweep.sweep_context(measurements, rows)
+    lows, highs = [42.0, 44.0, 45.5, 47.0], [45.0, 47.0, 48.5, 51.0]
+    result = limit_sweep.sweep_grid(context, PATTERN, lows, highs)
+
+    spec, limits = context["criterium"]
+    columns = [m for m, key in enumerate(context["keys"]) if fnmatch.fnmatchcase(key, PATTERN)]
+    n_grades = len(context["grades"])
+    for i, low in enumerate(lows):
+        for j, high in enumerate(highs):
+            swept = criteria.Criteria(limits.rules + [{"key": PATTERN, "min": low, "max": high}], limits.defaults)
+            grades = grading.grade_cache(measurements, rows, [spec, swept], context["grades"])
+            overall = np.bincount(grades["chip_tiers"], minlength=n_grades)
+            param = np.bincount(grades["tiers"][:, columns].min(axis=1), minlength=n_grades)
+            assert result["overall"][i, j].tolist() == overall.tolist()
+            assert result["param"][i, j].tolist() == param.tolist()
+            assert result["overall"][i, j].sum() == len(rows)
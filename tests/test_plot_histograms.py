@@ -0,0 +1,61 @@
+import json
+import os
+
+import numpy as np
+
+import binning
+import plot_histograms
+
+
+def test_constant_series_renders(tmp_path):
+    data_collection = {"A": {"CH0 HG": {"gain": [5.0] * 10, "eni": [0.0] * 3}}}
+    plot_histograms.plot_histograms(data_collection, str(tmp_path), str(tmp_path), "25", "Channel", "CH",
+                                    xlimb=True, show_fit=True)
+    for param in ("gain", "eni"):
+        image = tmp_path / f"CH0 HG_{param}_25_histogram.png"
+        assert image.exists()
+        with open(os.path.splitext(image)[0] + ".json") as f:
+            layer = json.load(f)["layers"][0]
+        assert len(layer["edges"]) >= 2
+        assert sum(layer["counts"]) == layer["n"]
+
+
+def test_empty_histogram_skips_density(tmp_path):
+    fig, ax1 = plot_histograms.plt.subplots()
+    ax2 = ax1.twinx()
+    config = {"show_fit": False, "use_skew": False, "label": "A", "color": "C0"}
+    counts, edges = plot_histograms._plot_on_canvas(ax1, ax2, [5.0, 5.0], binning.Bins(np.array([0.0, 1.0])), {}, config)
+    assert counts.sum() == 0
+    counts, edges = plot_histograms._plot_on_canvas(ax1, ax2, [], binning.Bins(np.array([0.0, 1.0])), {}, config)
+    assert counts.sum() == 0
+    plot_histograms.plt.close(fig)
+
+
+def test_grid_panels_share_the_window_of_their_column(tmp_path):
+    rng = np.random.default_rng(0)
+    channels = {f"CH{c} HG": {"gain": rng.normal(100 + 10 * c, 1 + c, 50).tolist()} for c in range(6)}
+    plot_histograms.plot_histograms({"A": channels}, str(tmp_path), str(tmp_path), "25", "Channel", "CH",
+                                    xlimb=True, grid=True)
+    with open(tmp_path / "channel_gain_25_grid.json") as f:
+        panels = json.load(f)["panels"]
+    assert len(panels) == 6
+    columns = plot_histograms.GRID_COLUMNS
+    for n, panel in enumerate(panels):
+        assert panel["xlim"] == panels[n % columns]["xlim"]
+    assert panels[0]["xlim"] != panels[1]["xlim"]
+
+
+def test_pool_renders_the_same_outputs_as_a_serial_run(tmp_path):
+    rng = np.random.default_rng(1)
+    channels = {f"CH{c} HG": {"gain": rng.normal(100, 5, 80).tolist(), "eni": rng.normal(150, 40, 80).tolist()}
+                for c in range(3)}
+    outputs = {}
+    for workers in (1, 3):
+        directory = tmp_path / str(workers)
+        directory.mkdir()
+        plot_histograms.plot_histograms({"A": channels, "B": channels}, str(directory), str(tmp_path), "25",
+                                        "Channel", "CH", xlimb=True, show_fit=True, workers=workers)
+        outputs[workers] = {name: (directory / name).read_bytes() for name in sorted(os.listdir(directory))
+                            if name.endswith((".png", ".json")) and name != "artifacts.json"}
+    assert len(outputs[1]) == 12
+    assert outputs[1] == outputs[3]
@@ -0,0 +1,24 @@
+import os
+
+import numpy as np
+
+import cache
+import prefilter
+from conftest import write_results
+
+
+def test_corrupt_newest_run_falls_back_to_the_next_one(tmp_path):
+    paths = write_results(tmp_path, seed=11, n=40)
+    serials = [os.path.basename(os.path.dirname(path)).split("_")[1] for path in paths]
+    # The newest run of a serial that was tested more than once stops decoding.
+    serial = next(s for s in reversed(serials) if serials.count(s) > 1)
+    newest = max((p for p, s in zip(paths, serials) if s == serial), key=lambda p: os.path.dirname(p))
+    with open(newest, "w") as f:
+        f.write('{"test_time": "01_08_25_T_00_00_00", ')
+
+    loaded = [entry.path for entry, _ in prefilter.load_selected(paths)]
+    measurements = cache.ingest({"A": str(tmp_path)})
+    expected = np.asarray(measurements["meta"]["path"])[cache.select_rows(measurements, "A")]
+    assert newest not in loaded
+    assert sorted(loaded) == sorted(expected.tolist())
+    assert len(loaded) == len(set(serials))
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+import registry
+
+
+def _registry():
+    runs = registry.SerialRegistry()
+    runs.add("ALFE_101-10001_1750003600/results_all.json", 1750003600, grade="B")
+    runs.add("ALFE_101-10001_1750000000/results_all.json", 1750000000, grade="A")
+    runs.add("ALFE_101- 10001_1750007200/results_all.json", 1750007200, grade="F")
+    runs.add("ALFE_102-20002_1750000000/results_all.json", 1750000000, grade="A")
+    return runs
+
+
+@pytest.mark.parametrize("path, serial", [
+    ("ALFE_101-10001_1750000000/results_all.json", "101-10001"),
+    ("ALFE_101- 10001_1750000000/results_all.json", "101-10001"),
+    ("ALFE_101-\t10001/results_all.json", "101-10001"),
+    ("chip_12345678/results_all.json", "12345678"),
+    ("chip_123456/results_all.json", "123456"),
+    ("101-10001_99887766/results_all.json", "101-10001"),
+    ("chip_12345/results_all.json", None),
+    ("ALFE_run/results_all.json", None),
+])
+def test_serial_from_path(path, serial):
+    assert registry.serial_from_path(path) == serial
+
+
+def test_normalize_serial_drops_whitespace():
+    assert registry.normalize_serial(" 101- 10001\n") == "101-10001"
+
+
+def test_policies_pick_one_run_per_serial():
+    runs = _registry()
+    assert len(runs) == 2 and "101- 10001" in runs and "103-30003" not in runs
+    # select lists the kept runs in the order they were added.
+    assert [run.index for run in runs.select("latest")] == [2, 3]
+    assert [run.grade for run in runs.select("latest")] == ["F", "A"]
+    assert [run.index for run in runs.select("first")] == [1, 3]
+    assert [run.index for run in runs.select("best")] == [1, 3]
+    with pytest.raises(ValueError):
+        runs.select("newest")
+
+
+def test_ties_go_to_the_run_added_first():
+    runs = registry.SerialRegistry()
+    runs.add("ALFE_101-10001_a/results_all.json", 5, grade="A")
+    runs.add("ALFE_101-10001_b/results_all.json", 5, grade="A")
+    for policy in registry.POLICIES:
+        assert runs.select(policy)[0].path == "ALFE_101-10001_a/results_all.json"
+
+
+def test_best_prefers_the_newest_run_of_the_best_grade():
+    runs = registry.SerialRegistry()
+    runs.add("ALFE_101-10001_1/results_all.json", 1, grade="B")
+    runs.add("ALFE_101-10001_2/results_all.json", 2, grade="B")
+    runs.add("ALFE_101-10001_3/results_all.json", 3, grade="F")
+    assert runs.select("best")[0].timestamp == 2
+
+
+def test_duplicates_and_history():
+    runs = _registry()
+    assert [run.index for run in runs.duplicates("latest")] == [0, 1]
+    assert [run.index for run in runs.duplicates("first")] == [0, 2]
+    assert [run.index for run in runs.duplicates("best")] == [0, 2]
+    assert [run.timestamp for run in runs.history("101- 10001")] == [1750000000, 1750003600, 1750007200]
+    assert runs.history("103-30003") == []
+
+
+def test_add_without_a_serial():
+    runs = registry.SerialRegistry()
+    assert runs.add("ALFE_run/results_all.json") is None
+    assert runs.add("ALFE_run/results_all.json", serial="101- 10001").serial == "101-10001"
+    assert runs.serials() == ["101-10001"]
+
+
+def test_from_cache_skips_rows_without_a_serial():
+    cache = {"meta": {
+        "path": np.array(["a/results_all.json", "b/results_all.json", "c/results_all.json", "d/results_all.json"]),
+        "serial": np.array(["101-10001", "", "101-10001", "102-20002"]),
+        "timestamp": np.array([1, 2, 3, 4]),
+        "test_time": np.array(["2025-07-01", "2025-07-02", "2025-07-03", "2025-07-04"], dtype="datetime64[s]"),
+    }}
+    runs = registry.SerialRegistry.from_cache(cache)
+    assert runs.serials() == ["101-10001", "102-20002"]
+    assert [run.path for run in runs.select("latest")] == ["c/results_all.json", "d/results_all.json"]
+    assert [run.path for run in runs.history("101-10001")] == ["a/results_all.json", "c/results_all.json"]
+
+    subset = registry.SerialRegistry.from_cache(cache, np.array([0, 3]))
+    assert [run.path for run in subset.select("first")] == ["a/results_all.json", "d/results_all.json"]
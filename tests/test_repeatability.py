@@ -0,0 +1,68 @@
+import numpy as np
+
+import grading
+import repeatability
+
+KEY = "1V2_voltage_25"
+EMPTY_KEY = "2V5_voltage_25"
+CRITERIUM = [{KEY: {"min": 0, "max": 10}}, {KEY: {"min": 2.5, "max": 5.5}}]
+
+
+def _measurements():
+    # Rows out of serial and test_time order; the last chip has one run and no value, the
+    # last row no serial.
+    serials = ["101-00002", "101-00001", "101-00002", "101-00003", "101-00001", "101-00002", "101-00004", ""]
+    days = [3, 2, 1, 1, 1, 2, 1, 1]
+    values = [6.0, 3.0, 4.0, 7.0, 1.0, 5.0, np.nan, 2.0]
+    return {"meta": {"serial": np.array(serials),
+                     "test_time": np.array([f"2025-07-{day:02d}" for day in days], dtype="datetime64[s]")},
+            "values": {KEY: np.array(values)}}
+
+
+def test_retest_groups_orders_rows_by_serial_and_test_time():
+    rows, chip, starts, serials = repeatability.retest_groups(_measurements(), np.arange(8))
+    assert rows.tolist() == [4, 1, 2, 5, 0, 3, 6]
+    assert chip.tolist() == [0, 0, 1, 1, 1, 2, 3]
+    assert starts.tolist() == [0, 2, 5, 6]
+    assert serials.tolist() == ["101-00001", "101-00002", "101-00003", "101-00004"]
+
+
+def test_repeatability_matches_a_hand_computed_anova():
+    result = repeatability.repeatability(_measurements(), np.arange(8), CRITERIUM, ["F", "B", "A"])
+    m = grading.grading_plan()["criteria_keys"].index(KEY)
+    # Chips [1, 3], [4, 5, 6] and [7]: SS within 2 + 2 on 6 - 3 degrees of freedom; grand
+    # mean 13/3, SS between 2 (2 - 13/3)^2 + 3 (5 - 13/3)^2 + (7 - 13/3)^2 = 58/3 on 2,
+    # n0 = (6 - 14/6) / 2 = 11/6.
+    assert (result["runs"][m], result["chips"][m], result["retested"][m]) == (6, 3, 2)
+    assert np.isclose(result["mean"][m], 13 / 3)
+    assert np.isclose(result["within"][m], 4 / 3)
+    assert np.isclose(result["between"][m], (29 / 3 - 4 / 3) / (11 / 6))
+    assert np.isclose(result["sigma"][m], np.sqrt(4 / 3))
+    assert result["window"][m] == 10
+    assert np.isclose(result["sigma_ratio"][m], 6 * np.sqrt(4 / 3) / 10)
+    # B outside [2.5, 5.5]: 1 B -> 3 A flips, 4 A -> 5 A -> 6 B flips once.
+    assert (result["flips"][m], result["pairs"][m]) == (2, 3)
+    assert np.isclose(result["flip_rate"][m], 2 / 3)
+
+
+def test_single_runs_and_missing_values():
+    measurements = _measurements()
+    single = measurements["values"][KEY].copy()
+    single[[0, 2, 1]] = np.nan
+    measurements["values"][KEY] = single
+    result = repeatability.repeatability(measurements, np.arange(8), CRITERIUM, ["F", "B", "A"])
+    m = grading.grading_plan()["criteria_keys"].index(KEY)
+    # Chips [1], [5] and [7]: no degrees of freedom within chips, no pair to flip.
+    assert (result["runs"][m], result["chips"][m], result["retested"][m]) == (3, 3, 0)
+    assert np.isnan(result["within"][m]) and np.isnan(result["sigma"][m])
+    assert (result["flips"][m], result["pairs"][m]) == (0, 0)
+    assert np.isnan(result["flip_rate"][m])
+
+    e = grading.grading_plan()["criteria_keys"].index(EMPTY_KEY)
+    assert (result["runs"][e], result["chips"][e], result["flips"][e]) == (0, 0, 0)
+    assert np.isnan(result["mean"][e]) and np.isnan(result["within"][e]) and np.isnan(result["flip_rate"][e])
+
+
+def test_no_rows():
+    result = repeatability.repeatability(_measurements(), np.arange(0), CRITERIUM)
+    assert not result["runs"].any() and np.isnan(result["within"]).all()
@@ -0,0 +1,20 @@
+import numpy as np
+
+import diagnostics
+import schema
+
+
+def test_unknown_power_rails_are_reported():
+    extractor = schema.get_extractor()
+    data = {"power_ldo": [{"name": "1V2", "voltage": 1200.0, "current": 50.0, "temperature": 30.0},
+                          {"name": "3V3", "voltage": 3300.0}]}
+    events = diagnostics.Diagnostics()
+    previous, diagnostics.DIAGNOSTICS = diagnostics.DIAGNOSTICS, events
+    try:
+        row = extractor.extract(data, "run/results_all.json")
+    finally:
+        diagnostics.DIAGNOSTICS = previous
+    assert row[extractor.names.index("1V2_voltage_25")] == 1200.0
+    assert np.isnan(row[extractor.names.index("2V5_voltage_25")])
+    assert set(events.counts) == {("unknown_record", "power_ldo/3V3"), ("unknown_record", "power_ldo/1V2/temperature")}
+    assert events.examples[("unknown_record", "power_ldo/3V3")] == ["run/results_all.json"]
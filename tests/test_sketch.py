@@ -0,0 +1,41 @@
+import numpy as np
+
+import sketch
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def _rank_errors(estimates, values):
+    values = np.sort(values)
+    return np.abs(np.searchsorted(values, estimates, side="right") / len(values) - np.asarray(QUANTILES))
+
+
+def test_merged_sketch_is_accurate():
+    rng = np.random.default_rng(0)
+    parts = [rng.normal(loc, 1, 20000) for loc in (0, 0.5, 3)]
+    merged = sketch.QuantileSketch()
+    for values in parts:
+        part = sketch.QuantileSketch()
+        part.update_many(values)
+        merged.merge(part)
+    values = np.concatenate(parts)
+    assert merged.n == len(values)
+    assert merged.min == values.min() and merged.max == values.max()
+    # Rank error is about 1.7 / k of the count, see sketch.SKETCH_K.
+    assert _rank_errors(merged.quantiles(QUANTILES), values).max() < 3 / merged.k
+
+
+def test_merge_of_column_sketches():
+    values = np.random.default_rng(1).exponential(2, 30000)
+    merged = sketch.merge_sketches([sketch.sketch_columns({"x": part}) for part in np.array_split(values, 7)])["x"]
+    assert merged.n == len(values)
+    assert _rank_errors(merged.quantiles(QUANTILES), values).max() < 3 / merged.k
+
+
+def test_short_series_are_exact():
+    values = np.arange(100.0)
+    s = sketch.QuantileSketch()
+    s.update_many(values)
+    assert s.quantile(0.5) == 49.0
+    restored = sketch.QuantileSketch.from_dict(s.to_dict())
+    assert restored.quantiles(QUANTILES).tolist() == s.quantiles(QUANTILES).tolist()
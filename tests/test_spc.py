@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+
+import cache
+import diagnostics
+import spc
+from conftest import write_results
+
+
+def _edit(path, change):
+    with open(path) as f:
+        data = json.load(f)
+    change(data)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def test_update_from_cache_resumes_after_the_saved_state(tmp_path):
+    root = tmp_path / "results"
+    write_results(root, seed=10, n=30)
+    measurements = cache.ingest({"A": str(root)})
+    monitor = spc.SPCMonitor(str(tmp_path))
+    monitor.update_from_cache(measurements)
+    assert (tmp_path / spc.STATE_NAME).exists()
+
+    resumed = spc.SPCMonitor(str(tmp_path))
+    assert resumed.last_time == monitor.last_time
+    assert resumed.update_from_cache(measurements) == []
+    chart = next(iter(resumed.charts.values()))
+    assert chart.seen == len(cache.select_rows(measurements, dedup=False))
+
+
+def test_chart_flags_a_shift():
+    values = np.r_[np.random.default_rng(0).normal(0, 1, 100), np.full(20, 5.0)]
+    chart = spc.chart_series(values, "x")
+    assert {alert.rule for alert in chart["alerts"] if alert.index >= 100} >= {"shewhart", "ewma", "cusum_high"}
+
+
+def test_update_from_cache_feeds_late_and_other_label_results(tmp_path):
+    root = tmp_path / "results"
+    paths = write_results(root, seed=11, n=30)
+    monitor = spc.SPCMonitor(str(tmp_path))
+    monitor.update_from_cache(cache.ingest({"A": str(root)}))
+    diagnostics.DIAGNOSTICS.counts.clear()
+
+    # Runs of another label cached later, tested before everything already fed.
+    late = write_results(tmp_path / "late", seed=12, n=2, start=40)
+    for path in late:
+        _edit(path, lambda data: data.update(test_time="01_01_25_T_00_00_00"))
+    measurements = cache.ingest({"A": str(root), "B": str(tmp_path / "late")})
+    resumed = spc.SPCMonitor(str(tmp_path))
+    resumed.update_from_cache(measurements, "A")
+    resumed.update_from_cache(measurements, "B")
+
+    assert set(late) <= resumed.fed
+    assert next(iter(resumed.charts.values())).seen == len(paths) + len(late)
+    assert diagnostics.DIAGNOSTICS.counts[("spc_out_of_order", "")] == len(late)
+    assert resumed.last_time == monitor.last_time
+    assert spc.SPCMonitor(str(tmp_path)).update_from_cache(measurements) == []
@@ -0,0 +1,56 @@
+import numpy as np
+from scipy.stats import linregress
+
+import thermal
+
+
+def _data():
+    rng = np.random.default_rng(2)
+    temps = rng.uniform(20, 40, 30)
+    temps[4] = np.nan
+    values = np.column_stack([3 + 0.5 * temps + rng.normal(0, 0.2, 30), -2 * temps + rng.normal(0, 3, 30),
+                              rng.normal(10, 1, 30), np.full(30, np.nan), np.full(30, np.nan)])
+    values[::3, 1] = np.nan
+    values[7, 3] = 1.0
+    values[[7, 9], 4] = 1.0, 2.0
+    return temps, values
+
+
+def test_lines_match_polyfit_per_column():
+    temps, values = _data()
+    result = thermal.temperature_regression(temps, values)
+    for m in range(3):
+        use = ~np.isnan(temps) & ~np.isnan(values[:, m])
+        slope, intercept = np.polyfit(temps[use], values[use, m], 1)
+        fit = linregress(temps[use], values[use, m])
+        assert result["n"][m] == use.sum()
+        assert np.isclose(result["slope"][m], slope) and np.isclose(result["intercept"][m], intercept)
+        assert np.isclose(result["r2"][m], fit.rvalue ** 2)
+        assert np.isclose(result["slope_se"][m], fit.stderr)
+        assert np.isclose(result["sigma"][m], np.std(values[use, m]))
+        residual = values[use, m] - (intercept + slope * temps[use])
+        assert np.isclose(result["residual_sigma"][m], np.std(residual))
+        assert np.allclose(result["compensated"][use, m], values[use, m] - slope * (temps[use] - thermal.REFERENCE_TEMP))
+        assert np.isnan(result["compensated"][~use, m]).all()
+
+
+def test_columns_with_fewer_than_two_points():
+    temps, values = _data()
+    result = thermal.temperature_regression(temps, values)
+    # No value, one value, and two values on the same line: no slope error for the last.
+    assert result["n"][3:].tolist() == [1, 2]
+    assert np.isnan(result["slope"][3]) and np.isnan(result["intercept"][3]) and np.isnan(result["r2"][3])
+    assert np.isclose(result["slope"][4], 1 / (temps[9] - temps[7]))
+    assert np.isnan(result["slope_se"][4])
+
+    empty = thermal.temperature_regression(temps, np.full((30, 1), np.nan))
+    assert empty["n"][0] == 0 and np.isnan(empty["slope"][0]) and np.isnan(empty["compensated"]).all()
+
+
+def test_report_is_sorted_by_r2():
+    temps, values = _data()
+    result = dict(thermal.temperature_regression(temps, values), keys=["a", "b", "c", "d", "e"])
+    rows = thermal.report_rows(result)
+    # Two points always lie on their line, one gives no r2.
+    assert [row["measurement"] for row in rows] == ["e", "a", "b", "c", "d"]
+    assert rows[0]["r2"] == 1 and np.isnan(rows[-1]["r2"])
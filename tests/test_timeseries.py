@@ -0,0 +1,67 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import timeseries
+
+
+def _series():
+    times = np.array(["2025-07-03", "2025-07-01", "NaT", "2025-07-02", "2025-07-02", "2025-07-05"], dtype="datetime64[s]")
+    return timeseries.TimeSeries(times, np.arange(10, 16))
+
+
+def test_rows_are_sorted_by_time_without_missing_times():
+    series = _series()
+    assert series.rows.tolist() == [11, 13, 14, 10, 15]
+    assert len(series) == 5
+
+
+def test_window_bounds_are_inclusive():
+    series = _series()
+    assert series.window("2025-07-02", "2025-07-03").tolist() == [13, 14, 10]
+    assert series.window("2025-07-02T00:00:01", "2025-07-02T23:59:59").tolist() == []
+    assert series.window(end="2025-07-01").tolist() == [11]
+    assert series.window(start="2025-07-05").tolist() == [15]
+    assert series.window("2025-07-06").tolist() == []
+    assert series.window().tolist() == [11, 13, 14, 10, 15]
+    assert series.last(datetime.timedelta(days=2)).tolist() == [10, 15]
+    assert timeseries.TimeSeries([]).last(datetime.timedelta(days=2)).tolist() == []
+
+
+def test_insert_keeps_time_order_after_equal_times():
+    series = _series()
+    series.insert("2025-07-02", 20)
+    series.insert("2025-06-30", 21)
+    series.insert("2025-07-09", 22)
+    assert series.rows.tolist() == [21, 11, 13, 14, 20, 10, 15, 22]
+    assert np.all(np.diff(series.times) >= np.timedelta64(0))
+
+
+def test_lttb_keeps_the_budget_and_the_endpoints():
+    x = np.arange(10000)
+    y = np.sin(x / 300) + np.random.default_rng(0).normal(0, 0.1, len(x))
+    y[[0, 4000]] = np.nan
+    picked = timeseries.lttb_indices(x, y, 500)
+    assert len(picked) == 500
+    assert (picked[0], picked[-1]) == (1, len(x) - 1)
+    assert np.all(np.diff(picked) > 0) and not np.isnan(y[picked]).any()
+    assert timeseries.lttb_indices(x[:100], y[:100], 500).tolist() == [i for i in range(100) if i != 0]
+
+
+def test_minmax_keeps_every_extreme():
+    y = np.random.default_rng(1).normal(0, 1, 9999)
+    y[1234], y[8765] = 50, -50
+    y[10] = np.nan
+    picked = timeseries.minmax_indices(y, 200)
+    assert len(picked) <= 200
+    assert {1234, 8765} <= set(picked.tolist())
+    assert np.nanmax(y) == y[picked].max() and np.nanmin(y) == y[picked].min()
+    assert np.all(np.diff(picked) > 0) and 10 not in picked
+
+
+def test_decimate_takes_datetimes_and_checks_the_method():
+    days = np.arange("2025-07-01", "2025-07-06", dtype="datetime64[D]")
+    assert timeseries.decimate(days, [0.0, 0.0, 5.0, 0.0, 0.0], 3, "lttb").tolist() == [0, 2, 4]
+    with pytest.raises(ValueError):
+        timeseries.decimate(np.arange(5), np.arange(5.0), method="mean")
@@ -0,0 +1,89 @@
+import csv
+import numpy as np
+import grading
+from typing import Dict, Any, List
+
+# Temperature the compensated values are referred to, in the board_temp unit (deg C).
+REFERENCE_TEMP = 25.0
+RESIDUAL_PERCENTILES = [10, 50, 90]
+
+
+def temperature_regression(temps: np.ndarray, values: np.ndarray, reference: float = REFERENCE_TEMP) -> Dict[str, Any]:
+    """Least-squares line value = intercept + slope * temp of every measurement at once.
+
+    temps is (chips,), values (chips, measurements) with NaN for missing values; chips
+    without a temperature are ignored. The fits are closed-form: masked means and centred
+    sums of squares and products are reduced over the chips for all columns together, so
+    there is no per-measurement loop. Returns per measurement
+      n           chips used
+      slope       value change per degree, intercept at 0 degrees
+      r2          share of the variance explained by temperature
+      slope_se    standard error of the slope (NaN for fewer than 3 chips)
+      sigma       ddof-0 sigma of the raw values
+      residual_sigma  ddof-0 sigma after removing the temperature trend
+    plus compensated, the (chips, measurements) values moved to the reference temperature
+    along their line, value - slope * (temp - reference).
+    """
+    temps = np.asarray(temps, dtype=float)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values) & ~np.isnan(temps)[:, None]
+    t = np.where(valid, temps[:, None], 0.0)
+    y = np.where(valid, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = valid.sum(axis=0).astype(float)
+        mean_t = t.sum(axis=0) / n
+        mean_y = y.sum(axis=0) / n
+        dt = np.where(valid, t - mean_t, 0.0)
+        dy = np.where(valid, y - mean_y, 0.0)
+        stt = (dt ** 2).sum(axis=0)
+        syy = (dy ** 2).sum(axis=0)
+        sty = (dt * dy).sum(axis=0)
+        slope = np.where(stt > 0, sty / stt, np.nan)
+        intercept = mean_y - slope * mean_t
+        sse = np.maximum(syy - slope * sty, 0.0)
+        r2 = np.where(syy > 0, 1 - sse / syy, np.nan)
+        slope_se = np.where(n > 2, np.sqrt(sse / (n - 2) / stt), np.nan)
+        sigma = np.sqrt(syy / n)
+        residual_sigma = np.sqrt(sse / n)
+        compensated = values - slope * (temps[:, None] - reference)
+    compensated[~valid] = np.nan
+    return {"n": n.astype(np.int64), "slope": slope, "intercept": intercept, "r2": r2, "slope_se": slope_se,
+            "sigma": sigma, "residual_sigma": residual_sigma, "compensated": compensated, "reference": reference}
+
+
+def cache_regression(measurements: Dict[str, Any], rows: np.ndarray, reference: float = REFERENCE_TEMP) -> Dict[str, Any]:
+    """temperature_regression of every graded measurement (grading_plan order) against the
+    runs' board_temp, for the given cache rows; keys holds the criteria keys."""
+    plan = grading.grading_plan()
+    values = grading.measurement_matrix(measurements, rows, plan["columns"])
+    temps = np.asarray(measurements["meta"]["board_temp"])[rows]
+    return dict(temperature_regression(temps, values, reference), keys=plan["criteria_keys"])
+
+
+def report_rows(result: Dict[str, Any], percentiles: List[float] = RESIDUAL_PERCENTILES) -> List[Dict[str, Any]]:
+    """One row per measurement with its fit and the percentiles of its compensated values,
+    sorted by r2 (most temperature-driven first)."""
+    compensated = result["compensated"]
+    has_values = ~np.isnan(compensated).all(axis=0)
+    quantiles = np.full((len(percentiles), compensated.shape[1]), np.nan)
+    if has_values.any():
+        quantiles[:, has_values] = np.nanpercentile(compensated[:, has_values], percentiles, axis=0)
+    rows = []
+    for m, key in enumerate(result["keys"]):
+        row = {"measurement": key, "n": int(result["n"][m])}
+        for name in ("slope", "slope_se", "intercept", "r2", "sigma", "residual_sigma"):
+            row[name] = float(result[name][m])
+        row.update({f"compensated_p{p:g}": float(quantiles[i, m]) for i, p in enumerate(percentiles)})
+        rows.append(row)
+    return sorted(rows, key=lambda row: -row["r2"] if row["r2"] == row["r2"] else np.inf)
+
+
+def write_report(path: str, result: Dict[str, Any], percentiles: List[float] = RESIDUAL_PERCENTILES):
+    """report_rows as a CSV file."""
+    rows = report_rows(result, percentiles)
+    fields = ["measurement", "n", "slope", "slope_se", "intercept", "r2", "sigma", "residual_sigma"] + \
+        [f"compensated_p{p:g}" for p in percentiles]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,116 @@
+import datetime
+import numpy as np
+from typing import Dict, Any
+
+# Points drawn per line at most; longer series are decimated to this budget.
+MAX_POINTS = 2000
+METHODS = ["minmax", "lttb"]
+
+
+class TimeSeries:
+    """Cache rows kept sorted by test_time, for time-window queries.
+
+    Windows are two binary searches (np.searchsorted) into the sorted times, so a query
+    costs O(log n) plus the rows it returns however long the archive is. Rows without a
+    test_time are left out.
+    """
+
+    def __init__(self, times, rows: np.ndarray = None):
+        times = np.asarray(times, dtype="datetime64[us]")
+        rows = np.arange(len(times)) if rows is None else np.asarray(rows)
+        keep = ~np.isnat(times)
+        order = np.argsort(times[keep], kind="stable")
+        self.times = times[keep][order]
+        self.rows = rows[keep][order]
+
+    @classmethod
+    def from_cache(cls, measurements: Dict[str, Any], rows: np.ndarray) -> "TimeSeries":
+        return cls(np.asarray(measurements["meta"]["test_time"])[rows], rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def insert(self, time, row: int):
+        """Add one row at its place in time order (after rows with the same time)."""
+        time = np.datetime64(time, "us")
+        position = np.searchsorted(self.times, time, side="right")
+        self.times = np.insert(self.times, position, time)
+        self.rows = np.insert(self.rows, position, row)
+
+    def window(self, start=None, end=None) -> np.ndarray:
+        """Rows tested in [start, end], oldest first; either bound may be left open."""
+        lo = 0 if start is None else np.searchsorted(self.times, np.datetime64(start, "us"), side="left")
+        hi = len(self.times) if end is None else np.searchsorted(self.times, np.datetime64(end, "us"), side="right")
+        return self.rows[lo:hi]
+
+    def last(self, span: datetime.timedelta) -> np.ndarray:
+        """Rows tested within span (e.g. timedelta(days=7)) of the newest row."""
+        if not len(self.times):
+            return self.rows
+        return self.window(self.times[-1] - np.timedelta64(span), None)
+
+
+def as_numbers(x) -> np.ndarray:
+    """x as floats; datetimes become microseconds since the epoch."""
+    x = np.asarray(x)
+    if x.dtype.kind == "O":
+        x = x.astype("datetime64[us]")
+    if x.dtype.kind == "M":
+        return x.astype("datetime64[us]").astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def minmax_indices(y, budget: int = MAX_POINTS) -> np.ndarray:
+    """Indices of the smallest and largest value of budget / 2 equal runs of points, in order.
+
+    Keeps every spike of the series while drawing at most budget points; computed on one
+    (runs, run length) matrix. NaN values are never picked.
+    """
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= budget:
+        return valid
+    size = int(np.ceil(len(valid) / max(budget // 2, 1)))
+    runs = int(np.ceil(len(valid) / size))
+    padded = np.full(runs * size, np.nan)
+    padded[:len(valid)] = y[valid]
+    padded = padded.reshape(runs, size)
+    offsets = np.arange(runs) * size
+    picked = np.unique(np.r_[offsets + np.nanargmin(padded, axis=1), offsets + np.nanargmax(padded, axis=1)])
+    return valid[picked]
+
+
+def lttb_indices(x, y, budget: int = MAX_POINTS) -> np.ndarray:
+    """Indices picked by Largest-Triangle-Three-Buckets (Steinarsson 2013), in order.
+
+    The first and last points are kept; every bucket in between contributes the point
+    spanning the largest triangle with the previous pick and the mean of the next bucket,
+    which keeps the visual shape of the line. NaN values are never picked.
+    """
+    x, y = as_numbers(x), np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y) & ~np.isnan(x))
+    if len(valid) <= budget or budget < 3:
+        return valid
+    xs, ys = x[valid], y[valid]
+    edges = np.linspace(1, len(valid) - 1, budget - 1).astype(np.int64)
+    picked = np.empty(budget, dtype=np.int64)
+    picked[0], picked[-1] = 0, len(valid) - 1
+    previous = 0
+    for b in range(budget - 2):
+        lo, hi = edges[b], edges[b + 1]
+        next_lo, next_hi = hi, edges[b + 2] if b + 2 < len(edges) else len(valid)
+        mean_x, mean_y = xs[next_lo:next_hi].mean(), ys[next_lo:next_hi].mean()
+        area = np.abs((xs[previous] - mean_x) * (ys[lo:hi] - ys[previous])
+                      - (xs[previous] - xs[lo:hi]) * (mean_y - ys[previous]))
+        previous = lo + int(np.argmax(area))
+        picked[b + 1] = previous
+    return valid[picked]
+
+
+def decimate(x, y, budget: int = MAX_POINTS, method: str = "minmax") -> np.ndarray:
+    """Indices of the points of (x, y) to draw with at most budget points, see METHODS."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown decimation {method}, expected one of {METHODS}")
+    if method == "lttb":
+        return lttb_indices(x, y, budget)
+    return minmax_indices(y, budget)
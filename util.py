@@ -1,21 +1,35 @@
 import re
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import json
+import os
+import schema
+import diagnostics
+import registry
+from typing import NamedTuple, Tuple, Dict
+
+UNIFORMITY_KEY = {"gain_uniformity", "peaking_time_uniformity", "baseline_uniformity"}
+C_KEY = {"hg_lg", "sum_x1", "sum_x3"}
+U_KEY = ["x1", "x3"]
+GAIN_RATIO_KEY = {0, 1, 2, 3}
 
 def extract_timestamp(file_path):
     match = re.search(r'_(\d{10})', file_path)
     return int(match.group(1)) if match else 0  # Use 0 if no timestamp found
 
+def extract_serial(file_path):
+    return registry.serial_from_path(file_path)  # None if no serial number found
+
 def is_within_criteria(value, key, criteria):
-    """Check if the value is within the specified criteria."""
-    if key in criteria:
-        min_val = criteria[key]["min"]
-        max_val = criteria[key]["max"]
-        return min_val <= value <= max_val
-    else:
-        print(f"{key} not in criteria")
-    return True
+    """Check if the value is within the specified criteria.
+
+    Keys without a rule accept every value; grading.load_tiers reports them once per run.
+    """
+    limits = criteria.get(key)
+    if limits is None:
+        return True
+    return limits["min"] <= value <= limits["max"]
 
 def process_results(data, key_suffix, params, impedance, criterium, param_stats):
         row = []
@@ -26,7 +40,7 @@ def process_results(data, key_suffix, params, impedance, criterium, param_stats)
             results = data[key_suffix]
             channel_list = results.get("channel_list", results.get("i2c_frequency_list", None))
             if not channel_list:
-                print(f"Warning: Neither 'channel_list' nor 'i2c_frequency_list' found in {key_suffix}")
+                diagnostics.record("missing_channel_list", key_suffix)
                 return
             i = 0
             failed = [{},{}]
@@ -60,28 +74,18 @@ def process_results(data, key_suffix, params, impedance, criterium, param_stats)
 
         return row, flag
 
-def get_grades(data, uniformity_key, gain_ratio_key, c_key, u_key, criterium, file_path, param_stats = defaultdict(lambda: {"A": 0, "B": 0, "F": 0}), row = []):
+def get_grades(data, uniformity_key, gain_ratio_key, c_key, u_key, criterium, file_path, param_stats = None, row = None):
+    if param_stats is None:
+        param_stats = defaultdict(lambda: {"A": 0, "B": 0, "F": 0})
+    if row is None:
+        row = []
     grade = ["F", "B"]
     flag = 1
     for impedance in ["25", "50"]:
-        keys_to_process = [
-            (f"results_noise_{impedance}_all_ch_HG", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"]),
-            (f"results_noise_{impedance}_all_ch_LG", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"]),
-            (f"results_noise_{impedance}_sum_x3", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"]),
-            (f"results_noise_{impedance}_sum_x1", ["baseline", "noise_rms_mv", "gain", "eni", "peaking_time"]),
-            (f"results_linearity_{impedance}_sum_x3", ["max_non_linearity", "fit_gain"]),
-            (f"results_linearity_{impedance}_sum_x1", ["max_non_linearity", "fit_gain", "peaking_time_std"]),
-            (f"results_linearity_{impedance}_all_ch_HG", ["max_non_linearity", "fit_gain"]),
-            (f"results_linearity_{impedance}_all_ch_LG", ["max_non_linearity", "fit_gain"]),
-            (f"results_channel_enable_{impedance}", ["gain_crude"]),
-            (f"results_baseline_{impedance}", ["residual", "slope_fit", "offset"]),
-            ("i2c_results", ["i2c_margin_list", "i2c_phase_list"]),
-        ]
+        keys_to_process = schema.channel_blocks(impedance)
             
         i = 0;
         for key, params in keys_to_process:
-            if impedance == "50" and i > 7:
-                continue
             row_data, row_flag = process_results(data, key, params, impedance, criterium, param_stats)
             if i < 2:
                 gain = "lg" if i == 1 else "hg"
@@ -143,26 +147,34 @@ def get_grades(data, uniformity_key, gain_ratio_key, c_key, u_key, criterium, fi
                             flag = min(flag, 0)
                             b = True
                     else:
-                        print(f"Warning({file_path}): gain_ratio_{impedance} index {idx} not in gain_ratio_key")
+                        diagnostics.record("gain_ratio_index", f"gain_ratio_{impedance}", file_path)
 
                 if not f and b:
                     param_stats[f"gain_ratio_{impedance}"]["B"] += 1
                 elif not f and not b:
                     param_stats[f"gain_ratio_{impedance}"]["A"] += 1
             else:
-                print(f"Warning({file_path}): gain_ratio_{impedance} is not a list")
+                diagnostics.record("gain_ratio_not_list", f"gain_ratio_{impedance}", file_path)
         else:
             param_stats[f"gain_ratio_{impedance}"]["F"] += 1
 
         if  impedance == "25":
             if "power_ldo" in data:
                 for ldo in data["power_ldo"]:
+                    if not isinstance(ldo, dict):
+                        continue
+                    # Only the rails and fields the cache extracts are graded, see schema.POWER_LDO_RAILS.
                     ldo_name = ldo.get("name")
-                    if not ldo_name:
+                    fields = schema.POWER_LDO_RAILS.get(ldo_name)
+                    if fields is None:
+                        diagnostics.record("unknown_record", f"power_ldo/{ldo_name}", file_path)
                         continue
                     for key, value in ldo.items():
                         if key == "name":
                             continue
+                        if key not in fields:
+                            diagnostics.record("unknown_record", f"power_ldo/{ldo_name}/{key}", file_path)
+                            continue
                         j = 0
                         for criteria in criterium:
                             if not is_within_criteria(value, f"{ldo_name}_{key}_{impedance}", criteria):
@@ -174,8 +186,11 @@ def get_grades(data, uniformity_key, gain_ratio_key, c_key, u_key, criterium, fi
                         if j == 2:
                             param_stats[f"{ldo_name}_{key}_{impedance}"]["A"] += 1
             else:
-                param_stats[f"{ldo_name}_{key}_{impedance}"]["F"] += 1
-                print(f"Warning({file_path}): power_ldo not found in data")
+                # Every rail counts as F, as grading.grade_cache counts a missing block.
+                for ldo_name, keys in schema.POWER_LDO_RAILS.items():
+                    for key in keys:
+                        param_stats[f"{ldo_name}_{key}_{impedance}"]["F"] += 1
+                diagnostics.record("missing_power_ldo", "", file_path)
 
         if f"results_sum_uniformity_{impedance}" in data:
             uniformity_results = data[f"results_sum_uniformity_{impedance}"]
@@ -192,3 +207,115 @@ def get_grades(data, uniformity_key, gain_ratio_key, c_key, u_key, criterium, fi
                 if j == 2:
                     param_stats[f"sum_{u_key[idx]}_uniformity_{impedance}"]["A"] += 1
     return flag
+
+class ChipGrade(NamedTuple):
+    """Immutable grading result of one results_all.json.
+
+    flag is -1 (F), 0 (B) or 1 (A) like get_grades, failures are the failing measurement
+    strings get_grades appends to its row and stats holds this chip's contribution to
+    param_stats as (stat key, A, B, F) tuples. test_time is None when the file has none,
+    in which case the file was not graded.
+    """
+    file_path: str
+    test_time: str
+    flag: int
+    failures: Tuple[str, ...]
+    stats: Tuple[Tuple[str, int, int, int], ...]
+
+    @property
+    def grade(self):
+        return "F" if self.flag == -1 else "B" if self.flag == 0 else "A"
+
+    def param_grades(self) -> Dict[str, str]:
+        """Grade of every parameter this chip was counted for."""
+        return {key: "F" if f else "B" if b else "A" for key, a, b, f in self.stats}
+
+
+class GradeStats:
+    """Mergeable accumulator of ChipGrade results (param_stats plus chip counts)."""
+
+    def __init__(self):
+        self.param_stats = defaultdict(lambda: {"A": 0, "B": 0, "F": 0})
+        self.counts = {"A": 0, "B": 0, "F": 0}
+
+    def add(self, chip_grade: ChipGrade):
+        self.counts[chip_grade.grade] += 1
+        for key, a, b, f in chip_grade.stats:
+            stats = self.param_stats[key]
+            stats["A"] += a
+            stats["B"] += b
+            stats["F"] += f
+        return self
+
+    def merge(self, other: "GradeStats"):
+        for grade, count in other.counts.items():
+            self.counts[grade] += count
+        for key, other_stats in other.param_stats.items():
+            stats = self.param_stats[key]
+            for grade, count in other_stats.items():
+                stats[grade] += count
+        return self
+
+
+def grade_document(data, criterium, file_path) -> ChipGrade:
+    """Grade one decoded document without touching any shared state."""
+    param_stats = defaultdict(lambda: {"A": 0, "B": 0, "F": 0})
+    row = []
+    flag = get_grades(data, UNIFORMITY_KEY, GAIN_RATIO_KEY, C_KEY, U_KEY, criterium, file_path, param_stats, row)
+    stats = tuple((key, s["A"], s["B"], s["F"]) for key, s in param_stats.items())
+    return ChipGrade(file_path, data.get("test_time"), flag, tuple(row), stats)
+
+
+def before_cutoff(test_time, cutoff):
+    """True if a "dd_mm_yy_..." test_time is before (month, day) of its own year."""
+    date_parts = test_time.split('_')[:3]  # ['13', '06', '25']
+    date_obj = datetime.strptime(f"{date_parts[0]}-{date_parts[1]}-{date_parts[2]}", "%d-%m-%y")  # dd-mm-yy
+    return date_obj < datetime(year=date_obj.year, month=cutoff[0], day=cutoff[1])
+
+
+def grade_file(file_path, criterium, cutoff=None):
+    """ChipGrade of one file, None if it cannot be decoded.
+
+    Files without test_time, or tested before the (month, day) cutoff, are returned
+    ungraded.
+    """
+    with open(file_path, 'r') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            diagnostics.record("json_error", e.msg, file_path)
+            return None
+    if "test_time" not in data or (cutoff is not None and before_cutoff(data["test_time"], cutoff)):
+        return ChipGrade(file_path, data.get("test_time"), 1, (), ())
+    return grade_document(data, criterium, file_path)
+
+
+_worker_criterium = None
+_worker_cutoff = None
+
+def _init_grade_worker(criterium, cutoff):
+    global _worker_criterium, _worker_cutoff
+    _worker_criterium = criterium
+    _worker_cutoff = cutoff
+
+def _grade_file_in_worker(file_path):
+    return diagnostics.collect(grade_file, file_path, _worker_criterium, _worker_cutoff)
+
+def grade_files(file_paths, criterium, workers=1, cutoff=None):
+    """Yield grade_file(path) for every path, in order.
+
+    With workers > 1 (None means one per core) the files are graded in a process pool;
+    each worker receives the criteria once, and only the compact ChipGrade results come
+    back, so memory stays bounded however many files are graded.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for file_path in file_paths:
+            yield grade_file(file_path, criterium, cutoff)
+        return
+    chunksize = max(1, len(file_paths) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_grade_worker, initargs=(criterium, cutoff)) as executor:
+        for chip_grade, events in executor.map(_grade_file_in_worker, file_paths, chunksize=chunksize):
+            diagnostics.merge(events)
+            yield chip_grade